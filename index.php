@@ -205,7 +205,7 @@ error_reporting(E_ALL);
     $nextlink = ($page < $pages) ? '<a href="?page=' . ($page + 1) . '" title="Next page" class="pagination-link">&rsaquo;</a> <a href="?page=' . $pages . '" title="Last page" class="pagination-link">&raquo;</a>' : '<span class="disabled">&rsaquo;</span> <span class="disabled">&raquo;</span>';
 
     // Prepare the paged query
-    $result = $mysqli->prepare("SELECT * FROM data ORDER BY id DESC LIMIT ? OFFSET ?");
+    $result = $mysqli->prepare("SELECT id, timestamp, temperature, pressure, humidity, rain, rain_rate, luminance, wind_speed, wind_direction, day, week, month, year FROM data ORDER BY id DESC LIMIT ? OFFSET ?");
     $result->bind_param('ii', $limit, $offset);
     $result->execute();
     if (!$result->execute()) {
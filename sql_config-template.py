@@ -8,3 +8,30 @@ config = {
 IP_addresses = {'index_URL': 'http://<Raspberry_Pi_IP_Address>/index.php'}
 
 sql_host = "0.0.0.0"
+
+# Store readings in "mysql" (using config above) or "sqlite" (a local file at sqlite_path, default ./weather.db)
+backend = "mysql"
+
+pool_size = 5  # Number of pooled MySQL connections kept open by each app
+
+use_rollups = True  # Maintain and read the hourly/daily/monthly rollup tables (create them with weather_rollup.py)
+
+# Readings are queued on disk (in spool_dir, default ./spool) and sent to the cloud function in the background.
+# Readings are sent one at a time, uncompressed. Only raise cloud_batch_size or set cloud_compress = True once your
+# cloud function accepts JSON arrays of readings and gzip-encoded bodies.
+cloud_batch_size = 1
+cloud_compress = False
+
+# Read closed months from the archive written by weather_archive.py (in archive_dir, default ./archive). Requires pyarrow
+use_archive = False
+
+# Keep every reading in a memory-mapped grid store (in grid_dir, default ./grid) fed by the server.
+# Build it with weather_grid.py --rebuild before enabling
+use_grid_store = False
+
+# Share query results and rendered figures between the server, client and dashboard in a local SQLite file
+# (shared_cache_path, default ./cache/shared_cache.db). Entries expire after shared_cache_ttl seconds and the
+# least recently used are evicted beyond shared_cache_max_mb. The server clears it when a new reading arrives
+use_shared_cache = True
+
+dashboard_plot_width = 1400  # Pixels, the dashboard's time series is downsampled to two points per pixel
@@ -0,0 +1,48 @@
+import os
+import sys
+import tempfile
+import types
+
+# The apps read their settings from sql_config.py, which is not in the repository. The tests run against a
+# throwaway SQLite database configured here, before any of the weather modules are imported
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+TEST_DIR = tempfile.mkdtemp(prefix="weather-tests-")
+
+sql_config = types.ModuleType("sql_config")
+sql_config.config = {"host": "localhost", "database": "weather", "user": "weather", "password": ""}
+sql_config.IP_addresses = {"index_URL": "http://127.0.0.1/index.php"}
+sql_config.sql_host = "127.0.0.1"
+sql_config.backend = "sqlite"
+sql_config.sqlite_path = os.path.join(TEST_DIR, "weather.db")
+sql_config.spool_dir = os.path.join(TEST_DIR, "spool")
+sql_config.grid_dir = os.path.join(TEST_DIR, "grid")
+sql_config.archive_dir = os.path.join(TEST_DIR, "archive")
+sql_config.use_shared_cache = False
+sql_config.use_rollups = False
+sys.modules.setdefault("sql_config", sql_config)
+
+from datetime import datetime, timedelta
+
+import weather_backend
+
+# Three days of readings every 15 minutes
+READINGS_START = datetime(2024, 1, 1)
+READINGS = [READINGS_START + timedelta(minutes=15 * i) for i in range(3 * 96)]
+
+def reading_row(timestamp, i):
+    # January, so the local time is UTC
+    return (timestamp, 5 + i % 10, 1000 + i % 20, 80.0, 0.1 * (i % 3), 0.0, 100.0 * (i % 5), 2.0 + i % 4, 45.0 * (i % 8),
+            timestamp.day, timestamp.isocalendar()[1], timestamp.month, timestamp.year, timestamp)
+
+def seed_database():
+    backend = weather_backend.SQLiteBackend(sql_config.sqlite_path)
+    columns = ("timestamp", "temperature", "pressure", "humidity", "rain", "rain_rate", "luminance", "wind_speed", "wind_direction", "day", "week", "month", "year", "utc_timestamp")
+    with backend.connection() as cnx:
+        with cnx.cursor() as cursor:
+            cursor.executemany(backend.insert_ignoring_duplicates("data", columns, "utc_timestamp"),
+                               [reading_row(timestamp, i) for i, timestamp in enumerate(READINGS)])
+        cnx.commit()
+
+seed_database()
@@ -0,0 +1,38 @@
+import pytest
+
+import weather_client
+import weather_helper
+from conftest import READINGS
+
+@pytest.fixture
+def seeded_aggregates(monkeypatch):
+    '''Answers the client's "year" aggregates from the seeded readings, and fails any raw fetch'''
+    calls = []
+    def get_aggregates(time_range, freq, aggregations):
+        calls.append((time_range, freq, aggregations))
+        return weather_helper.get_aggregates((READINGS[0], READINGS[-1]), freq, aggregations)
+    def get_data(*args, **kwargs):
+        raise AssertionError("the annual plots should not fetch raw readings")
+    monkeypatch.setattr(weather_client, "get_aggregates", get_aggregates)
+    monkeypatch.setattr(weather_client, "get_data", get_data)
+    return calls
+
+@pytest.mark.parametrize("route, aggregations", [
+    ("plot_annual_max_temperatures_png", {"temperature": ["max"]}),
+    ("plot_annual_min_temperatures_png", {"temperature": ["min"]}),
+    ("plot_annual_rain_days_png", {"rain": ["sum"]}),
+])
+def test_annual_plots_are_built_from_daily_aggregates(seeded_aggregates, route, aggregations):
+    response = getattr(weather_client, route).__wrapped__()
+    assert response.mimetype == "image/png"
+    assert response.get_data().startswith(b"\x89PNG")
+    assert seeded_aggregates == [("year", "day", aggregations)]
+
+def test_prerenderer_starts_once_on_the_first_request(monkeypatch):
+    started = []
+    monkeypatch.setattr(weather_client, "_prerenderer_started", False)
+    monkeypatch.setattr(weather_client, "start_prerenderer", lambda: started.append(True))
+    client = weather_client.app.test_client()
+    for _ in range(2):
+        client.get("/no-such-page")
+    assert started == [True]
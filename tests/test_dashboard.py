@@ -0,0 +1,24 @@
+import dash
+
+import weather_dashboard
+
+def layout_ids(component):
+    ids = set()
+    if getattr(component, "id", None) is not None:
+        ids.add(component.id)
+    children = getattr(component, "children", None)
+    if children is None or isinstance(children, str):
+        return ids
+    for child in children if isinstance(children, (list, tuple)) else [children]:
+        if isinstance(child, dash.development.base_component.Component):
+            ids |= layout_ids(child)
+    return ids
+
+def test_every_callback_id_is_in_the_layout():
+    ids = layout_ids(weather_dashboard.app.layout)
+    assert "range-store" in ids
+    for callback in weather_dashboard.app._callback_list:
+        dependencies = [output.split(".")[0] for output in callback["output"].strip(".").split("...")]
+        dependencies += [item["id"] for item in callback["inputs"] + callback["state"]]
+        missing = {dependency for dependency in dependencies if dependency.split("@")[0] not in ids}
+        assert not missing, f"{callback['output']} uses ids missing from the layout: {missing}"
@@ -0,0 +1,57 @@
+from datetime import datetime, timedelta
+
+from conftest import READINGS
+from weather_grid import GridStore, rebuild
+
+COLUMNS = ("temperature", "pressure")
+
+def readings(timestamps):
+    return {"temperature": [float(i) for i in range(len(timestamps))], "pressure": [1000.0] * len(timestamps)}
+
+def test_both_passes_of_the_repeated_autumn_hour_are_kept(tmp_path):
+    store = GridStore(str(tmp_path), COLUMNS)
+    # 00:00 to 01:45 UTC is 01:00 to 01:45 BST and then 01:00 to 01:45 GMT
+    timestamps = [datetime(2030, 10, 27) + timedelta(minutes=15 * i) for i in range(8)]
+    store.append(timestamps, readings(timestamps), complete=True)
+    assert store.info()["collisions"] == 0
+    assert store.info()["complete"]
+
+    arrays = store.slice(datetime(2030, 10, 27, 1, 0), datetime(2030, 10, 27, 1, 45))
+    local_times = [datetime(2030, 10, 27, 1, 0) + timedelta(minutes=15 * i) for i in range(4)] * 2
+    assert arrays["datetime"].astype(datetime).tolist() == local_times
+    assert arrays["temperature"].tolist() == list(range(8))
+
+def test_slice_returns_local_times(tmp_path):
+    store = GridStore(str(tmp_path), COLUMNS)
+    # Summer, local time is an hour ahead of UTC
+    timestamps = [datetime(2030, 7, 1, 11, 0, 3), datetime(2030, 7, 1, 11, 15, 2)]
+    store.append(timestamps, readings(timestamps))
+    arrays = store.slice(datetime(2030, 7, 1, 12, 0), datetime(2030, 7, 1, 12, 10))
+    assert arrays["datetime"].astype(datetime).tolist() == [datetime(2030, 7, 1, 12, 0, 3)]
+
+def test_readings_sharing_a_slot_mark_the_store_incomplete(tmp_path):
+    store = GridStore(str(tmp_path), COLUMNS)
+    timestamps = [datetime(2030, 1, 1, 12, 0)]
+    store.append(timestamps, readings(timestamps), complete=True)
+    # Appending the same reading again is not a collision
+    store.append(timestamps, readings(timestamps))
+    assert store.info()["complete"]
+
+    timestamps = [datetime(2030, 1, 1, 12, 5)]
+    store.append(timestamps, readings(timestamps))
+    assert store.info()["collisions"] == 1
+    assert not store.info()["complete"]
+
+def test_readings_sharing_a_slot_within_a_batch_are_collisions(tmp_path):
+    store = GridStore(str(tmp_path), COLUMNS)
+    timestamps = [datetime(2030, 1, 1, 12, 0), datetime(2030, 1, 1, 12, 4)]
+    store.append(timestamps, readings(timestamps), complete=True)
+    assert store.info()["collisions"] == 1
+    assert not store.info()["complete"]
+
+def test_rebuild_reads_the_utc_times_of_the_data_table(tmp_path):
+    info = rebuild(str(tmp_path / "grid"))
+    assert info["complete"]
+    arrays = GridStore(str(tmp_path / "grid"), COLUMNS).slice(READINGS[0], READINGS[95])
+    # The seeded readings are in January, so the local times equal the UTC times
+    assert arrays["datetime"].astype(datetime).tolist() == READINGS[:96]
@@ -0,0 +1,80 @@
+from datetime import datetime
+
+import numpy as np
+
+import pandas as pd
+
+import weather_helper
+from conftest import READINGS
+from weather_cache import SharedCache
+
+def test_get_data_accepts_timestamps():
+    start, end = pd.Timestamp(READINGS[0]), pd.Timestamp(READINGS[95])
+    data = weather_helper.get_data(start, end, use_cache=False)
+    assert len(data) == 96
+    assert data["datetime"].iloc[0] == READINGS[0]
+
+def test_range_query_binds_plain_datetimes():
+    _, params = weather_helper._build_range_query(start=pd.Timestamp(READINGS[0]), end=pd.Timestamp(READINGS[-1]))
+    assert all(type(param) is datetime for param in params)
+
+def test_get_aggregates_accepts_timestamps():
+    data = weather_helper.get_aggregates((pd.Timestamp(READINGS[0]), pd.Timestamp(READINGS[-1])), "day", {"temperature": ["count"]})
+    assert data[("temperature", "count")].tolist() == [96, 96, 96]
+
+def counting_reads(monkeypatch):
+    queries = []
+    read = weather_helper.read_data_from_db
+    def counted(query, params=None):
+        queries.append(query)
+        return read(query, params)
+    monkeypatch.setattr(weather_helper, "read_data_from_db", counted)
+    return queries
+
+def test_cache_keeps_ranges_older_than_its_window(monkeypatch):
+    cache = weather_helper.TimeSeriesCache(window_days=30)
+    assert cache.refresh()
+    queries = counting_reads(monkeypatch)
+
+    first = cache.slice(READINGS[96], READINGS[-1])
+    assert len(first) == 2 * 96
+    assert queries
+
+    # The older rows are now held, so this and any later start are answered from memory
+    queries.clear()
+    assert len(cache.slice(READINGS[96], READINGS[191])) == 96
+    assert len(cache.slice(READINGS[100], READINGS[-1])) == 2 * 96 - 4
+    assert cache.refresh(force=True)
+    assert len(cache.slice(READINGS[96], READINGS[-1])) == 2 * 96
+    assert not [query for query in queries if "id >" not in query]
+
+def test_cache_falls_through_for_ranges_too_long_to_keep():
+    cache = weather_helper.TimeSeriesCache(window_days=30, max_rows=100)
+    assert cache.slice(READINGS[0], READINGS[-1]) is None
+    assert cache.info()["rows"] == 0
+
+def test_cache_slice_is_a_copy():
+    cache = weather_helper.TimeSeriesCache(window_days=30)
+    data = cache.slice(READINGS[0], READINGS[-1])
+    data.loc[0, "temperature"] = -100.0
+    assert cache.slice(READINGS[0], READINGS[0])["temperature"].iloc[0] != -100.0
+
+def test_shared_cache_is_keyed_on_the_resolved_range(monkeypatch, tmp_path):
+    monkeypatch.setattr(weather_helper, "shared_cache", SharedCache(str(tmp_path / "cache.db")))
+    monkeypatch.setattr(weather_helper, "CACHE_ENABLED", False)
+    days = iter([(READINGS[0], READINGS[95]), (READINGS[96], READINGS[191])])
+    monkeypatch.setattr(weather_helper, "get_time_range", lambda arg, now=None: next(days))
+
+    # "today" the next day must not be served the previous day's readings
+    first = weather_helper.get_data("today")
+    second = weather_helper.get_data("today")
+    assert first["datetime"].iloc[0] == READINGS[0]
+    assert second["datetime"].iloc[0] == READINGS[96]
+
+def test_raw_columns_decode_to_typed_arrays():
+    temperature = weather_helper._decode_raw_column([b"12.5", None, bytearray(b"-3.25")], np.float32)
+    assert temperature.dtype == np.float32
+    np.testing.assert_array_equal(temperature, np.array([12.5, np.nan, -3.25], dtype=np.float32))
+    week = weather_helper._decode_raw_column([b"1", None, b"52"], np.int16)
+    assert week.dtype == np.int16 and week.tolist() == [1, 0, 52]
+    assert len(weather_helper._decode_raw_column([], np.float32)) == 0
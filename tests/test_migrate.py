@@ -0,0 +1,92 @@
+import sqlite3
+from datetime import datetime
+
+import pytest
+
+import weather_backend
+import weather_migrate
+
+def create_old_database(path, timestamps, unique=True):
+    '''A SQLite database created before the UTC key, with its index on the local timestamp unique unless unique is False'''
+    db = sqlite3.connect(path)
+    db.execute("CREATE TABLE data (id INTEGER PRIMARY KEY AUTOINCREMENT, timestamp DATETIME NOT NULL, temperature DOUBLE NOT NULL, "
+               "pressure DOUBLE NOT NULL, humidity DOUBLE NOT NULL, rain DOUBLE NOT NULL, rain_rate DOUBLE NOT NULL, luminance DOUBLE NOT NULL, "
+               "wind_speed DOUBLE NOT NULL, wind_direction DOUBLE NOT NULL, day INTEGER NOT NULL, week INTEGER NOT NULL, "
+               "month INTEGER NOT NULL, year INTEGER NOT NULL)")
+    if unique:
+        db.execute("CREATE UNIQUE INDEX unique_timestamp ON data (timestamp)")
+    for timestamp in timestamps:
+        db.execute("INSERT INTO data (timestamp, temperature, pressure, humidity, rain, rain_rate, luminance, wind_speed, wind_direction, day, week, month, year) "
+                   "VALUES (?, 10, 1000, 80, 0, 0, 0, 1, 0, 1, 1, 1, 2030)", (timestamp,))
+    db.commit()
+    db.close()
+    return weather_backend.SQLiteBackend(path)
+
+@pytest.fixture
+def old_database(monkeypatch, tmp_path):
+    # Winter (GMT), summer (BST) and the repeated hour when the clocks go back
+    backend = create_old_database(str(tmp_path / "old.db"), ("2030-01-15 12:00:00", "2030-07-15 12:00:00", "2030-10-27 01:30:00"))
+    monkeypatch.setattr(weather_migrate, "backend", backend)
+    return backend
+
+@pytest.fixture
+def unindexed_database(monkeypatch, tmp_path):
+    '''A table without an index on timestamp, holding both readings from the repeated hour and a reading stored twice'''
+    backend = create_old_database(str(tmp_path / "unindexed.db"),
+                                  ("2030-10-27 01:15:00", "2030-10-27 01:30:00", "2030-10-27 01:15:00", "2030-10-27 01:30:00",
+                                   "2030-11-01 09:00:00", "2030-11-01 09:00:00"), unique=False)
+    monkeypatch.setattr(weather_migrate, "backend", backend)
+    return backend
+
+def stored_utc_timestamps(backend):
+    with backend.connection() as cnx:
+        with cnx.cursor() as cursor:
+            cursor.execute("SELECT id, utc_timestamp FROM data ORDER BY id")
+            return cursor.fetchall()
+
+def test_utc_key_migration_fills_in_existing_readings(old_database):
+    with old_database.connection() as cnx:
+        with cnx.cursor() as cursor:
+            weather_migrate.add_unique_utc_timestamp(cursor)
+            cnx.commit()
+            cursor.execute("SELECT utc_timestamp FROM data ORDER BY id")
+            utc_timestamps = [utc_timestamp for (utc_timestamp,) in cursor.fetchall()]
+            indexes = old_database.index_names(cursor, "data")
+
+    assert utc_timestamps == [datetime(2030, 1, 15, 12), datetime(2030, 7, 15, 11), datetime(2030, 10, 27, 0, 30)]
+    assert {"unique_utc_timestamp", "timestamp_index"} <= indexes
+    assert "unique_timestamp" not in indexes
+
+def test_migrate_keeps_both_readings_from_the_repeated_hour(monkeypatch, tmp_path):
+    backend = create_old_database(str(tmp_path / "fold.db"), ("2030-10-27 01:30:00", "2030-10-27 01:30:00"), unique=False)
+    monkeypatch.setattr(weather_migrate, "backend", backend)
+    monkeypatch.setattr(weather_migrate, "get_connection", backend.connection)
+    weather_migrate.migrate()
+    assert stored_utc_timestamps(backend) == [(1, datetime(2030, 10, 27, 0, 30)), (2, datetime(2030, 10, 27, 1, 30))]
+    with backend.connection() as cnx:
+        with cnx.cursor() as cursor:
+            assert "unique_timestamp" not in backend.index_names(cursor, "data")
+
+def test_migrate_applies_every_migration(old_database, monkeypatch):
+    monkeypatch.setattr(weather_migrate, "get_connection", old_database.connection)
+    applied = weather_migrate.migrate(delete_duplicates=True)
+    assert [version for version, _ in applied] == [version for version, _, _ in weather_migrate.MIGRATIONS]
+    with old_database.connection() as cnx:
+        with cnx.cursor() as cursor:
+            assert {"timestamp_temperature", "unique_utc_timestamp"} <= old_database.index_names(cursor, "data")
+    assert weather_migrate.migrate() == []
+
+def test_utc_key_migration_keeps_both_readings_from_the_repeated_hour(unindexed_database):
+    with unindexed_database.connection() as cnx:
+        with cnx.cursor() as cursor:
+            with pytest.raises(RuntimeError):
+                weather_migrate.add_unique_utc_timestamp(cursor)
+            weather_migrate.add_unique_utc_timestamp(cursor, delete_duplicates=True)
+            cnx.commit()
+
+    # The first of each repeated local time is BST, the second GMT. Only the reading stored twice is deleted
+    assert stored_utc_timestamps(unindexed_database) == [
+        (1, datetime(2030, 10, 27, 0, 15)), (2, datetime(2030, 10, 27, 0, 30)),
+        (3, datetime(2030, 10, 27, 1, 15)), (4, datetime(2030, 10, 27, 1, 30)),
+        (5, datetime(2030, 11, 1, 9, 0)),
+    ]
@@ -0,0 +1,157 @@
+import gzip
+import json
+from datetime import datetime
+
+import pytest
+
+import weather_server
+from weather_spool import RejectedBatch
+
+class FakeResponse:
+    def __init__(self, status_code):
+        self.status_code = status_code
+        self.text = "rejected"
+
+@pytest.fixture
+def cloud_posts(monkeypatch):
+    posts = []
+    status = {"code": 200}
+    def post(url, data=None, headers=None, timeout=None):
+        posts.append((data, headers))
+        return FakeResponse(status["code"])
+    monkeypatch.setattr(weather_server.cloud_session, "post", post)
+    return posts, status
+
+def test_cloud_defaults_to_single_uncompressed_readings():
+    assert weather_server.CLOUD_BATCH_SIZE == 1
+    assert weather_server.CLOUD_COMPRESS is False
+
+def test_single_reading_rejection_is_buried(cloud_posts):
+    posts, status = cloud_posts
+    status["code"] = 400
+    with pytest.raises(RejectedBatch):
+        weather_server.send_to_cloud([{"temperature": 1}])
+    assert json.loads(posts[0][0]) == {"temperature": 1}
+
+def test_batch_rejection_is_retried_not_buried(cloud_posts):
+    posts, status = cloud_posts
+    status["code"] = 400
+    with pytest.raises(RuntimeError):
+        weather_server.send_to_cloud([{"temperature": 1}, {"temperature": 2}])
+
+def test_compressed_rejection_is_retried_not_buried(cloud_posts, monkeypatch):
+    posts, status = cloud_posts
+    status["code"] = 415
+    monkeypatch.setattr(weather_server, "CLOUD_COMPRESS", True)
+    with pytest.raises(RuntimeError) as raised:
+        weather_server.send_to_cloud([{"temperature": 1}])
+    assert not isinstance(raised.value, RejectedBatch)
+    assert json.loads(gzip.decompress(posts[0][0])) == {"temperature": 1}
+
+def fold_items():
+    # 00:30 and 01:30 UTC are both 01:30 in London on the day the clocks go back
+    readings = {"temperature": 9.5, "pressure": 1012.0, "humidity": 85.0, "rain": 0.0, "rain_per_second": 0.0,
+                "luminance": 0.0, "wind_speed": 1.5, "wind_direction": 90.0}
+    return [{"timestamp": timestamp, "readings": readings} for timestamp in ("2030-10-27T00:30:00Z", "2030-10-27T01:30:00Z")]
+
+def test_readings_in_the_repeated_autumn_hour_are_both_stored(monkeypatch):
+    queued = []
+    monkeypatch.setattr(weather_server, "notify_new_data", lambda: None)
+    monkeypatch.setattr(weather_server.cloud_outbox, "append_many", queued.extend)
+    items = fold_items()
+    rows, errors = weather_server._parse_batch(items)
+    assert not errors
+    assert rows[0][0] == rows[1][0] == datetime(2030, 10, 27, 1, 30)
+
+    entries = [weather_server._spool_entry(row, items[index]["timestamp"]) for index, row in rows.items()]
+    weather_server.flush_to_mysql(entries)
+    # Replaying the backlog stores nothing new
+    weather_server.flush_to_mysql(entries)
+
+    with weather_server.get_connection() as cnx:
+        with cnx.cursor() as cursor:
+            cursor.execute("SELECT utc_timestamp FROM data WHERE timestamp = %s ORDER BY utc_timestamp", (datetime(2030, 10, 27, 1, 30),))
+            stored = [utc_timestamp for (utc_timestamp,) in cursor.fetchall()]
+    assert stored == [datetime(2030, 10, 27, 0, 30), datetime(2030, 10, 27, 1, 30)]
+    assert len(queued) == 2
+
+def spool_entries(timestamps, **overrides):
+    readings = {"temperature": 9.5, "pressure": 1012.0, "humidity": 85.0, "rain": 0.0, "rain_per_second": 0.0,
+                "luminance": 0.0, "wind_speed": 1.5, "wind_direction": 90.0}
+    items = [{"timestamp": timestamp, "readings": dict(readings, **overrides)} for timestamp in timestamps]
+    rows, errors = weather_server._parse_batch(items)
+    assert not errors
+    return [weather_server._spool_entry(row, items[index]["timestamp"]) for index, row in rows.items()]
+
+def stored_count(utc_timestamps):
+    with weather_server.get_connection() as cnx:
+        with cnx.cursor() as cursor:
+            cursor.execute(f"SELECT COUNT(*) FROM data WHERE utc_timestamp IN ({', '.join(['%s'] * len(utc_timestamps))})", utc_timestamps)
+            return cursor.fetchone()[0]
+
+def test_non_finite_readings_are_rejected():
+    items = [{"timestamp": "2031-01-01T00:00:00Z", "readings": {field: 1.0 for field in weather_server.READING_FIELDS}}]
+    items[0]["readings"]["temperature"] = "inf"
+    rows, errors = weather_server._parse_batch(items)
+    assert not rows
+    assert errors == {0: "Invalid or missing readings: temperature"}
+
+def test_readings_are_queued_for_the_cloud_when_the_outbox_fails_once(monkeypatch):
+    queued = []
+    monkeypatch.setattr(weather_server, "notify_new_data", lambda: None)
+    def fail(payloads):
+        raise OSError("disk full")
+    monkeypatch.setattr(weather_server.cloud_outbox, "append_many", fail)
+    entries = spool_entries(["2031-02-01T00:00:00Z", "2031-02-01T00:15:00Z"])
+    with pytest.raises(OSError):
+        weather_server.flush_to_mysql(entries)
+    assert stored_count([datetime(2031, 2, 1, 0, 0), datetime(2031, 2, 1, 0, 15)]) == 0
+
+    # The retry stores the readings and queues them, rather than skipping them as duplicates
+    monkeypatch.setattr(weather_server.cloud_outbox, "append_many", queued.extend)
+    weather_server.flush_to_mysql(entries)
+    assert stored_count([datetime(2031, 2, 1, 0, 0), datetime(2031, 2, 1, 0, 15)]) == 2
+    assert [payload["timestamp"] for payload in queued] == ["2031-02-01T00:00:00Z", "2031-02-01T00:15:00Z"]
+
+def test_statement_errors_are_rejected_not_retried(monkeypatch):
+    # The rollup tables do not exist in the test database, so every insert fails
+    monkeypatch.setattr(weather_server, "USE_ROLLUPS", True)
+    monkeypatch.setattr(weather_server.cloud_outbox, "append_many", lambda payloads: None)
+    entries = spool_entries(["2031-03-01T00:00:00Z", "2031-03-01T00:15:00Z"])
+    with pytest.raises(RejectedBatch) as raised:
+        weather_server.flush_to_mysql(entries)
+    assert raised.value.indexes == [0, 1]
+    assert stored_count([datetime(2031, 3, 1, 0, 0), datetime(2031, 3, 1, 0, 15)]) == 0
+
+def test_background_threads_start_once_on_the_first_request(monkeypatch):
+    started = []
+    monkeypatch.setattr(weather_server, "_background_started", False)
+    monkeypatch.setattr(weather_server.ingest_flusher, "start", lambda: started.append("mysql-flusher"))
+    monkeypatch.setattr(weather_server.cloud_sender, "start", lambda: started.append("cloud-sender"))
+    client = weather_server.app.test_client()
+    client.get("/cache-stats")
+    client.get("/cache-stats")
+    assert started == ["mysql-flusher", "cloud-sender"]
+
+def test_get_data_pages_through_the_table_in_id_order():
+    client = weather_server.app.test_client()
+    ids = []
+    while True:
+        response = client.get(f"/get_data?columns=temperature&after_id={ids[-1] if ids else 0}&limit=100&format=ndjson")
+        assert response.status_code == 200
+        page = [json.loads(line)["id"] for line in response.get_data(as_text=True).splitlines()]
+        if not page:
+            break
+        assert len(page) <= 100
+        ids += page
+
+    with weather_server.get_connection() as cnx:
+        with cnx.cursor() as cursor:
+            cursor.execute("SELECT id FROM data ORDER BY id")
+            assert ids == [id for (id,) in cursor.fetchall()]
+    assert len(ids) > 100
+
+@pytest.mark.parametrize("time_range", ["latest", "first"])
+def test_get_data_rejects_pagination_of_a_single_reading(time_range):
+    response = weather_server.app.test_client().get(f"/get_data?time_range={time_range}&limit=10")
+    assert response.status_code == 400
@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+from scipy import stats
+
+from weather_stats import histogram_kde
+
+rng = np.random.default_rng(1)
+
+# Shapes of the measurements the dashboard plots: temperatures, a mix of calm and windy days, rain rates that
+# are mostly zero with a long tail, and a steady reading with a single spike
+DISTRIBUTIONS = {
+    "normal": rng.normal(12, 4, 5000),
+    "bimodal": np.concatenate([rng.normal(2, 0.5, 3000), rng.normal(9, 2, 2000)]),
+    "rain": np.where(rng.random(5000) < 0.8, 0.0, rng.exponential(0.5, 5000)),
+    "spike": np.append(np.full(999, 1013.0) + rng.normal(0, 0.05, 999), 1040.0),
+    "small": rng.normal(0, 1, 10),
+}
+
+@pytest.mark.parametrize("name", DISTRIBUTIONS)
+def test_density_matches_gaussian_kde(name):
+    values = DISTRIBUTIONS[name]
+    edges, histogram, x, density = histogram_kde(values)
+    expected = stats.gaussian_kde(values).evaluate(x)
+    assert np.max(np.abs(density - expected)) < 5e-3 * expected.max()
+
+@pytest.mark.parametrize("name", DISTRIBUTIONS)
+def test_histogram_matches_numpy(name):
+    values = DISTRIBUTIONS[name]
+    edges, histogram, x, density = histogram_kde(values, bins=30)
+    expected, expected_edges = np.histogram(values, bins=30, density=True)
+    np.testing.assert_allclose(edges, expected_edges)
+    np.testing.assert_allclose(histogram, expected, rtol=1e-9, atol=1e-12)
+
+def test_evaluation_points_span_the_values():
+    values = DISTRIBUTIONS["normal"]
+    edges, histogram, x, density = histogram_kde(values, points=200)
+    assert len(x) == len(density) == 200
+    assert x[0] == values.min() and x[-1] == pytest.approx(values.max())
+
+def test_nan_values_are_ignored():
+    values = DISTRIBUTIONS["normal"]
+    with_nan = np.concatenate([values, [np.nan] * 50])
+    for result, expected in zip(histogram_kde(with_nan), histogram_kde(values)):
+        np.testing.assert_array_equal(result, expected)
+
+def test_constant_values_have_no_density():
+    edges, histogram, x, density = histogram_kde(np.full(100, 3.0))
+    assert density is None
+    assert len(edges) == 31
+    # All the values are in one bin, which holds all the probability
+    assert histogram.sum() * (edges[1] - edges[0]) == pytest.approx(1.0)
+
+def test_empty_values_have_no_density():
+    edges, histogram, x, density = histogram_kde([])
+    assert density is None
+    assert not histogram.any()
@@ -0,0 +1,189 @@
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+import numpy as np
+import pyarrow as pa
+import pyarrow.feather as feather
+from weather_helper import (read_data_from_db, _build_range_query, _to_frame, ARCHIVE_DIR, ARCHIVE_MANIFEST,
+                            DATA_COLUMNS, MEASUREMENT_COLUMNS, CALENDAR_COLUMNS)
+
+# Measurements are archived at full precision so the archive matches MySQL exactly
+ARCHIVE_SCHEMA = pa.schema(
+    [("id", pa.int64()), ("datetime", pa.timestamp("s"))]
+    + [(column, pa.float64()) for column in MEASUREMENT_COLUMNS]
+    + [(column, pa.int64()) for column in CALENDAR_COLUMNS]
+)
+
+def month_bounds(year, month):
+    '''Returns the start of the month and the start of the following month.'''
+    start = datetime(year, month, 1)
+    end = datetime(year + 1, 1, 1) if month == 12 else datetime(year, month + 1, 1)
+    return start, end
+
+def read_month(year, month):
+    '''
+    Reads every reading in a month from MySQL, in id order.
+
+    Raises:
+        RuntimeError: If MySQL could not be queried, so an outage is never mistaken for an empty month.
+    '''
+    start, end = month_bounds(year, month)
+    query, params = _build_range_query(DATA_COLUMNS, start, end - timedelta(seconds=1), order_by="id")
+    rows = read_data_from_db(query, params)
+    if rows is None:
+        raise RuntimeError(f"Could not read {year}-{month:02d} from MySQL")
+    return _to_frame(rows)
+
+def frame_checksum(data):
+    '''
+    Returns a SHA-256 checksum of a month of readings that is independent of how the DataFrame was produced.
+    Each column is hashed in a fixed dtype (timestamps as whole seconds) in id order.
+    '''
+    data = data.sort_values("id")
+    digest = hashlib.sha256()
+    for column in DATA_COLUMNS:
+        if column == "datetime":
+            values = data[column].to_numpy(dtype="datetime64[s]").astype(np.int64)
+        elif column in MEASUREMENT_COLUMNS:
+            values = data[column].to_numpy(dtype=np.float64)
+        else:
+            values = data[column].to_numpy(dtype=np.int64)
+        digest.update(np.ascontiguousarray(values).tobytes())
+    return digest.hexdigest()
+
+def load_manifest():
+    path = os.path.join(ARCHIVE_DIR, ARCHIVE_MANIFEST)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+def save_manifest(partitions):
+    '''Writes the manifest atomically, so readers never see a partial file.'''
+    path = os.path.join(ARCHIVE_DIR, ARCHIVE_MANIFEST)
+    with open(path + ".tmp", "w") as f:
+        json.dump(partitions, f, indent=1, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+def export_month(year, month):
+    '''
+    Writes one month from MySQL to year=YYYY/month=MM/data.feather in the archive.
+
+    The file is an uncompressed Arrow IPC (Feather v2) file so readers can memory-map it without decoding.
+
+    Returns:
+        dict: The manifest entry for the partition: path, rows, checksum, month bounds and min/max statistics.
+    '''
+    start, end = month_bounds(year, month)
+    data = read_month(year, month)
+    relative_path = os.path.join(f"year={year}", f"month={month:02d}", "data.feather")
+    path = os.path.join(ARCHIVE_DIR, relative_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    table = pa.Table.from_pandas(data.assign(datetime=data["datetime"].astype("datetime64[s]")), schema=ARCHIVE_SCHEMA, preserve_index=False)
+    feather.write_feather(table, path + ".tmp", compression="uncompressed")
+    os.replace(path + ".tmp", path)
+
+    def bound(value):
+        return None if value is None or np.isnan(value) else float(value)
+
+    return {
+        "path": relative_path,
+        "rows": len(data),
+        "checksum": frame_checksum(data),
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        # An empty month gets its own bounds so it never matches a range
+        "min_datetime": (data["datetime"].min() if len(data) else end).isoformat(),
+        "max_datetime": (data["datetime"].max() if len(data) else start).isoformat(),
+        "stats": {column: [bound(data[column].min()), bound(data[column].max())] for column in MEASUREMENT_COLUMNS},
+        "archived": datetime.now().isoformat(timespec="seconds"),
+    }
+
+def closed_months(now=None):
+    '''Returns (year, month) for every month from the first reading up to, but not including, the current month.'''
+    now = now or datetime.now()
+    rows = read_data_from_db("SELECT MIN(timestamp) FROM data")
+    if not rows or rows[0][0] is None:
+        return []
+    year, month = rows[0][0].year, rows[0][0].month
+    months = []
+    while (year, month) < (now.year, now.month):
+        months.append((year, month))
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return months
+
+def export_closed_months(force=False, months=None):
+    '''
+    Archives every closed month that is not archived yet (or all of them with force=True).
+    If months is given (a list of "YYYY-MM" keys) only those months are archived, even if already archived.
+
+    The manifest is saved after each month, so an interrupted export can simply be run again.
+
+    Returns:
+        list: The "YYYY-MM" keys of the months written.
+    '''
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    partitions = load_manifest()
+    written = []
+    for year, month in closed_months():
+        key = f"{year}-{month:02d}"
+        if months is not None and key not in months:
+            continue
+        if key in partitions and not force and months is None:
+            continue
+        partitions[key] = export_month(year, month)
+        save_manifest(partitions)
+        written.append(key)
+        print(f"{key}: {partitions[key]['rows']} rows archived")
+    return written
+
+def check_archive():
+    '''
+    Compares the row count and checksum of every archived month with the same month in MySQL.
+
+    Returns:
+        list: (key, problem) for each partition that does not match, empty if the archive is consistent.
+    '''
+    problems = []
+    for key, partition in sorted(load_manifest().items()):
+        path = os.path.join(ARCHIVE_DIR, partition["path"])
+        if not os.path.exists(path):
+            problems.append((key, "file missing"))
+            continue
+        archived = feather.read_table(path, memory_map=True).to_pandas()
+        if len(archived) != partition["rows"] or frame_checksum(archived) != partition["checksum"]:
+            problems.append((key, "file does not match the manifest"))
+            continue
+        database = read_month(*map(int, key.split("-")))
+        if len(database) != partition["rows"]:
+            problems.append((key, f"{partition['rows']} rows archived, {len(database)} in MySQL"))
+        elif frame_checksum(database) != partition["checksum"]:
+            problems.append((key, "checksum differs from MySQL"))
+    return problems
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Archive closed months of the data table to memory-mappable Arrow files")
+    parser.add_argument('--export', action='store_true', help="archive every closed month that is not archived yet")
+    parser.add_argument('--force', action='store_true', help="with --export, re-archive months that are already archived")
+    parser.add_argument('--month', action='append', metavar='YYYY-MM', help="with --export, only (re-)archive this month, can be repeated")
+    parser.add_argument('--check', action='store_true', help="compare row counts and checksums between the archive and MySQL")
+    args = parser.parse_args()
+
+    if not (args.export or args.check):
+        parser.error("nothing to do, use --export and/or --check")
+
+    if args.export:
+        start = time.perf_counter()
+        written = export_closed_months(force=args.force, months=args.month)
+        print(f"{len(written)} months archived in {time.perf_counter() - start:.1f}s")
+    if args.check:
+        problems = check_archive()
+        for key, problem in problems:
+            print(f"{key}: {problem}")
+        print("Archive is consistent with MySQL" if not problems else f"{len(problems)} archived months do not match MySQL, re-export them with --export --month YYYY-MM")
+        sys.exit(1 if problems else 0)
@@ -0,0 +1,489 @@
+import argparse
+import os
+import re
+import sqlite3
+import statistics
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+import sql_config
+
+try:
+    import mysql.connector
+    from mysql.connector import pooling
+except ImportError:
+    mysql = None  # Only the SQLite backend is available without mysql-connector-python
+
+# Backend used by every app: "mysql" (default) or "sqlite". Can be overridden with backend in sql_config.py
+BACKEND = getattr(sql_config, 'backend', 'mysql')
+SQLITE_PATH = getattr(sql_config, 'sqlite_path', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'weather.db'))
+
+# Connection pool settings. pool_size can be overridden in sql_config.py
+POOL_NAME = "weather"
+POOL_SIZE = getattr(sql_config, 'pool_size', 5)
+POOL_TIMEOUT = 10  # Seconds to wait for a free connection before giving up
+RECONNECT_ATTEMPTS = 3
+
+class MySQLBackend:
+    '''
+    Stores the readings in MySQL, using a process-wide pool of connections.
+
+    Every backend provides the same surface: connection() and checkout_connection() for DB-API connections whose
+    cursors take %s placeholders, the exception classes to catch, and the few statements whose syntax differs
+    between databases (ignoring duplicate readings, upserting rollups and truncating timestamps to buckets).
+    '''
+    name = "mysql"
+
+    # SQL expressions that truncate a timestamp to the start of each bucket. Weeks start on Monday to match pandas' 'W' periods
+    AGGREGATE_BUCKETS = {
+        "hour": "TIMESTAMP(DATE({ts}), MAKETIME(HOUR({ts}), 0, 0))",
+        "day": "DATE({ts})",
+        "week": "DATE({ts}) - INTERVAL WEEKDAY({ts}) DAY",
+        "month": "MAKEDATE(YEAR({ts}), 1) + INTERVAL (MONTH({ts}) - 1) MONTH",
+        "year": "MAKEDATE(YEAR({ts}), 1)",
+    }
+
+    def __init__(self, config, pool_size=POOL_SIZE):
+        self.Error = mysql.connector.Error
+        # Errors worth retrying on a fresh connection, and errors that mean the database refused the statement
+        # itself (bad data, or a table that is missing) so retrying it will never succeed
+        self.RETRY_ERRORS = (mysql.connector.errors.OperationalError, mysql.connector.errors.InterfaceError)
+        self.REJECTED_ERRORS = (mysql.connector.errors.DataError, mysql.connector.errors.IntegrityError,
+                                mysql.connector.errors.ProgrammingError, mysql.connector.errors.NotSupportedError)
+        self.config = config
+        self.pool_size = pool_size
+        self._pool = None
+        self._pool_pid = None
+        self._pool_lock = threading.Lock()
+        self._known_connection_ids = set()
+        self._pool_stats = {
+            "checkouts": 0,
+            "handshakes": 0,
+            "handshake_seconds": 0.0,
+            "checkout_wait_seconds": 0.0,
+            "reconnects": 0,
+            "failures": 0,
+        }
+
+    def _get_pool(self):
+        '''
+        Returns the process-wide MySQL connection pool, creating it on first use.
+
+        The pool is recreated if the process has forked since it was created, as MySQL connections
+        cannot be shared between processes.
+        '''
+        with self._pool_lock:
+            if self._pool is None or self._pool_pid != os.getpid():
+                start = time.perf_counter()
+                self._pool = pooling.MySQLConnectionPool(pool_name=f"{POOL_NAME}-{os.getpid()}", pool_size=self.pool_size, pool_reset_session=True, **self.config)
+                self._pool_pid = os.getpid()
+                self._known_connection_ids.clear()
+                self._pool_stats["handshakes"] += self.pool_size
+                self._pool_stats["handshake_seconds"] += time.perf_counter() - start
+            return self._pool
+
+    def checkout_connection(self):
+        '''
+        Takes a healthy connection out of the pool, waiting up to POOL_TIMEOUT seconds if it is exhausted.
+        The pool pings each connection as it is checked out and reconnects it if the server has dropped it.
+        '''
+        pool = self._get_pool()
+        start = time.perf_counter()
+        attempts = 0
+        while True:
+            try:
+                cnx = pool.get_connection()
+                break
+            except mysql.connector.errors.PoolError:
+                # Pool exhausted, wait for another thread to return a connection
+                if time.perf_counter() - start > POOL_TIMEOUT:
+                    self._pool_stats["failures"] += 1
+                    raise
+                time.sleep(0.05)
+            except mysql.connector.Error:
+                # The pool could not reconnect a dropped connection
+                attempts += 1
+                if attempts >= RECONNECT_ATTEMPTS:
+                    self._pool_stats["failures"] += 1
+                    raise
+                time.sleep(0.5 * attempts)
+
+        elapsed = time.perf_counter() - start
+        with self._pool_lock:
+            self._pool_stats["checkouts"] += 1
+            self._pool_stats["checkout_wait_seconds"] += elapsed
+
+            # Once every pooled connection has been seen, a new connection id means the pool had to reconnect
+            connection_id = cnx.connection_id
+            if connection_id not in self._known_connection_ids:
+                if len(self._known_connection_ids) >= self.pool_size:
+                    self._pool_stats["reconnects"] += 1
+                    self._pool_stats["handshakes"] += 1
+                    self._pool_stats["handshake_seconds"] += elapsed
+                self._known_connection_ids.add(connection_id)
+        return cnx
+
+    @contextmanager
+    def connection(self):
+        '''Checks a connection out of the pool and returns it afterwards.'''
+        cnx = self.checkout_connection()
+        try:
+            yield cnx
+        finally:
+            try:
+                cnx.close()
+            except mysql.connector.Error as err:
+                # The connection died while in use. The pool will reconnect it on its next checkout
+                print(f"Connection could not be reset before returning it to the pool: {err}")
+
+    def pool_stats(self):
+        return dict(self._pool_stats, pool_size=self.pool_size)
+
+    def insert_ignoring_duplicates(self, table, columns, key):
+        '''Returns an INSERT for executemany() that skips rows whose key is already stored.'''
+        # Unlike INSERT IGNORE this doesn't silently clamp out-of-range values
+        return (f"INSERT INTO {table} ({', '.join(columns)}) "
+                f"VALUES ({', '.join(['%s'] * len(columns))}) "
+                f"ON DUPLICATE KEY UPDATE {key} = {key}")
+
+    def upsert_rollups(self, table, columns, stat_columns):
+        '''
+        Returns an INSERT for executemany() that adds (period, <column>_<stat>...) rows to a rollup table, combining
+        min/max and accumulating sum/count of a period that already has a row, with the mean recomputed.
+        '''
+        updates = []
+        for column in stat_columns:
+            # MySQL applies the assignments left to right, so mean sees the updated sum and count
+            updates += [
+                f"{column}_min = LEAST({column}_min, VALUES({column}_min))",
+                f"{column}_max = GREATEST({column}_max, VALUES({column}_max))",
+                f"{column}_sum = {column}_sum + VALUES({column}_sum)",
+                f"{column}_count = {column}_count + VALUES({column}_count)",
+                f"{column}_mean = {column}_sum / {column}_count",
+            ]
+        return (f"INSERT INTO {table} (period, {', '.join(columns)}) "
+                f"VALUES ({', '.join(['%s'] * (len(columns) + 1))}) "
+                f"ON DUPLICATE KEY UPDATE {', '.join(updates)}")
+
+    def index_names(self, cursor, table):
+        '''Returns the names of the indexes on a table.'''
+        cursor.execute("SELECT DISTINCT index_name FROM information_schema.statistics WHERE table_schema = DATABASE() AND table_name = %s", (table,))
+        return {name for (name,) in cursor.fetchall()}
+
+    def column_names(self, cursor, table):
+        '''Returns the names of the columns of a table, empty if the table does not exist.'''
+        cursor.execute("SELECT column_name FROM information_schema.columns WHERE table_schema = DATABASE() AND table_name = %s", (table,))
+        return {name for (name,) in cursor.fetchall()}
+
+    def drop_index(self, cursor, table, name):
+        cursor.execute(f"DROP INDEX {name} ON {table}")
+
+    def explain(self, cursor, query, params=None):
+        '''
+        Returns (plan, full_scan) for a query: a one line summary of MySQL's EXPLAIN (access type, index used,
+        estimated rows and extra notes) and whether it reads every row of a table.
+        '''
+        cursor.execute("EXPLAIN " + query, params)
+        names = [column[0] for column in cursor.description]
+        plans = [dict(zip(names, row)) for row in cursor.fetchall()]
+        summary = "; ".join(f"type={plan['type']} key={plan['key']} rows={plan['rows']}" + (f" ({plan['Extra']})" if plan.get('Extra') else "")
+                            for plan in plans)
+        return summary, any(plan["type"] == "ALL" for plan in plans)
+
+class _StandardDeviation:
+    '''STDDEV_SAMP aggregate for SQLite, which has no standard deviation function.'''
+    def __init__(self):
+        self.values = []
+
+    def step(self, value):
+        if value is not None:
+            self.values.append(value)
+
+    def finalize(self):
+        return statistics.stdev(self.values) if len(self.values) > 1 else None
+
+class _SQLiteCursor:
+    '''
+    Cursor that accepts the %s placeholders used throughout the code and can be used as a context manager.
+    Errors in the statement itself (e.g. a missing table) are raised as ProgrammingError, as MySQL does, rather
+    than the OperationalError SQLite shares with transient errors such as "database is locked".
+    '''
+    _placeholder = re.compile(r"%s")
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    @contextmanager
+    def _statement_errors(self):
+        try:
+            yield
+        except sqlite3.OperationalError as err:
+            if getattr(err, "sqlite_errorcode", None) == sqlite3.SQLITE_ERROR:
+                raise sqlite3.ProgrammingError(str(err)) from err
+            raise
+
+    def execute(self, query, params=None):
+        with self._statement_errors():
+            self._cursor.execute(self._placeholder.sub("?", query), params or ())
+        return self
+
+    def executemany(self, query, rows):
+        with self._statement_errors():
+            self._cursor.executemany(self._placeholder.sub("?", query), rows)
+        return self
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchmany(self, size=1):
+        return self._cursor.fetchmany(size)
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    def close(self):
+        self._cursor.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class _SQLiteConnection:
+    '''
+    Per-thread SQLite connection with the parts of the MySQL connection interface the apps use. close() leaves the
+    connection open for the thread's next checkout, rolling back anything that was not committed.
+    '''
+    def __init__(self, db):
+        self._db = db
+        self.connection_id = id(db)
+
+    def cursor(self, buffered=None, raw=False, **kwargs):
+        # SQLite cursors always step through the result lazily, and values are decoded with the declared types
+        return _SQLiteCursor(self._db.cursor())
+
+    def commit(self):
+        self._db.commit()
+
+    def rollback(self):
+        self._db.rollback()
+
+    def consume_results(self):
+        pass
+
+    def close(self):
+        if self._db.in_transaction:
+            self._db.rollback()
+
+class SQLiteBackend:
+    '''
+    Stores the readings in a local SQLite database, so the apps need no database server.
+
+    The database runs in WAL mode, so the server can write while the client and dashboard read, and each thread
+    keeps its own connection open for the life of the process. The tables and indexes are created on first use.
+
+    Parameters:
+        path (str): Path of the database file. The directory is created if it does not exist.
+    '''
+    name = "sqlite"
+    Error = sqlite3.Error
+    RETRY_ERRORS = (sqlite3.OperationalError,)  # e.g. "database is locked" after busy_timeout, see _SQLiteCursor
+    REJECTED_ERRORS = (sqlite3.IntegrityError, sqlite3.DataError, sqlite3.ProgrammingError, sqlite3.InterfaceError)
+
+    # Buckets are returned as "YYYY-MM-DD HH:MM:SS" text, the format timestamps are stored in
+    AGGREGATE_BUCKETS = {
+        "hour": "strftime('%Y-%m-%d %H:00:00', {ts})",
+        "day": "strftime('%Y-%m-%d 00:00:00', {ts})",
+        "week": "strftime('%Y-%m-%d 00:00:00', {ts}, '-' || ((CAST(strftime('%w', {ts}) AS INTEGER) + 6) % 7) || ' days')",
+        "month": "strftime('%Y-%m-01 00:00:00', {ts})",
+        "year": "strftime('%Y-01-01 00:00:00', {ts})",
+    }
+
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS data ("
+        "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+        "timestamp DATETIME NOT NULL, "
+        "temperature DOUBLE NOT NULL, "
+        "pressure DOUBLE NOT NULL, "
+        "humidity DOUBLE NOT NULL, "
+        "rain DOUBLE NOT NULL, "
+        "rain_rate DOUBLE NOT NULL, "
+        "luminance DOUBLE NOT NULL, "
+        "wind_speed DOUBLE NOT NULL, "
+        "wind_direction DOUBLE NOT NULL, "
+        "day INTEGER NOT NULL, "
+        "week INTEGER NOT NULL, "
+        "month INTEGER NOT NULL, "
+        "year INTEGER NOT NULL, "
+        "utc_timestamp DATETIME)",
+        # Range scans on the local time, which repeats in the hour the clocks go back
+        "CREATE INDEX IF NOT EXISTS timestamp_index ON data (timestamp)",
+        # Rejecting replayed readings, keyed on the UTC instant
+        "CREATE UNIQUE INDEX IF NOT EXISTS unique_utc_timestamp ON data (utc_timestamp)",
+    )
+
+    def __init__(self, path=SQLITE_PATH):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self._pool_stats = {"checkouts": 0, "handshakes": 0, "handshake_seconds": 0.0, "checkout_wait_seconds": 0.0, "reconnects": 0, "failures": 0}
+        with self.connection() as cnx:
+            with cnx.cursor() as cursor:
+                columns = self.column_names(cursor, "data")
+                if columns and "utc_timestamp" not in columns:
+                    # A database created before the UTC key, weather_migrate.py --migrate brings it up to date
+                    schema = self.SCHEMA[:1]
+                else:
+                    schema = self.SCHEMA
+                for statement in schema:
+                    cursor.execute(statement)
+            cnx.commit()
+
+    def _connect(self):
+        start = time.perf_counter()
+        db = sqlite3.connect(self.path, detect_types=sqlite3.PARSE_DECLTYPES, timeout=POOL_TIMEOUT, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")  # Durable at each checkpoint, the ingest spool covers a power cut
+        db.create_aggregate("STDDEV_SAMP", 1, _StandardDeviation)
+        with self._stats_lock:
+            self._pool_stats["handshakes"] += 1
+            self._pool_stats["handshake_seconds"] += time.perf_counter() - start
+        return _SQLiteConnection(db)
+
+    def checkout_connection(self):
+        '''Returns this thread's connection, opening it on first use (and again after a fork).'''
+        cnx = getattr(self._local, "cnx", None)
+        if cnx is None or self._local.pid != os.getpid():
+            cnx = self._local.cnx = self._connect()
+            self._local.pid = os.getpid()
+        with self._stats_lock:
+            self._pool_stats["checkouts"] += 1
+        return cnx
+
+    @contextmanager
+    def connection(self):
+        cnx = self.checkout_connection()
+        try:
+            yield cnx
+        finally:
+            cnx.close()
+
+    def pool_stats(self):
+        return dict(self._pool_stats, pool_size=0)
+
+    def insert_ignoring_duplicates(self, table, columns, key):
+        return (f"INSERT INTO {table} ({', '.join(columns)}) "
+                f"VALUES ({', '.join(['%s'] * len(columns))}) "
+                f"ON CONFLICT ({key}) DO NOTHING")
+
+    def upsert_rollups(self, table, columns, stat_columns):
+        updates = []
+        for column in stat_columns:
+            # SQLite evaluates every assignment against the old row, so mean is computed from the combined sum and count
+            updates += [
+                f"{column}_min = MIN({column}_min, excluded.{column}_min)",
+                f"{column}_max = MAX({column}_max, excluded.{column}_max)",
+                f"{column}_sum = {column}_sum + excluded.{column}_sum",
+                f"{column}_count = {column}_count + excluded.{column}_count",
+                f"{column}_mean = ({column}_sum + excluded.{column}_sum) / ({column}_count + excluded.{column}_count)",
+            ]
+        return (f"INSERT INTO {table} (period, {', '.join(columns)}) "
+                f"VALUES ({', '.join(['%s'] * (len(columns) + 1))}) "
+                f"ON CONFLICT (period) DO UPDATE SET {', '.join(updates)}")
+
+    def index_names(self, cursor, table):
+        cursor.execute(f"PRAGMA index_list({table})")
+        return {row[1] for row in cursor.fetchall()}
+
+    def column_names(self, cursor, table):
+        cursor.execute(f"PRAGMA table_info({table})")
+        return {row[1] for row in cursor.fetchall()}
+
+    def drop_index(self, cursor, table, name):
+        cursor.execute(f"DROP INDEX {name}")
+
+    def explain(self, cursor, query, params=None):
+        '''
+        Returns (plan, full_scan) from EXPLAIN QUERY PLAN. A SCAN of a table without an index is a full scan, unless
+        it is already in the order asked for (no temporary B-tree) and a LIMIT stops it early.
+        '''
+        cursor.execute("EXPLAIN QUERY PLAN " + query, params)
+        steps = [row[-1] for row in cursor.fetchall()]
+        stops_early = " LIMIT " in query and not any("TEMP B-TREE" in step for step in steps)
+        return "; ".join(steps), not stops_early and any(step.startswith("SCAN") and "INDEX" not in step for step in steps)
+
+# Timestamps are stored as "YYYY-MM-DD HH:MM:SS" text, which sorts and compares in time order
+sqlite3.register_adapter(datetime, lambda value: value.isoformat(sep=" ", timespec="seconds"))
+sqlite3.register_converter("DATETIME", lambda value: datetime.fromisoformat(value.decode()))
+
+def create_backend(name=BACKEND):
+    '''
+    Returns the storage backend configured in sql_config.py.
+
+    Raises:
+        ValueError: If the backend is not "mysql" or "sqlite".
+    '''
+    if name == "mysql":
+        return MySQLBackend(sql_config.config)
+    elif name == "sqlite":
+        return SQLiteBackend(SQLITE_PATH)
+    raise ValueError(f"Unknown backend: {name}")
+
+def copy_data(source, destination, chunk_rows=10000):
+    '''
+    Copies every reading from one backend's data table to another, e.g. from MySQL into a new SQLite database.
+    Readings already in the destination are skipped, so an interrupted copy can be run again. Both databases need
+    the utc_timestamp column, see weather_migrate.py.
+
+    Returns:
+        int: The number of rows read from the source.
+    '''
+    columns = ("timestamp", "temperature", "pressure", "humidity", "rain", "rain_rate", "luminance", "wind_speed", "wind_direction", "day", "week", "month", "year", "utc_timestamp")
+    insert = destination.insert_ignoring_duplicates("data", columns, "utc_timestamp")
+    copied = 0
+    with source.connection() as source_cnx, destination.connection() as destination_cnx:
+        with source_cnx.cursor(buffered=False) as reader, destination_cnx.cursor() as writer:
+            reader.execute(f"SELECT {', '.join(columns)} FROM data ORDER BY timestamp")
+            while True:
+                rows = reader.fetchmany(chunk_rows)
+                if not rows:
+                    break
+                writer.executemany(insert, rows)
+                destination_cnx.commit()
+                copied += len(rows)
+    return copied
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Create the SQLite database and copy readings between backends")
+    parser.add_argument('--create', action='store_true', help="create the SQLite database and its indexes (at sqlite_path)")
+    parser.add_argument('--copy-from-mysql', action='store_true', help="copy every reading from MySQL into the SQLite database")
+    args = parser.parse_args()
+
+    if not (args.create or args.copy_from_mysql):
+        parser.error("nothing to do, use --create and/or --copy-from-mysql")
+
+    sqlite_backend = SQLiteBackend(SQLITE_PATH)
+    print(f"SQLite database ready at {SQLITE_PATH}")
+    if args.copy_from_mysql:
+        start = time.perf_counter()
+        copied = copy_data(MySQLBackend(sql_config.config), sqlite_backend)
+        print(f"{copied} readings copied in {time.perf_counter() - start:.1f}s")
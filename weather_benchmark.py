@@ -0,0 +1,106 @@
+import argparse
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+from weather_helper import DATA_COLUMNS, READING_INTERVAL, _to_frame, _fill_arrays, _compact_frame
+
+READINGS_PER_YEAR = int(timedelta(days=365) / READING_INTERVAL)
+
+def synthetic_rows(years, seed=0):
+    '''
+    Generates synthetic rows for the data table, one every 15 minutes for the given number of years.
+
+    Returns:
+        list of tuples: Python values as returned by a normal cursor (int, datetime, float).
+    '''
+    count = int(years * READINGS_PER_YEAR)
+    rng = np.random.default_rng(seed)
+    i = np.arange(count)
+    timestamps = pd.date_range(datetime(2023, 6, 6), periods=count, freq=READING_INTERVAL)
+    measurements = zip(
+        np.round(10 + 8 * np.sin(i / 96) + rng.normal(size=count), 2).tolist(),
+        np.round(1000 + 20 * rng.random(count), 2).tolist(),
+        np.round(100 * rng.random(count), 1).tolist(),
+        np.round(rng.exponential(0.2, count), 2).tolist(),
+        np.round(rng.exponential(0.0001, count), 5).tolist(),
+        np.round(10000 * rng.random(count), 2).tolist(),
+        np.round(5 * rng.random(count), 1).tolist(),
+        rng.choice([0.0, 45.0, 90.0, 135.0, 180.0, 225.0, 270.0, 315.0], count).tolist(),
+    )
+    calendar = zip(timestamps.dayofyear.tolist(), timestamps.isocalendar().week.tolist(), timestamps.month.tolist(), timestamps.year.tolist())
+    return [(index + 1, timestamp) + values + days for index, timestamp, values, days in zip(i.tolist(), timestamps.to_pydatetime(), measurements, calendar)]
+
+def to_raw(rows):
+    '''Converts rows to the text bytes a raw cursor returns for the same values.'''
+    return [tuple(str(value).encode() for value in row) for row in rows]
+
+def chunked(rows, chunk_rows):
+    for i in range(0, len(rows), chunk_rows):
+        yield rows[i:i + chunk_rows]
+
+def measure(function):
+    '''Returns (result, seconds, peak MB allocated) for function(). It is run twice, as tracing allocations slows it down.'''
+    start = time.perf_counter()
+    function()
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    result = function()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak / 1e6
+
+def benchmark_synthetic(years_list, chunk_rows):
+    '''
+    Compares building a DataFrame from fetchall() rows (the get_data path) with decoding raw rows into typed
+    arrays (the get_arrays path). The cursor's own conversion of values into Python objects is not included
+    in the get_data timings, so the real difference is larger; use --live to measure against MySQL.
+    '''
+    print(f"{'years':>5} {'rows':>9} {'get_data s':>11} {'get_arrays s':>13} {'speedup':>8} {'get_data MB':>12} {'get_arrays MB':>14}")
+    for years in years_list:
+        # The rows returned by fetchall() are held in memory alongside the DataFrame built from them
+        rows, _, rows_mb = measure(lambda: synthetic_rows(years))
+        raw_rows = to_raw(rows)
+        frame, frame_seconds, frame_peak = measure(lambda: _to_frame(rows))
+        arrays, array_seconds, array_peak = measure(lambda: _fill_arrays(chunked(raw_rows, chunk_rows), DATA_COLUMNS, len(raw_rows)))
+        assert np.allclose(arrays["temperature"], frame["temperature"], atol=0.01)
+
+        print(f"{years:>5} {len(rows):>9} {frame_seconds:>11.3f} {array_seconds:>13.3f} {frame_seconds / array_seconds:>7.1f}x "
+              f"{frame_peak + rows_mb:>12.1f} {array_peak:>14.1f}")
+
+def frame_mb(data):
+    return data.memory_usage(deep=True).sum() / 1e6
+
+def memory_report(years_list):
+    '''Compares the size of the DataFrame returned by get_data with get_data(compact=True) for the same rows.'''
+    print(f"{'years':>5} {'rows':>9} {'get_data MB':>12} {'compact MB':>11} {'saving':>7}")
+    for years in years_list:
+        data = _to_frame(synthetic_rows(years))
+        full, compact = frame_mb(data), frame_mb(_compact_frame(data))
+        print(f"{years:>5} {len(data):>9} {full:>12.1f} {compact:>11.1f} {1 - compact / full:>6.0%}")
+
+def benchmark_live(time_range):
+    '''Times get_data and get_arrays end to end against the configured database (MySQL or SQLite).'''
+    from weather_helper import get_data, get_arrays
+    frame, frame_seconds, frame_peak = measure(lambda: get_data(time_range, use_cache=False))
+    arrays, array_seconds, array_peak = measure(lambda: get_arrays(time_range))
+    print(f"{time_range}: {len(frame)} rows")
+    print(f"  get_data:   {frame_seconds:.3f}s, peak {frame_peak:.1f} MB")
+    print(f"  get_arrays: {array_seconds:.3f}s, peak {array_peak:.1f} MB")
+    compact, compact_seconds, compact_peak = measure(lambda: get_data(time_range, compact=True))
+    print(f"  get_data(compact=True): {compact_seconds:.3f}s, peak {compact_peak:.1f} MB")
+    print(f"  DataFrame size: {frame_mb(frame):.1f} MB, compact {frame_mb(compact):.1f} MB")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark get_data against the columnar get_arrays fetch path and compact DataFrames")
+    parser.add_argument('--years', type=float, nargs='+', default=[1, 3, 10], help="synthetic history lengths to test")
+    parser.add_argument('--chunk-rows', type=int, default=10000, help="rows per fetchmany() chunk")
+    parser.add_argument('--live', metavar='TIME_RANGE', help="also benchmark against the configured database, e.g. --live all")
+    args = parser.parse_args()
+
+    benchmark_synthetic(args.years, args.chunk_rows)
+    print()
+    memory_report(args.years)
+    if args.live:
+        benchmark_live(args.live)
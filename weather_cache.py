@@ -0,0 +1,150 @@
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+import sql_config
+
+# Cache shared by the server, client and dashboard. Can be configured in sql_config.py
+SHARED_CACHE_PATH = getattr(sql_config, 'shared_cache_path', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache', 'shared_cache.db'))
+SHARED_CACHE_MAX_BYTES = getattr(sql_config, 'shared_cache_max_mb', 256) * 1024 * 1024
+SHARED_CACHE_TTL = getattr(sql_config, 'shared_cache_ttl', 300)  # Seconds, bounds how stale "last24h"-style ranges can get
+USED_RESOLUTION = 10  # Seconds between updates of an entry's last use, so most reads don't write
+
+class SharedCache:
+    '''
+    Cache of pickled values shared between processes through a SQLite database in WAL mode.
+
+    Entries expire after a TTL, and the least recently used entries are evicted once the values add up to more than
+    max_bytes. Everything in the cache is derived from the readings, so the ingest service calls invalidate() when a
+    new reading lands. That bumps a generation number which every entry is stamped with: entries from an earlier
+    generation are never returned, and a value computed from data read before the invalidation is not stored.
+
+    Parameters:
+        path (str): Path of the SQLite file. The directory is created if it does not exist.
+        max_bytes (int, optional): Total size of the pickled values to keep. Defaults to shared_cache_max_mb (256 MB).
+        ttl (float, optional): Default lifetime of an entry in seconds. Defaults to shared_cache_ttl (300).
+
+    Usage:
+        cache = SharedCache("cache/shared_cache.db")
+        generation = cache.generation()
+        data = cache.get(("get_data", "year"))
+        if data is None:
+            data = get_data("year")
+            cache.put(("get_data", "year"), data, generation=generation)
+    '''
+    def __init__(self, path, max_bytes=SHARED_CACHE_MAX_BYTES, ttl=SHARED_CACHE_TTL):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._db = None
+        self._pid = None
+        db = self._connection()
+        db.execute("CREATE TABLE IF NOT EXISTS cache ("
+                   "key TEXT PRIMARY KEY, "
+                   "value BLOB NOT NULL, "
+                   "size INTEGER NOT NULL, "
+                   "generation INTEGER NOT NULL, "
+                   "expires REAL NOT NULL, "
+                   "used REAL NOT NULL)")
+        db.execute("CREATE INDEX IF NOT EXISTS cache_used ON cache (used)")
+        db.execute("CREATE TABLE IF NOT EXISTS generation (id INTEGER PRIMARY KEY CHECK (id = 0), value INTEGER NOT NULL)")
+        db.execute("INSERT OR IGNORE INTO generation (id, value) VALUES (0, 0)")
+        db.commit()
+
+    def _connection(self):
+        '''Returns the database connection, reopening it in a forked child, which cannot share the parent's.'''
+        if self._pid != os.getpid():
+            self._db = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")  # Losing the cache in a power cut only costs recomputation
+            self._pid = os.getpid()
+        return self._db
+
+    def generation(self):
+        '''Returns the current generation. Read it before computing a value and pass it to put().'''
+        with self._lock:
+            return self._connection().execute("SELECT value FROM generation").fetchone()[0]
+
+    def get(self, key):
+        '''Returns the cached value for key (any value with a stable repr, e.g. a tuple), or None.'''
+        now = time.time()
+        with self._lock:
+            db = self._connection()
+            row = db.execute("SELECT cache.value, cache.used FROM cache, generation "
+                             "WHERE cache.key = ? AND cache.expires > ? AND cache.generation = generation.value",
+                             (repr(key), now)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            if now - row[1] > USED_RESOLUTION:
+                db.execute("UPDATE cache SET used = ? WHERE key = ?", (now, repr(key)))
+                db.commit()
+        try:
+            value = pickle.loads(row[0])
+        except Exception:
+            # Written by an incompatible version of a library, recompute it
+            self.misses += 1
+            return None
+        self.hits += 1
+        return value
+
+    def put(self, key, value, ttl=None, generation=None):
+        '''
+        Stores a value. If generation is given and the cache has been invalidated since, the value is discarded as
+        it was computed from out of date data. Values larger than a quarter of max_bytes are not stored.
+        '''
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(blob) > self.max_bytes // 4:
+            return
+        now = time.time()
+        with self._lock:
+            db = self._connection()
+            db.execute("INSERT OR REPLACE INTO cache (key, value, size, generation, expires, used) "
+                       "SELECT ?, ?, ?, value, ?, ? FROM generation WHERE ? IS NULL OR value = ?",
+                       (repr(key), blob, len(blob), now + (self.ttl if ttl is None else ttl), now, generation, generation))
+            self._evict(db, now)
+            db.commit()
+
+    def get_or_compute(self, key, compute, ttl=None):
+        '''Returns the cached value for key, calling compute() and caching its result on a miss.'''
+        value = self.get(key)
+        if value is None:
+            generation = self.generation()
+            value = compute()
+            self.put(key, value, ttl=ttl, generation=generation)
+        return value
+
+    def _evict(self, db, now):
+        db.execute("DELETE FROM cache WHERE expires <= ?", (now,))
+        excess = db.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0] - self.max_bytes
+        if excess <= 0:
+            return
+        evict = []
+        for key, size in db.execute("SELECT key, size FROM cache ORDER BY used"):
+            evict.append((key,))
+            excess -= size
+            if excess <= 0:
+                break
+        db.executemany("DELETE FROM cache WHERE key = ?", evict)
+
+    def invalidate(self):
+        '''Marks everything in the cache as out of date. Called by the ingest service when new readings are stored.'''
+        with self._lock:
+            db = self._connection()
+            db.execute("UPDATE generation SET value = value + 1")
+            db.execute("DELETE FROM cache WHERE generation < (SELECT value FROM generation)")
+            db.commit()
+
+    def stats(self):
+        '''Returns the number of entries, their total size, the generation and this process's hits and misses.'''
+        with self._lock:
+            db = self._connection()
+            entries, size = db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache").fetchone()
+            generation = db.execute("SELECT value FROM generation").fetchone()[0]
+        return {"entries": entries, "bytes": size, "max_bytes": self.max_bytes, "generation": generation, "hits": self.hits, "misses": self.misses}
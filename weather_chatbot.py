@@ -1,19 +1,20 @@
 import streamlit as st
-import mysql.connector
 from langchain_ollama import OllamaLLM
 from langchain.prompts import PromptTemplate
 import datetime
 import pandas as pd
 import traceback
 from sql_config import config
-from weather_helper import get_data, convert_wind_direction
+from weather_helper import get_data, iter_data, convert_wind_direction, checkout_connection, DatabaseError
+from weather_stats import summarize
 
 # Database connection is kept for potential future use
 def get_db_connection():
     try:
-        conn = mysql.connector.connect(**config)
+        # Connections come from the shared pool, call close() to return it
+        conn = checkout_connection()
         return conn
-    except mysql.connector.Error as err:
+    except DatabaseError as err:
         st.error(f"Database connection error: {err}")
         return None
 
@@ -54,6 +55,12 @@ def generate_python_query(llm, question):
     - get_data("yesterday") - gets data for the previous day
     - get_data("last7days") - gets data for the last 7 days
     - get_data(datetime1, datetime2) - gets data between two datetime objects
+    - Any of these can be given columns=[...] to fetch only the columns needed, e.g. get_data("yesterday", columns=["temperature"])
+
+    For questions about the whole history (e.g. "ever", "on record", "since records began") do NOT use get_data("all").
+    Use iter_data("all", columns=[...]), which yields the data in chunks, together with summarize(chunks, columns, quantiles):
+    - summarize(iter_data("all", columns=["temperature"]), ["temperature"]) returns a DataFrame indexed by column
+      with the columns count, sum, min, max, mean and p50 (the median)
     
     Given this information, generate Python code to answer the following question:
     
@@ -61,7 +68,7 @@ def generate_python_query(llm, question):
     
     IMPORTANT GUIDELINES:
     - Use ONLY the get_data() function to retrieve data - DO NOT write SQL queries
-    - get_data and datetime have already been defined and are available for use, do NOT try to redefine them
+    - get_data, iter_data, summarize and datetime have already been defined and are available for use, do NOT try to redefine them
     - there are 30 days in September, April, June, and November
     - there are 31 days in January, March, May, July, August, October, and December
     - February has 28 days, and 29 days in leap years
@@ -82,7 +89,7 @@ def generate_python_query(llm, question):
     1. For temperature questions:
        ```
        # What was the highest temperature yesterday?
-       data = get_data("yesterday")
+       data = get_data("yesterday", columns=["temperature"])
        max_temp = round(data['temperature'].max(), 1)
        result = max_temp  # Just the numerical value
        ```
@@ -161,6 +168,13 @@ def generate_python_query(llm, question):
         max_temp = round(data['temperature'].max(), 1)
         result = max_temp  # Just the numerical value
 
+    7. For questions about the whole history:
+
+        What is the highest wind speed ever recorded?
+
+        stats = summarize(iter_data("all", columns=["wind_speed"]), ["wind_speed"])
+        result = round(stats.loc['wind_speed', 'max'], 1)
+
     IMPORTANT: ONLY provide valid Python code. DO NOT include any explanations, apologies, markdown code blocks, or natural language. Your response MUST start immediately with Python code that assigns the final result to the variable 'result'.
 
     """
@@ -192,6 +206,8 @@ def execute_python_code(code):
         # Create a local namespace with the required imports and functions
         local_namespace = {
             'get_data': get_data,
+            'iter_data': iter_data,
+            'summarize': summarize,
             'convert_wind_direction': convert_wind_direction,
             'datetime': datetime,
             'pd': pd
@@ -1,6 +1,11 @@
 from flask import Flask, render_template, request, jsonify
-from weather_helper import get_data, convert_wind_direction
+from weather_helper import get_data, get_aggregates, get_time_range, get_data_version, convert_wind_direction, RENDER_SIGNAL_ADDRESS, shared_cache
 from datetime import datetime, timedelta
+from dateutil import tz
+from collections import OrderedDict
+from functools import wraps
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
 import pandas as pd
 import calplot
 import io
@@ -14,87 +19,94 @@ import matplotlib.dates as mdates
 import matplotlib.colors as mcolors
 from sql_config import IP_addresses
 import calendar
+import hashlib
+import threading
+import socket
+import os
 
 import logging
 logging.getLogger('matplotlib.font_manager').setLevel(logging.ERROR)
 
 app = Flask(__name__)
+DEBUG = True  # Runs the debug reloader when started with python weather_client.py
+
+SUMMARY_PERIODS = ("today", "yesterday", "week", "month", "year")
+
+def build_summary(now=None):
+    """
+    Builds every figure shown on the summary page from a single fetch of the data.
+
+    The rows covering the current year (plus any part of the current week or yesterday that falls in the
+    previous year) are fetched once, then today, yesterday, this week, this month and this year are
+    selected with boolean masks over the timestamps. Returns a dict whose keys are the variables used by
+    templates/current.html.
+    """
+    if now is None:
+        now = datetime.now()
+
+    ranges = {period: get_time_range(period, now) for period in SUMMARY_PERIODS}
+    data = get_data(min(start for start, _ in ranges.values()), max(end for _, end in ranges.values()))
+
+    timestamps = data['datetime'].values
+    periods = {}
+    for period, (start, end) in ranges.items():
+        mask = (timestamps >= pd.Timestamp(start).to_datetime64()) & (timestamps <= pd.Timestamp(end).to_datetime64())
+        periods[period] = data[mask]
+
+    if len(data):
+        latest_data = data.loc[[data['datetime'].idxmax()]].reset_index(drop=True)
+    else:
+        latest_data = get_data("latest")
+
+    summary = {
+        'time_of_latest_reading': datetime.strftime(latest_data['datetime'][0], '%A at %H:%M'),
+        'latest_temperature': round(latest_data['temperature'][0], 1),
+        'latest_humidity': round(latest_data['humidity'][0], 1),
+        'latest_rain_rate': round(latest_data['rain_rate'][0]*3600, 1),
+        'latest_pressure': round(latest_data['pressure'][0], 1),
+        'latest_luminance': round(latest_data['luminance'][0], 1),
+        'latest_wind_speed_mph': round(latest_data['wind_speed'][0]*2.23694, 1),
+        'latest_wind_direction': latest_data['wind_direction'][0],
+        'latest_wind_direction_converted': convert_wind_direction(latest_data['wind_direction'][0]),
+        'todays_average_pressure': round(periods['today']['pressure'].mean(), 1),
+    }
 
-@app.route("/")
-@app.route("/home")
-def home():
-    latest_data = get_data("latest")
-    todays_data = get_data("today")
-    yesterdays_data = get_data("yesterday")
-    week_data = get_data("week")
-    month_data = get_data("month") #can be month=n where n=1 to 12
-    year_data = get_data("year")
-
-    # Ensure the datetime column is in datetime format
-    year_data['datetime'] = pd.to_datetime(year_data['datetime'])
-
-    # Set the datetime column as the index
-    year_data.set_index('datetime', inplace=True)
+    # The same statistics are shown for each period, under the template's prefix for that period
+    prefixes = {'today': 'todays', 'yesterday': 'yesterdays', 'week': 'weekly', 'month': 'monthly', 'year': 'annual'}
+    for period, prefix in prefixes.items():
+        period_data = periods[period]
+        summary[f'{prefix}_max_temperature'] = round(period_data['temperature'].max(), 1)
+        summary[f'{prefix}_min_temperature'] = round(period_data['temperature'].min(), 1)
+        summary[f'{prefix}_total_rain'] = round(period_data['rain'].sum(), 1)
+        if period != 'today':
+            summary[f'{prefix}_max_rain_rate'] = round(period_data['rain_rate'].max()*3600, 1)
+            summary[f'{prefix}_max_wind_speed'] = round(period_data['wind_speed'].max()*2.23694, 1)
 
     # Code to plot table summarising annual data
-    total_rain = year_data.groupby(year_data.index.month)['rain'].sum()   
-    average_monthly_temperature = year_data.groupby(year_data.index.month)['temperature'].mean()
-    max_monthly_temperature = year_data.groupby(year_data.index.month)['temperature'].max()
-    min_monthly_temperature = year_data.groupby(year_data.index.month)['temperature'].min()
-
-    monthly_data = {
-        'Av. Temp (C)': average_monthly_temperature,
-        'Max Temp (C)': max_monthly_temperature,
-        'Min Temp (C)': min_monthly_temperature,
-        'Total Rain (mm)': total_rain,
-    }
-
-    df = pd.DataFrame(monthly_data)
+    year_data = periods['year'].set_index('datetime')
+    monthly = year_data.groupby(year_data.index.month)
+    df = pd.DataFrame({
+        'Av. Temp (C)': monthly['temperature'].mean(),
+        'Max Temp (C)': monthly['temperature'].max(),
+        'Min Temp (C)': monthly['temperature'].min(),
+        'Total Rain (mm)': monthly['rain'].sum(),
+    })
     df = df.round(1)
     df.index = [calendar.month_name[month] for month in df.index]
-    df_html = df.to_html(classes='w3-table-all w3-responsive', escape=False)
-
-    num_rainy_days = (year_data['rain'].resample('D').sum() > 1.0).sum()
-    total_days = len(year_data['rain'].resample('D').sum())
-
-    return render_template('current.html', 
-                           time_of_latest_reading=datetime.strftime(latest_data['datetime'][0],'%A at %H:%M'),
-                           latest_temperature=round(latest_data['temperature'][0],1),
-                           latest_humidity=round(latest_data['humidity'][0],1), 
-                           latest_rain_rate=round(latest_data['rain_rate'][0]*3600,1),
-                           latest_pressure=round(latest_data['pressure'][0],1),
-                           latest_luminance=round(latest_data['luminance'][0],1),
-                           latest_wind_speed_mph=round(latest_data['wind_speed'][0]*2.23694,1),
-                           latest_wind_direction=latest_data['wind_direction'][0],
-                           latest_wind_direction_converted=convert_wind_direction(latest_data['wind_direction'][0]),
-                           todays_max_temperature=round(todays_data['temperature'].max(),1),
-                           todays_min_temperature=round(todays_data['temperature'].min(),1),
-                           todays_total_rain=round(todays_data['rain'].sum(),1),
-                           todays_average_pressure=round(todays_data['pressure'].mean(),1),
-                           yesterdays_max_temperature=round(yesterdays_data['temperature'].max(),1),
-                           yesterdays_min_temperature=round(yesterdays_data['temperature'].min(),1),
-                           yesterdays_total_rain=round(yesterdays_data['rain'].sum(),1),
-                           yesterdays_max_rain_rate=round(yesterdays_data['rain_rate'].max()*3600,1),
-                           yesterdays_max_wind_speed=round(yesterdays_data['wind_speed'].max()*2.23694,1),
-                           weekly_max_temperature=round(week_data['temperature'].max(),1),
-                           weekly_min_temperature=round(week_data['temperature'].min(),1),
-                           weekly_total_rain=round(week_data['rain'].sum(),1),
-                           weekly_max_rain_rate=round(week_data['rain_rate'].max()*3600,1),
-                           weekly_max_wind_speed=round(week_data['wind_speed'].max()*2.23694,1),
-                           monthly_max_temperature=round(month_data['temperature'].max(),1),
-                           monthly_min_temperature=round(month_data['temperature'].min(),1),
-                           monthly_total_rain=round(month_data['rain'].sum(),1),
-                           monthly_max_rain_rate=round(month_data['rain_rate'].max()*3600,1),
-                           monthly_max_wind_speed=round(month_data['wind_speed'].max()*2.23694,1),
-                           annual_max_temperature=round(year_data['temperature'].max(),1),
-                           annual_min_temperature=round(year_data['temperature'].min(),1),
-                           annual_total_rain=round(year_data['rain'].sum(),1),
-                           annual_max_rain_rate=round(year_data['rain_rate'].max()*3600,1),
-                           annual_max_wind_speed=round(year_data['wind_speed'].max()*2.23694,1),
-                           num_rainy_days=num_rainy_days,
-                           total_days=total_days,
-                           rainy_percent = round(100*(num_rainy_days/total_days)),
-                           table=df_html,
+    summary['table'] = df.to_html(classes='w3-table-all w3-responsive', escape=False)
+
+    daily_rain = year_data['rain'].resample('D').sum()
+    summary['num_rainy_days'] = (daily_rain > 1.0).sum()
+    summary['total_days'] = len(daily_rain)
+    summary['rainy_percent'] = round(100*(summary['num_rainy_days']/summary['total_days']))
+
+    return summary
+
+@app.route("/")
+@app.route("/home")
+def home():
+    return render_template('current.html',
+                           **build_summary(),
                            index_URL=IP_addresses.get('index_URL', '192.168.0.1'),
                            dashboard_URL=IP_addresses.get('dashboard_URL', 'http://192.168.0.1')
                           )
@@ -181,18 +193,108 @@ def plot_24h_bar_greyed(xs, ys, title, ylabel):
 
     return fig
 
+RENDER_CACHE_MAX_BYTES = 32 * 1024 * 1024
+
+class RenderCache:
+    """
+    Size-bounded LRU cache of rendered images, keyed on whatever identifies the render (route, query, data version).
+    """
+    def __init__(self, max_bytes=RENDER_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._items.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        self.put_many({key: value})
+
+    def put_many(self, items):
+        """Adds several renders at once, so readers never see a partially updated set"""
+        with self._lock:
+            for key, value in items.items():
+                if key in self._items:
+                    self.bytes -= len(self._items.pop(key))
+                self._items[key] = value
+                self.bytes += len(value)
+            while self.bytes > self.max_bytes and len(self._items) > 1:
+                _, evicted = self._items.popitem(last=False)
+                self.bytes -= len(evicted)
+
+render_cache = RenderCache()
+RENDER_SHARED_TTL = 3600  # Render keys include the hour, so they are never needed for longer
+
+def render_key(path, query_string, version_id, now=None):
+    """Returns the render_cache key for a plot route at the given data version"""
+    if now is None:
+        now = datetime.now()
+    return (path, query_string, version_id, now.strftime('%Y-%m-%d %H'))
+
+def cached_png(route_function):
+    """
+    Decorator for the plot routes that serves the PNG from render_cache while the data is unchanged.
+
+    The cache key is the route, its query string, the id of the latest reading and the current hour (the
+    24h and daily plots shift with the clock even when no new data arrives). The key's hash is sent as
+    an ETag, so browsers revalidating with If-None-Match get a 304 without any rendering or data scan.
+    Renders missing from render_cache are looked up in the shared cache, so other worker processes reuse them.
+    """
+    @wraps(route_function)
+    def wrapper(*args, **kwargs):
+        version = get_data_version()
+        if version is None:
+            return route_function(*args, **kwargs)
+
+        key = render_key(request.path, request.query_string, version[0])
+        etag = hashlib.sha1(repr(key).encode()).hexdigest()
+        last_modified = version[1].replace(tzinfo=tz.gettz('Europe/London'))
+
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            png = render_cache.get(key)
+            if png is None and shared_cache is not None:
+                png = shared_cache.get(("png",) + key)
+                if png is not None:
+                    render_cache.put(key, png)
+            if png is None:
+                png = route_function(*args, **kwargs).get_data()
+                render_cache.put(key, png)
+                if shared_cache is not None:
+                    shared_cache.put(("png",) + key, png, ttl=RENDER_SHARED_TTL)
+            response = Response(png, mimetype='image/png')
+
+        response.set_etag(etag)
+        response.last_modified = last_modified
+        response.cache_control.no_cache = True  # Always revalidate, the ETag makes that cheap
+        return response
+    return wrapper
+
 # these functions plot each graph. One is needed per graph
 @app.route('/plot_temperature.png')
+@cached_png
 def plot_temperature_png():
-    data = get_data("last7days")
+    data = get_data("last7days", columns=["datetime", "temperature"])
     fig = plot_data(data['datetime'], data['temperature'].rolling(window=5).mean(), 'Temperature', 'Temperature (C)')
     output = io.BytesIO()
     FigureCanvas(fig).print_png(output)
     return Response(output.getvalue(), mimetype='image/png')
 
 @app.route('/plot_humidity.png')
+@cached_png
 def plot_humidity_png():
-    data = get_data("last7days")
+    data = get_data("last7days", columns=["datetime", "humidity"])
     fig = plot_data(data['datetime'], data['humidity'].rolling(window=5).mean(), 'Humidity', 'Humidity (%)')
     fig.gca().set_ylim(0,100)
     output = io.BytesIO()
@@ -200,16 +302,18 @@ def plot_humidity_png():
     return Response(output.getvalue(), mimetype='image/png')
 
 @app.route('/plot_pressure.png')
+@cached_png
 def plot_pressure_png():
-    data = get_data("last7days")
+    data = get_data("last7days", columns=["datetime", "pressure"])
     fig = plot_data(data['datetime'], data['pressure'], 'Pressure', 'Pressure (hPa)')
     output = io.BytesIO()
     FigureCanvas(fig).print_png(output)
     return Response(output.getvalue(), mimetype='image/png')
 
 @app.route('/plot_daily_rainfall.png')
+@cached_png
 def plot_daily_rainfall_png():
-    todays_data = get_data("today")
+    todays_data = get_data("today", columns=["datetime", "rain"])
     rain_data = todays_data.groupby([todays_data['datetime'].dt.hour])['rain'].sum()
     fig = plot_daily_bar(rain_data.index, rain_data, "Rainfall", "Rainfall (mm)")
     output = io.BytesIO()
@@ -217,8 +321,9 @@ def plot_daily_rainfall_png():
     return Response(output.getvalue(), mimetype='image/png')
 
 @app.route('/plot_24h_rainfall.png')
+@cached_png
 def plot_24h_rainfall_png():
-    last24h_data = get_data("last24h")  # Fetch data for the last 24 hours
+    last24h_data = get_data("last24h", columns=["datetime", "rain"])  # Fetch data for the last 24 hours
     rain_data = last24h_data.groupby([last24h_data['datetime'].dt.hour])['rain'].sum()   
     fig = plot_24h_bar_greyed(list(rain_data.index), list(rain_data.values), "Hourly Rainfall", "Rainfall (mm)")
     output = io.BytesIO()
@@ -226,8 +331,9 @@ def plot_24h_rainfall_png():
     return Response(output.getvalue(), mimetype='image/png')
 
 @app.route('/plot_rain.png')
+@cached_png
 def plot_rain_png():
-    last_7_days_data = get_data("last7days")
+    last_7_days_data = get_data("last7days", columns=["datetime", "rain"])
     rain_data = last_7_days_data[['datetime','rain']].groupby(last_7_days_data['datetime'].dt.date)['rain'].sum()
     rain_data.index = pd.to_datetime(rain_data.index, format='%Y-%m-%d')
     fig = plot_bar(rain_data.index, rain_data, "Rainfall", "Rainfall (mm)")
@@ -236,17 +342,18 @@ def plot_rain_png():
     return Response(output.getvalue(), mimetype='image/png')
 
 @app.route('/plot_annual_max_temperatures.png')
+@cached_png
 def plot_annual_max_temperatures_png():
-    data = get_data("year")
-    data.set_index('datetime', inplace = True)
-    fig = plot_annual(data, 'max', 'coolwarm')
+    # One row per day is aggregated in the database (or read from the daily rollups) rather than every reading
+    data = get_aggregates("year", "day", {"temperature": ["max"]})
+    fig = plot_annual(data[("temperature", "max")], 'max', 'coolwarm')
     output = io.BytesIO()
     FigureCanvas(fig).print_png(output)
     return Response(output.getvalue(), mimetype='image/png')
 
 # may need to change to calplot.yearplot to just show one year 
 def plot_annual(data, how, cmap):
-    fig, axis = calplot.calplot(data = data['temperature'], how = how,  figsize=(13,2.5) , cmap = cmap, linecolor='#ffffff', yearlabels=True, colorbar=False, textformat='{:.0f}')#,suptitle = title)
+    fig, axis = calplot.calplot(data = data, how = how,  figsize=(13,2.5) , cmap = cmap, linecolor='#ffffff', yearlabels=True, colorbar=False, textformat='{:.0f}')#,suptitle = title)
     fig.set_facecolor('#ffffff')
     for ax in axis.flatten():
         ax.set_facecolor('#ffffff')
@@ -254,12 +361,12 @@ def plot_annual(data, how, cmap):
     return fig
 
 @app.route('/plot_annual_rain_days.png')
+@cached_png
 def plot_annual_rain_days_png():
-    data = get_data("year")
-    data.set_index('datetime', inplace=True)
+    daily_rain = get_aggregates("year", "day", {"rain": ["sum"]})[("rain", "sum")]
 
-    # Aggregate rain data to get binary values: 1 if rain occurred, 0 otherwise
-    rain_data = data['rain'].resample('D').sum() > 1  # True if more than 1mm rain occurred on that day
+    # Aggregate rain data to get binary values: 1 if rain occurred, 0 otherwise. Days without readings count as dry
+    rain_data = daily_rain.asfreq('D', fill_value=0) > 1  # True if more than 1mm rain occurred on that day
     rain_data = rain_data.astype(int)  # Convert boolean to int (1 for True, 0 for False)
 
     # Create a custom colormap for binary data (0: transparent, 1: black)
@@ -277,13 +384,107 @@ def plot_annual_rain_days_png():
     return Response(output.getvalue(), mimetype='image/png')
 
 @app.route('/plot_annual_min_temperatures.png')
+@cached_png
 def plot_annual_min_temperatures_png():
-    data = get_data("year")
-    data.set_index('datetime', inplace = True)
-    fig = plot_annual(data, 'min', 'Blues')
+    data = get_aggregates("year", "day", {"temperature": ["min"]})
+    fig = plot_annual(data[("temperature", "min")], 'min', 'Blues')
     output = io.BytesIO()
     FigureCanvas(fig).print_png(output)
     return Response(output.getvalue(), mimetype='image/png')
 
+PRERENDER_WORKERS = 2
+PRERENDER_DEBOUNCE_SECONDS = 2  # Readings replayed in a burst only trigger one render
+
+def _render_route(path):
+    """Renders a plot route without the cache. Runs in the pre-render worker processes"""
+    endpoint, _ = app.url_map.bind('').match(path)
+    return app.view_functions[endpoint].__wrapped__().get_data()
+
+def prerender_plots(executor):
+    """
+    Renders every plot route for the current data version in the worker pool and swaps the results into
+    render_cache in one step. Returns the number of images rendered.
+    """
+    version = get_data_version()
+    if version is None:
+        return 0
+    now = datetime.now()
+    paths = [rule.rule for rule in app.url_map.iter_rules() if rule.rule.endswith('.png')]
+    rendered = dict(zip(paths, executor.map(_render_route, paths)))
+    renders = {render_key(path, b'', version[0], now): png for path, png in rendered.items()}
+    render_cache.put_many(renders)
+    if shared_cache is not None:
+        for key, png in renders.items():
+            shared_cache.put(("png",) + key, png, ttl=RENDER_SHARED_TTL)
+    return len(rendered)
+
+def _prerender_loop(sock, executor):
+    while True:
+        try:
+            start = datetime.now()
+            count = prerender_plots(executor)
+            logging.info(f"Pre-rendered {count} plots in {(datetime.now() - start).total_seconds():.1f}s")
+        except Exception as e:
+            logging.error(f"Pre-rendering failed: {e}")
+
+        # Wait for the server to signal a new reading, or for the top of the hour when the
+        # clock-dependent plots change, whichever comes first
+        now = datetime.now()
+        next_hour = now.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+        sock.settimeout((next_hour - now).total_seconds())
+        try:
+            sock.recv(1024)
+            # Collapse a burst of notifications (e.g. a backlog upload) into a single render
+            sock.settimeout(PRERENDER_DEBOUNCE_SECONDS)
+            while True:
+                sock.recv(1024)
+        except socket.timeout:
+            pass
+
+def start_prerenderer(address=RENDER_SIGNAL_ADDRESS, workers=PRERENDER_WORKERS):
+    """
+    Starts the background pre-renderer. It listens on a local UDP socket for the notification that
+    weather_server sends after each committed reading, then re-renders every plot in a process pool
+    so requests are served from pre-rendered bytes.
+
+    Returns the listener thread, or None if the socket could not be bound (e.g. another client is running).
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        sock.bind(address)
+    except OSError as e:
+        logging.warning(f"Pre-renderer disabled, could not listen on {address}: {e}")
+        sock.close()
+        return None
+    # Spawn rather than fork, forking a process that is already running server threads is not safe
+    executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+    thread = threading.Thread(target=_prerender_loop, args=(sock, executor), daemon=True, name="prerenderer")
+    thread.start()
+    return thread
+
+_prerenderer_lock = threading.Lock()
+_prerenderer_started = False
+
+def start_prerenderer_once():
+    """
+    Starts the pre-renderer, once per process. Called before every request, so it runs however the app is
+    served, and at startup in the process that serves requests.
+    """
+    global _prerenderer_started
+    if _prerenderer_started:
+        return
+    with _prerenderer_lock:
+        if not _prerenderer_started:
+            start_prerenderer()
+            _prerenderer_started = True
+
+@app.before_request
+def ensure_prerenderer():
+    start_prerenderer_once()
+
 if __name__ == '__main__':
-    app.run(debug=True, host="0.0.0.0", port=5001)
+    # The debug reloader serves requests from a child process (WERKZEUG_RUN_MAIN set). Its parent only watches
+    # for code changes, so it leaves the pre-renderer to the child. Without the reloader this process serves requests
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true' or not DEBUG:
+        start_prerenderer_once()
+    app.run(debug=DEBUG, host="0.0.0.0", port=5001)
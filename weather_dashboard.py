@@ -2,14 +2,17 @@ from dash import Dash, html, dcc, callback, Output, Input, dash_table, State
 import dash
 import dash_bootstrap_components as dbc
 from dash.exceptions import PreventUpdate
-from weather_helper import get_data, convert_wind_direction
+from weather_helper import get_data, get_data_version, get_window, convert_wind_direction, shared_cache, READING_INTERVAL
+from weather_stats import RunningStats, QuantileSketch, PeriodTotals, histogram_kde, grouped_box_stats
+from weather_downsample import minmax_indices, lttb_indices, MAX_POINTS, PLOT_WIDTH
 from datetime import datetime, timedelta
+from collections import OrderedDict
+import threading
 import pandas as pd
 import plotly.express as px
 import plotly.figure_factory as ff
 import plotly.graph_objects as go
 import numpy as np
-from scipy import stats
 import logging
 
 # Configure logging
@@ -97,8 +100,8 @@ app.index_string = '''
 </html>
 '''
 
-start_date = pd.to_datetime(get_data("first")['datetime'])
-end_date = pd.to_datetime(get_data("latest")['datetime'])
+start_date = pd.to_datetime(get_data("first", columns=["datetime"])['datetime'])
+end_date = pd.to_datetime(get_data("latest", columns=["datetime"])['datetime'])
 
 # Define the layout of the app
 app.layout = dbc.Container([
@@ -239,7 +242,9 @@ app.layout = dbc.Container([
     ]),
     dbc.Row([
         dbc.Col(html.Div(style={'height': '25px'}), width=12)
-    ])
+    ]),
+    # The selected range and the id of the latest reading, read by each figure's callback
+    dcc.Store(id='range-store')
 ], fluid=True)
 
 # Helper function to get units based on the column chosen
@@ -255,28 +260,151 @@ def get_unit(col):
     }
     return units.get(col, '')
 
+def get_y_axis_title(col):
+    axis_title = f'{col.capitalize().replace("_", " ")}'
+    y_axis_title = f'{axis_title} ({get_unit(col)})'
+    if col == 'rain_rate':
+        y_axis_title = 'Rain Rate (mm/s)'
+    elif col == 'wind_speed':
+        y_axis_title = 'Wind Speed (mph)'
+    return y_axis_title
+
+def time_scale(start_date, end_date):
+    """Returns the period ('H', 'D', 'W' or 'M'), tick format and rolling average window (in readings) for a date range"""
+    date_range = pd.to_datetime(end_date) - pd.to_datetime(start_date)
+    if date_range <= timedelta(days=2):  # Your updated condition
+        return 'H', '%H:%M', 4  # Rolling average per hour
+    elif date_range <= timedelta(days=14):
+        return 'D', '%d-%b', 96  # Rolling average per day
+    elif date_range <= timedelta(days=92):  # Approximately 3 months
+        return 'W', 'w/c %d-%b', 7 * 96  # Custom tick format for weeks, rolling average per week
+    else:
+        return 'M', '%b-%Y', 30 * 96  # Rolling average per 30 days
+
+def basic_statistics_table(chunks):
+    """
+    Builds the rows of the basic statistics table with the streaming reducers from weather_stats.
+
+    chunks is an iterable of DataFrames with datetime, temperature, rain, rain_rate and wind_speed columns. Pass
+    [df] for data that is already loaded, or weather_helper.iter_data(start_date, end_date) to compute the table over a long
+    range (e.g. the whole history) in constant memory.
+    """
+    temperature, rain, rain_rate, wind_speed = RunningStats(), RunningStats(), RunningStats(), RunningStats()
+    median_temperature = QuantileSketch()
+    daily_rain = PeriodTotals("D")
+    for chunk in chunks:
+        temperature.update(chunk['temperature'])
+        median_temperature.update(chunk['temperature'])
+        rain.update(chunk['rain'])
+        rain_rate.update(chunk['rain_rate'])
+        wind_speed.update(chunk['wind_speed'])
+        daily_rain.update(chunk['datetime'], chunk['rain'])
+    daily_rain = daily_rain.result()
+
+    def rounded(value, scale=1):
+        return round(value * scale, 1) if value is not None else None
+
+    basic_statistics = {
+        "Statistic": [
+            "Median Temperature (C)", 
+            "Minimum Temperature (C)", 
+            "Maximum Temperature (C)", 
+            "Total Rainfall (mm)",
+            "Maximum Daily Rainfall (mm)", 
+            "Maximum Rain Rate (mm/s)",
+            "Number of Rainy Days", 
+            "Maximum Wind Speed (mph)"#,
+            #"Average Luminance (lux)" # Average luminance doesn't really make sense in this table
+        ],
+        "Value": [
+            rounded(median_temperature.quantile(0.5)),
+            rounded(temperature.min),
+            rounded(temperature.max),
+            rounded(rain.sum),
+            rounded(float(daily_rain.max()) if len(daily_rain) else None),
+            rounded(rain_rate.max, 3600),  # Convert to mm/s
+            f"{(daily_rain > 1.0).sum()}/{len(daily_rain)}",
+            rounded(wind_speed.max, 2.23694)#,  # Convert to mph
+        ]
+    }
+    return pd.DataFrame(basic_statistics).to_dict('records')
+
+RANGE_STORE_SIZE = 4  # Date ranges kept in memory by each dashboard process
+
+class RangeStore:
+    """
+    The readings of the most recently selected date ranges, keyed on (start, end, id of the latest reading).
+
+    Every figure's callback reads its data from here, so changing a control only recomputes the figures that use
+    it, and a range is fetched once however many callbacks need it. A new reading changes the key, so the range is
+    fetched again on the next selection. The frames are shared, so callbacks must not modify them.
+    """
+    def __init__(self, max_ranges=RANGE_STORE_SIZE):
+        self.max_ranges = max_ranges
+        self._items = OrderedDict()
+        self._lock = threading.Lock()  # Held while fetching, the callbacks of a new selection all arrive at once
+
+    def get(self, selection):
+        key = (selection['start'], selection['end'], selection['version'])
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                return self._items[key]
+            df = load_range(pd.to_datetime(selection['start']), pd.to_datetime(selection['end']))
+            self._items[key] = df
+            while len(self._items) > self.max_ranges:
+                self._items.popitem(last=False)
+            return df
+
+def load_range(start_date, end_date):
+    """Fetches the readings between two dates, with the period and compass direction columns the figures group by"""
+    df = get_data(start_date, end_date, compact=True).reset_index()
+
+    logging.debug(f"fetched range start_date: {start_date}, end_date: {end_date}")
+
+    # Determine the granularity for the bar charts and boxplot
+    period_freq, _, _ = time_scale(start_date, end_date)
+    if period_freq in ('H', 'D'):
+        period = df['datetime'].dt.floor(period_freq)
+    else:
+        period = df['datetime'].dt.to_period(period_freq).apply(lambda r: r.start_time)
+
+    df['period'] = period
+    df['wind_direction_converted'] = df['wind_direction'].apply(convert_wind_direction)
+    return df
+
+range_store = RangeStore()
+
+def shared_output(name, selection, controls, build):
+    """
+    Returns build()'s figure or table for the selected range and controls. Outputs are shared between the
+    dashboard's worker processes through the shared cache until new data arrives.
+    """
+    if not selection:
+        raise PreventUpdate
+
+    def compute():
+        output = build()
+        # Stored as plain dicts, which unpickle about 100x faster than plotly Figures
+        return output.to_dict() if isinstance(output, go.Figure) else output
+
+    if shared_cache is None:
+        return compute()
+    return shared_cache.get_or_compute(("dashboard", name, selection['start'], selection['end'], selection['version']) + controls, compute)
+
 @callback(
     Output('date-picker-range', 'start_date'),
     Output('date-picker-range', 'end_date'),
-    Output('temperature-bar-chart', 'figure'),
-    Output('total-rainfall-bar-chart', 'figure'),
-    Output('wind-direction-radar-chart', 'figure'),
-    Output('basic-statistics-table', 'data'),
-    Output('controls-and-graph', 'figure'),
-    Output('boxplot-graph', 'figure'),
-    Output('statistics-table', 'data'),
-    Output('histogram-kde-graph', 'figure'),
+    Output('range-store', 'data'),
     Input('button-today', 'n_clicks'),
     Input('button-week', 'n_clicks'),
     Input('button-month', 'n_clicks'),
     Input('button-year', 'n_clicks'),
     Input('button-all', 'n_clicks'),
     Input('date-picker-range', 'start_date'),
-    Input('date-picker-range', 'end_date'),
-    Input('controls-and-dropdown', 'value'),
-    Input('temperature-radio-items', 'value')
+    Input('date-picker-range', 'end_date')
 )
-def update_graphs_and_table(btn_today, btn_week, btn_month, btn_year, btn_all, start_date, end_date, col_chosen, temp_stat):
+def select_range(btn_today, btn_week, btn_month, btn_year, btn_all, start_date, end_date):
 
     # Determine which button was clicked
     ctx = dash.callback_context
@@ -285,11 +413,11 @@ def update_graphs_and_table(btn_today, btn_week, btn_month, btn_year, btn_all, s
         #start_date = pd.to_datetime(get_data("all")['datetime'].min())
         #end_date = pd.to_datetime(get_data("all")['datetime'].max())
         # Default to show today's data on initial load
-        start_date = pd.to_datetime(get_data("today")['datetime'].min())
-        end_date = pd.to_datetime(get_data("today")['datetime'].max())
+        start_date = pd.to_datetime(get_data("today", columns=["datetime"])['datetime'].min())
+        end_date = pd.to_datetime(get_data("today", columns=["datetime"])['datetime'].max())
     else:
         button_id = ctx.triggered[0]['prop_id'].split('.')[0]
-        
+
         now = datetime.now()
         if button_id == 'button-today':
             start_date = now.replace(hour=0, minute=0, second=0, microsecond=0)
@@ -304,8 +432,8 @@ def update_graphs_and_table(btn_today, btn_week, btn_month, btn_year, btn_all, s
             start_date = now.replace(month=1, day=1)
             end_date = now
         elif button_id == 'button-all':
-            start_date = pd.to_datetime(get_data("first")['datetime']).iloc[0]
-            end_date = pd.to_datetime(get_data("latest")['datetime']).iloc[0]
+            start_date = pd.to_datetime(get_data("first", columns=["datetime"])['datetime']).iloc[0]
+            end_date = pd.to_datetime(get_data("latest", columns=["datetime"])['datetime']).iloc[0]
         else:
             # Use the provided date range if no button was clicked
             start_date = pd.to_datetime(start_date)
@@ -317,33 +445,156 @@ def update_graphs_and_table(btn_today, btn_week, btn_month, btn_year, btn_all, s
     else:
         end_date = pd.to_datetime('now')
 
-    # Fetch the fresh data
-    df = get_data(start_date, end_date)
-    df['datetime'] = pd.to_datetime(df['datetime'])
+    # The latest id is part of the selection, so figures are recomputed once new data has arrived
+    version = get_data_version()
+    selection = {
+        'start': start_date.isoformat(),
+        'end': end_date.isoformat(),
+        'version': version[0] if version else None,
+        'tickformat': time_scale(start_date, end_date)[1],
+    }
+    return start_date.date(), end_date, selection
 
-    logging.debug(f"updated graphs start_date: {start_date}, end_date: {end_date}")#, col_chosen: {col_chosen}, temp_stat: {temp_stat}")
+@callback(
+    Output('temperature-bar-chart', 'figure'),
+    Input('range-store', 'data'),
+    Input('temperature-radio-items', 'value')
+)
+def update_temperature_bar_chart(selection, temp_stat):
+    return shared_output('temperature', selection, (temp_stat,), lambda: temperature_bar_figure(range_store.get(selection), selection['tickformat'], temp_stat))
 
-    # Determine the granularity for the bar charts and boxplot
-    date_range = pd.to_datetime(end_date) - pd.to_datetime(start_date)
-    if date_range <= timedelta(days=2):  # Your updated condition
-        period = df['datetime'].dt.floor('H')
-        tickformat = '%H:%M'
-        rolling_window = 4  # Rolling average per hour
-    elif date_range <= timedelta(days=14):
-        period = df['datetime'].dt.floor('D')
-        tickformat = '%d-%b'
-        rolling_window = 96  # Rolling average per day
-    elif date_range <= timedelta(days=92):  # Approximately 3 months
-        period = df['datetime'].dt.to_period('W').apply(lambda r: r.start_time)
-        tickformat = 'w/c %d-%b'  # Custom tick format for weeks
-        rolling_window = 7 * 96  # Rolling average per week
+@callback(
+    Output('total-rainfall-bar-chart', 'figure'),
+    Input('range-store', 'data')
+)
+def update_rainfall_bar_chart(selection):
+    return shared_output('rainfall', selection, (), lambda: rainfall_bar_figure(range_store.get(selection), selection['tickformat']))
+
+@callback(
+    Output('wind-direction-radar-chart', 'figure'),
+    Input('range-store', 'data')
+)
+def update_wind_direction_radar_chart(selection):
+    return shared_output('wind_direction', selection, (), lambda: wind_direction_figure(range_store.get(selection)))
+
+@callback(
+    Output('basic-statistics-table', 'data'),
+    Input('range-store', 'data')
+)
+def update_basic_statistics_table(selection):
+    return shared_output('basic_statistics', selection, (), lambda: basic_statistics_table([range_store.get(selection)]))
+
+@callback(
+    Output('controls-and-graph', 'figure'),
+    Input('range-store', 'data'),
+    Input('controls-and-dropdown', 'value')
+)
+def update_time_series(selection, col_chosen):
+    # Built from the resolution pyramid rather than the range's readings, see time_series_figure
+    return shared_output('time_series', selection, (col_chosen,), lambda: time_series_figure(selection['start'], selection['end'], col_chosen))
+
+@callback(
+    Output('boxplot-graph', 'figure'),
+    Input('range-store', 'data'),
+    Input('controls-and-dropdown', 'value')
+)
+def update_boxplot(selection, col_chosen):
+    return shared_output('boxplot', selection, (col_chosen,), lambda: boxplot_figure(range_store.get(selection), selection['tickformat'], col_chosen))
+
+@callback(
+    Output('statistics-table', 'data'),
+    Input('range-store', 'data')
+)
+def update_statistics_table(selection):
+    return shared_output('statistics', selection, (), lambda: period_statistics_table(range_store.get(selection), selection['tickformat']))
+
+@callback(
+    Output('histogram-kde-graph', 'figure'),
+    Input('range-store', 'data'),
+    Input('controls-and-dropdown', 'value')
+)
+def update_histogram_kde(selection, col_chosen):
+    return shared_output('histogram_kde', selection, (col_chosen,), lambda: histogram_kde_figure(range_store.get(selection), col_chosen))
+
+@callback(
+    Output('controls-and-graph', 'figure', allow_duplicate=True),
+    Input('controls-and-graph', 'relayoutData'),
+    State('range-store', 'data'),
+    State('controls-and-dropdown', 'value'),
+    prevent_initial_call=True
+)
+def zoom_time_series(relayout_data, selection, col_chosen):
+    """Refetches the time series for the visible window when it is zoomed or panned, and for the date range when it is reset"""
+    if not relayout_data or not selection:
+        raise PreventUpdate
+    if 'xaxis.range[0]' in relayout_data:
+        start_date, end_date = relayout_data['xaxis.range[0]'], relayout_data['xaxis.range[1]']
+    elif 'xaxis.range' in relayout_data:
+        start_date, end_date = relayout_data['xaxis.range']
+    elif relayout_data.get('xaxis.autorange'):
+        # Back to the whole of the selected date range
+        start_date, end_date = selection['start'], selection['end']
     else:
-        period = df['datetime'].dt.to_period('M').apply(lambda r: r.start_time)
-        tickformat = '%b-%Y'
-        rolling_window = 30 * 96  # Rolling average per 30 days
+        # Only the y axis or the plot size changed
+        raise PreventUpdate
+    return time_series_figure(start_date, end_date, col_chosen)
+
+def time_series_figure(start_date, end_date, col_chosen):
+    """
+    Builds the time series of a measurement with its rolling average between two dates.
+
+    The data comes from the finest level of the resolution pyramid (see get_window in weather_helper) that fits the
+    plot width: the readings themselves for short windows, and the min, max and mean of each hour, day or week for
+    longer ones. Zooming and panning call this with the visible window, so each only costs a bounded query.
+    """
+    start_date = pd.to_datetime(start_date).to_pydatetime()
+    end_date = pd.to_datetime(end_date).to_pydatetime()
+    _, tickformat, rolling_window = time_scale(start_date, end_date)
+    level, interval, data = get_window(start_date, end_date, col_chosen, PLOT_WIDTH)
+    scale = 3600 if col_chosen == 'rain_rate' else (2.23694 if col_chosen == 'wind_speed' else 1)
+
+    # Both traces are downsampled to a point budget set by the plot width, so long ranges stay quick to send and draw.
+    # The markers keep the minimum and maximum of each bucket, the rolling average keeps its shape with LTTB
+    if level == 'raw':
+        values = data['mean'] * scale
+        values = values.iloc[minmax_indices(values.to_numpy(), MAX_POINTS)]
+    else:
+        values = pd.concat([data['min'], data['max']]).sort_index() * scale
+    rolling_average = data['mean'].rolling(window=max(1, round(rolling_window * READING_INTERVAL / interval))).mean() * scale
+    rolling_average = rolling_average.iloc[lttb_indices(data.index.to_numpy(), rolling_average.to_numpy(), MAX_POINTS)]
 
-    df['period'] = period
+    axis_title = f'{col_chosen.capitalize().replace("_", " ")}'
+    time_series_fig = go.Figure()
+
+    # Add scatter plot for time series
+    time_series_fig.add_trace(go.Scatter(
+        x=values.index, 
+        y=values,
+        mode='markers',
+        name=axis_title,
+        line=dict(color='black')
+    ))
 
+    # Add rolling average plot for time series
+    time_series_fig.add_trace(go.Scatter(
+        x=rolling_average.index,
+        y=rolling_average,
+        mode='lines',
+        name=f'Rolling Average',
+        line=dict(color='red', width=3)
+    ))
+
+    time_series_fig.update_layout(
+        title=f'Time Series of {axis_title} with Rolling Average',
+        xaxis_title='',
+        yaxis_title=get_y_axis_title(col_chosen),
+        xaxis=dict(tickformat=tickformat),
+        showlegend=False
+    )
+    return time_series_fig
+
+def temperature_bar_figure(df, tickformat, temp_stat):
+    """Builds the bar chart of the min, max or median temperature of each period"""
     # Create the temperature bar chart based on selected statistic
     if temp_stat == 'min':
         temp_df = df.groupby('period')['temperature'].min().reset_index()
@@ -354,28 +605,31 @@ def update_graphs_and_table(btn_today, btn_week, btn_month, btn_year, btn_all, s
 
     temp_bar_fig = px.bar(temp_df, x='period', y='temperature', title='Temperature', color_discrete_sequence=['black'])
     temp_bar_fig.update_layout(
-        xaxis_title='', 
+        xaxis_title='',
         yaxis_title='Temperature (C)',
         xaxis=dict(
             tickformat=tickformat,
             tickangle= -45  # Slant labels at 45 degrees
         )
     )
+    return temp_bar_fig
 
-    # Create the total rainfall bar chart
+def rainfall_bar_figure(df, tickformat):
+    """Builds the bar chart of the total rainfall of each period"""
     total_rainfall_df = df.groupby('period')['rain'].sum().reset_index()
     total_rainfall_bar_fig = px.bar(total_rainfall_df, x='period', y='rain', title='Total Rainfall', color_discrete_sequence=['black'])
     total_rainfall_bar_fig.update_layout(
-        xaxis_title='', 
+        xaxis_title='',
         yaxis_title='Rainfall (mm)',
         xaxis=dict(
             tickformat=tickformat,
             tickangle= -45  # Slant labels at 45 degrees
         )
     )
+    return total_rainfall_bar_fig
 
-    # Create the wind direction radar chart
-    df['wind_direction_converted'] = df['wind_direction'].apply(convert_wind_direction)
+def wind_direction_figure(df):
+    """Builds the radar chart of how often the wind blew from each compass direction"""
     wind_dir_counts = df['wind_direction_converted'].value_counts().reindex(['N', 'NE', 'E', 'SE', 'S', 'SW', 'W', 'NW']).fillna(0).reset_index()
     wind_dir_counts.columns = ['wind_direction', 'count']
     radar_fig = go.Figure(go.Scatterpolar(
@@ -393,98 +647,41 @@ def update_graphs_and_table(btn_today, btn_week, btn_month, btn_year, btn_all, s
             )
         )
     )
+    return radar_fig
+
+def boxplot_figure(df, tickformat, col_chosen):
+    """Builds the box plot of a measurement in each period"""
+    # Quartiles and whiskers are computed here, so the figure holds a few numbers per period instead of every reading
+    scale = 3600 if col_chosen == 'rain_rate' else (2.23694 if col_chosen == 'wind_speed' else 1)
+    boxes = grouped_box_stats(df['period'].to_numpy(), df[col_chosen].to_numpy(dtype='float64') * scale)
+    boxplot_fig = go.Figure(go.Box(
+        x=boxes.index,
+        q1=boxes['q1'],
+        median=boxes['median'],
+        q3=boxes['q3'],
+        lowerfence=boxes['lowerfence'],
+        upperfence=boxes['upperfence'],
+        name=col_chosen.capitalize().replace("_", " "),
+        marker_color='black',
+        boxpoints=False  # Do not show individual points
+    ))
+    boxplot_fig.update_layout(
+        title=f'Box Plot of {col_chosen.capitalize().replace("_", " ")}',
+        showlegend=True,
+        template=None,  # Explicitly set the template to None
+        xaxis_title='', yaxis_title=get_y_axis_title(col_chosen),
+        xaxis=dict(tickformat=tickformat)
+    )
+    return boxplot_fig
 
-    # Calculate basic statistics for the overall period
-    df.set_index('datetime', inplace=True)
-    max_daily_rainfall = df['rain'].resample('D').sum().max()
-
-    basic_statistics = {
-        "Statistic": [
-            "Median Temperature (C)", 
-            "Minimum Temperature (C)", 
-            "Maximum Temperature (C)", 
-            "Total Rainfall (mm)",
-            "Maximum Daily Rainfall (mm)", 
-            "Maximum Rain Rate (mm/s)",
-            "Number of Rainy Days", 
-            "Maximum Wind Speed (mph)"#,
-            #"Average Luminance (lux)" # Average luminance doesn't really make sense in this table
-        ],
-        "Value": [
-            round(df['temperature'].median(), 1),
-            round(df['temperature'].min(), 1),
-            round(df['temperature'].max(), 1),
-            round(df['rain'].sum(), 1),
-            round(max_daily_rainfall, 1),
-            round(df['rain_rate'].max() * 3600, 1),  # Convert to mm/s
-            f"{(df['rain'].resample('D').sum() > 1.0).sum()}/{len(df['rain'].resample('D').sum())}",
-            round(df['wind_speed'].max() * 2.23694, 1)#,  # Convert to mph
-            #round(df['luminance'].mean(), 1) # Average luminance doesn't really make sense in this table
-        ]
-    }
-
-    basic_statistics_data = pd.DataFrame(basic_statistics).to_dict('records')
-
-    # Reset the index to ensure 'datetime' is available for time series figure
-    df.reset_index(inplace=True)
-
-    # Handle y-axis titles for time series and box plots
-    axis_title = f'{col_chosen.capitalize().replace("_", " ")}'
-    y_axis_title = f'{axis_title} ({get_unit(col_chosen)})'
-    if col_chosen == 'rain_rate':
-        y_axis_title = 'Rain Rate (mm/s)'
-    elif col_chosen == 'wind_speed':
-        y_axis_title = 'Wind Speed (mph)'
-    
+def histogram_kde_figure(df, col_chosen):
+    """Builds the histogram of a measurement with its kernel density estimate"""
     # Get the appropriate axis titles based on the selected column
     axis_title = f'{col_chosen.capitalize().replace("_", " ")}'
     unit = get_unit(col_chosen)
     xaxis_title = f'{axis_title} ({unit})'
     yaxis_title = 'Density'
-    
-    # Create the time series figure
-    time_series_fig = go.Figure()
-
-    # Add scatter plot for time series
-    time_series_fig.add_trace(go.Scatter(
-        x=df['datetime'], 
-        y=df[col_chosen] * (3600 if col_chosen == 'rain_rate' else (2.23694 if col_chosen == 'wind_speed' else 1)),
-        mode='markers',
-        name=axis_title,
-        line=dict(color='black')
-    ))
-
-    # Add rolling average plot for time series
-    time_series_fig.add_trace(go.Scatter(
-        x=df['datetime'],
-        y=df[col_chosen].rolling(window=rolling_window).mean() * (3600 if col_chosen == 'rain_rate' else (2.23694 if col_chosen == 'wind_speed' else 1)),
-        mode='lines',
-        name=f'Rolling Average',
-        line=dict(color='red', width=3)
-    ))
 
-    time_series_fig.update_layout(
-        title=f'Time Series of {col_chosen.capitalize().replace("_", " ")} with Rolling Average',
-        xaxis_title='',
-        yaxis_title=y_axis_title,
-        xaxis=dict(tickformat=tickformat),
-        showlegend=False
-    )
-
-    # Create the boxplot figure using Plotly Express
-    boxplot_fig = px.box(
-        df, 
-        x='period', 
-        y=df[col_chosen] * (3600 if col_chosen == 'rain_rate' else (2.23694 if col_chosen == 'wind_speed' else 1)),
-        title=f'Box Plot of {col_chosen.capitalize().replace("_", " ")}',
-        points=False,  # Do not show individual points
-        template=None,  # Explicitly set the template to None
-        color_discrete_sequence=['black']
-    ).update_layout(showlegend=True)
-    boxplot_fig.update_layout(
-        xaxis_title='', yaxis_title=y_axis_title,
-        xaxis=dict(tickformat=tickformat)
-    )
     histogram_kde_fig = go.Figure()
 
     # Adjust data for conversion if necessary
@@ -494,11 +691,14 @@ def update_graphs_and_table(btn_today, btn_week, btn_month, btn_year, btn_all, s
     elif col_chosen == 'wind_speed':
         kde_data *= 2.23694  # Convert to mph
 
+    # Histogram and KDE from one binning pass, so the cost hardly grows with the length of the range
+    edges, histogram, x_grid, kde_y = histogram_kde(kde_data, bins=30, points=1000)
+
     # Add histogram
-    histogram_kde_fig.add_trace(go.Histogram(
-        x=kde_data,
-        nbinsx=30,
-        histnorm='probability density',
+    histogram_kde_fig.add_trace(go.Bar(
+        x=(edges[:-1] + edges[1:]) / 2,
+        y=histogram,
+        width=np.diff(edges),
         marker=dict(
             color='black',
             line=dict(
@@ -510,22 +710,18 @@ def update_graphs_and_table(btn_today, btn_week, btn_month, btn_year, btn_all, s
         name='Histogram'
     ))
 
-    # Calculate KDE
-    x_grid = np.linspace(kde_data.min(), kde_data.max(), 1000)
-    kde = stats.gaussian_kde(kde_data.dropna())
-    kde_y = kde.evaluate(x_grid)
-
-    # Add KDE line
-    histogram_kde_fig.add_trace(go.Scatter(
-        x=x_grid,
-        y=kde_y,
-        mode='lines',
-        line=dict(
-            color='red',
-            width=3
-        ),
-        name='KDE'
-    ))
+    # Add KDE line, there is none if every value is the same
+    if kde_y is not None:
+        histogram_kde_fig.add_trace(go.Scatter(
+            x=x_grid,
+            y=kde_y,
+            mode='lines',
+            line=dict(
+                color='red',
+                width=3
+            ),
+            name='KDE'
+        ))
 
     histogram_kde_fig.update_layout(
         title=f'{axis_title} Distribution with KDE',
@@ -539,6 +735,10 @@ def update_graphs_and_table(btn_today, btn_week, btn_month, btn_year, btn_all, s
     #if col_chosen in ['rain', 'rain_rate', 'wind_speed', 'luminance']:
     #    histogram_kde_fig.update_yaxes(type="log")
 
+    return histogram_kde_fig
+
+def period_statistics_table(df, tickformat):
+    """Builds the rows of the table of statistics for each period"""
     # Calculate statistics for the summary table
     statistics = df.groupby('period').agg(
         median_temperature=('temperature', 'median'),
@@ -556,8 +756,9 @@ def update_graphs_and_table(btn_today, btn_week, btn_month, btn_year, btn_all, s
     # Drop the original period column if it's causing the length mismatch
     statistics = statistics.drop(columns=['period'])
 
-    # Round the statistics to one decimal place
-    statistics = statistics.round(1)
+    # Round the statistics to one decimal place (as float64, so float32 values display cleanly)
+    numeric_columns = statistics.select_dtypes('number').columns
+    statistics[numeric_columns] = statistics[numeric_columns].astype('float64').round(1)
 
     # Adjust the final DataFrame for display
     statistics_data = statistics[['Period_str', 'median_temperature', 'min_temperature', 'max_temperature', 'total_rainfall', 'max_rain_rate', 'peak_windspeed', 'avg_luminance']].to_dict('records')
@@ -574,7 +775,7 @@ def update_graphs_and_table(btn_today, btn_week, btn_month, btn_year, btn_all, s
         "avg_luminance": "Average Luminance (lux)"
     }).to_dict('records')
 
-    return start_date.date(), end_date, temp_bar_fig, total_rainfall_bar_fig, radar_fig, basic_statistics_data, time_series_fig, boxplot_fig, statistics_data, histogram_kde_fig
+    return statistics_data
 
 # Run the app
 if __name__ == '__main__':
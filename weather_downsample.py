@@ -0,0 +1,105 @@
+import numpy as np
+
+import sql_config
+
+# Point budget for a plotted trace. The time series plot spans the page, so about two points per pixel of a wide
+# screen (a minimum and a maximum) is as much detail as the browser can show. Can be configured in sql_config.py
+PLOT_WIDTH = getattr(sql_config, 'dashboard_plot_width', 1400)  # Pixels
+POINTS_PER_PIXEL = 2
+MAX_POINTS = PLOT_WIDTH * POINTS_PER_PIXEL
+
+def _as_float(x):
+    '''Returns x as float64, with datetimes as nanoseconds since the epoch.'''
+    x = np.asarray(x)
+    if np.issubdtype(x.dtype, np.datetime64):
+        return x.astype('datetime64[ns]').astype(np.int64).astype(np.float64)
+    return x.astype(np.float64)
+
+def minmax_indices(y, n_out=MAX_POINTS):
+    '''
+    Selects the positions of the minimum and maximum of y in each of n_out // 2 equal sized buckets.
+
+    Every local extreme that is visible at the plotted resolution survives, so spikes and dips are never smoothed
+    away. NaN values are never selected.
+
+    Parameters:
+        y (array-like): The values, in plotting order.
+        n_out (int, optional): The maximum number of positions to return, at least 2. Defaults to MAX_POINTS.
+
+    Returns:
+        numpy.ndarray: Sorted positions into y, all of them if y already fits in n_out.
+
+    Usage:
+        keep = minmax_indices(df["temperature"], 2000)
+        plot(df["datetime"].iloc[keep], df["temperature"].iloc[keep])
+    '''
+    y = np.asarray(y, dtype=np.float64)
+    valid = np.flatnonzero(~np.isnan(y))
+    if len(valid) <= n_out:
+        return valid
+    buckets = max(n_out // 2, 1)
+    size = -(-len(valid) // buckets)
+    # Pad to a (buckets, size) array so the extremes of every bucket are found in one pass. Padding is NaN and only
+    # fills the end of the last bucket, which always holds at least one value
+    values = np.full(buckets * size, np.nan)
+    values[:len(valid)] = y[valid]
+    values = values.reshape(buckets, size)
+    rows = np.arange(buckets) * size
+    rows = rows[rows < len(valid)]
+    values = values[:len(rows)]
+    lowest = rows + np.nanargmin(values, axis=1)
+    highest = rows + np.nanargmax(values, axis=1)
+    return valid[np.unique(np.concatenate([lowest, highest]))]
+
+def lttb_indices(x, y, n_out=MAX_POINTS):
+    '''
+    Selects n_out positions with Largest-Triangle-Three-Buckets, which keeps the visual shape of a line.
+
+    The first and last points are kept, and the points between them are split into n_out - 2 buckets. From each
+    bucket the point forming the largest triangle with the point chosen from the previous bucket and the mean of
+    the next bucket is kept. The bucket means and the triangle areas within a bucket are computed with NumPy, only
+    the walk from bucket to bucket is a loop. NaN values are never selected.
+
+    Parameters:
+        x (array-like): The x values in increasing order, numbers or datetimes.
+        y (array-like): The values.
+        n_out (int, optional): The number of positions to return. Defaults to MAX_POINTS.
+
+    Returns:
+        numpy.ndarray: Sorted positions into x and y, all of them if they already fit in n_out.
+
+    Usage:
+        keep = lttb_indices(df["datetime"], rolling_mean, 2000)
+    '''
+    y = np.asarray(y, dtype=np.float64)
+    valid = np.flatnonzero(~np.isnan(y))
+    if len(valid) <= max(n_out, 2):
+        return valid
+    if n_out < 3:
+        return valid[[0, -1]][:n_out]
+    x = _as_float(x)[valid]
+    x = x - x[0]  # Keeps the running sums of epoch nanoseconds precise
+    y = y[valid]
+    n = len(valid)
+
+    # Bucket i covers [edges[i], edges[i + 1]) of the points between the first and the last
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    x_sums = np.concatenate([[0.0], np.cumsum(x)])
+    y_sums = np.concatenate([[0.0], np.cumsum(y)])
+    counts = np.diff(edges)
+    mean_x = (x_sums[edges[1:]] - x_sums[edges[:-1]]) / counts
+    mean_y = (y_sums[edges[1:]] - y_sums[edges[:-1]]) / counts
+    # The last bucket looks ahead to the last point
+    mean_x = np.append(mean_x[1:], x[-1])
+    mean_y = np.append(mean_y[1:], y[-1])
+
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        # Twice the area of the triangle from the previous point to each candidate to the next bucket's mean
+        areas = np.abs((x[a] - mean_x[i]) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (mean_y[i] - y[a]))
+        a = start + int(np.argmax(areas))
+        selected[i + 1] = a
+    return valid[selected]
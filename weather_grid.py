@@ -0,0 +1,337 @@
+import argparse
+import json
+import os
+import shutil
+import threading
+import time
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+
+import sql_config
+
+# Directory holding the grid store. Can be overridden with grid_dir in sql_config.py
+GRID_DIR = getattr(sql_config, 'grid_dir', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'grid'))
+GRID_INTERVAL = timedelta(minutes=15)
+GRID_META = "meta.json"
+GAP = np.iinfo(np.int32).min  # Timestamp offset of an empty slot
+GRID_CLOCK = "UTC"  # Slots are kept in UTC, stores built on local time are ignored until rebuilt
+LOCAL_TIMEZONE = 'Europe/London'
+
+# Decimal places of each measurement in the data table (DOUBLE(m,d)), so values stored at ingest match MySQL
+COLUMN_DECIMALS = {"temperature": 2, "pressure": 2, "humidity": 1, "rain": 2, "rain_rate": 5, "luminance": 2, "wind_speed": 1, "wind_direction": 0}
+
+class GridStore:
+    '''
+    Append-only store of readings on a fixed 15 minute grid, one memory-mapped file per measurement.
+
+    Slot i holds the reading nearest to origin + i * interval in UTC, so the slots covering a time range are found
+    by arithmetic rather than a search, and reading them is a slice of the memory-mapped file. Empty slots hold NaN.
+    The exact time of each reading is kept in a sidecar of int32 offsets (in seconds) from its slot time, with GAP
+    marking empty slots. Slots are on UTC because the local time repeats in the hour the clocks go back; ranges are
+    asked for and returned in local time, like the data table. The files are plain arrays in native byte order:
+
+        meta.json          origin, interval, clock, columns and whether the store holds the whole history
+        timestamp.i32      offset of each reading from its slot time
+        <column>.f64       one file per measurement
+
+    One process (the server) appends while any number of readers map the files read-only, sharing the pages through
+    the OS page cache. The timestamp sidecar is always written last, so readers never see a slot before its values.
+
+    Parameters:
+        path (str): Directory of the store. It is created if it does not exist.
+        columns (sequence): Measurement columns to store.
+        interval (timedelta, optional): Spacing of the grid. Defaults to 15 minutes.
+
+    Usage:
+        store = GridStore("grid", MEASUREMENT_COLUMNS)
+        store.append([datetime(2024, 1, 1, 12, 0, 3)], {"temperature": [8.25], ...})  # UTC
+        arrays = store.slice(datetime(2024, 1, 1), datetime(2024, 1, 31, 23, 59, 59), ["temperature"])
+    '''
+    def __init__(self, path, columns, interval=GRID_INTERVAL):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.columns = tuple(columns)
+        self.interval = interval
+        self._step = int(interval.total_seconds())
+        self._lock = threading.Lock()
+        self._meta = {"key": None, "meta": None}
+        self._maps = {"key": None, "maps": None}
+
+    def _file(self, column):
+        return os.path.join(self.path, "timestamp.i32" if column == "timestamp" else f"{column}.f64")
+
+    def _dtype(self, column):
+        return np.int32 if column == "timestamp" else np.float64
+
+    def meta(self):
+        '''Returns the contents of meta.json (origin as a datetime), or None if the store is empty. Re-read only when it changes.'''
+        path = os.path.join(self.path, GRID_META)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        key = (stat.st_ino, stat.st_mtime_ns)
+        if key != self._meta["key"]:
+            with open(path) as f:
+                meta = json.load(f)
+            meta["origin"] = datetime.fromisoformat(meta["origin"])
+            self._meta.update(key=key, meta=meta)
+        return self._meta["meta"]
+
+    def _save_meta(self, meta):
+        path = os.path.join(self.path, GRID_META)
+        with open(path + ".tmp", "w") as f:
+            json.dump(dict(meta, origin=meta["origin"].isoformat()), f, indent=1)
+        os.replace(path + ".tmp", path)
+
+    def __len__(self):
+        '''Number of slots in the store, including empty ones.'''
+        try:
+            return os.path.getsize(self._file("timestamp")) // np.dtype(np.int32).itemsize
+        except OSError:
+            return 0
+
+    def _extend(self, length):
+        '''Grows every file to length slots, filling the new slots with NaN (or GAP), the sidecar last.'''
+        current = len(self)
+        for column in self.columns + ("timestamp",):
+            fill = GAP if column == "timestamp" else np.nan
+            with open(self._file(column), "ab") as f:
+                # Files are only ever appended to, so they may be up to one interrupted extension ahead of the sidecar
+                f.truncate(current * np.dtype(self._dtype(column)).itemsize)
+                np.full(length - current, fill, dtype=self._dtype(column)).tofile(f)
+
+    def append(self, timestamps, values, complete=None):
+        '''
+        Writes readings into their slots, growing the files if they are past the end.
+
+        A reading in a slot that is already filled (two readings less than an interval apart) replaces it, is
+        counted in meta.json as a collision and marks the store as incomplete. Readings before the origin of the
+        store cannot be stored; they are skipped and the store is also marked as incomplete. get_data stops using
+        an incomplete store until it is rebuilt.
+
+        Parameters:
+            timestamps (sequence): Naive UTC datetimes of the readings.
+            values (dict): Sequence of values for each column, in the same order as timestamps.
+            complete (bool, optional): Sets the flag in meta.json saying whether the store holds the whole history.
+
+        Returns:
+            int: The number of readings stored.
+        '''
+        if len(timestamps) == 0:
+            return 0
+        seconds = np.asarray(timestamps, dtype="datetime64[s]").astype(np.int64)
+        with self._lock:
+            meta = self.meta()
+            if meta is None:
+                origin = int(seconds.min()) // self._step * self._step
+                meta = {"origin": datetime(1970, 1, 1) + timedelta(seconds=origin), "interval_seconds": self._step,
+                        "clock": GRID_CLOCK, "columns": list(self.columns), "complete": False, "collisions": 0}
+            else:
+                meta = dict(meta)
+                if meta.get("clock") != GRID_CLOCK:
+                    # Built on local time by an earlier version, the readings can't be mixed
+                    meta["complete"] = False
+            if complete is not None:
+                meta["complete"] = complete
+
+            origin = np.datetime64(meta["origin"], "s").astype(np.int64)
+            slots = (seconds - origin + self._step // 2) // self._step
+            keep = slots >= 0
+            if not keep.all():
+                meta["complete"] = False
+                seconds, slots = seconds[keep], slots[keep]
+            stored = int(keep.sum())
+
+            if stored:
+                needed = int(slots.max()) + 1
+                if needed > len(self):
+                    self._extend(needed)
+                offsets = (seconds - origin - slots * self._step).astype(np.int32)
+                for column in self.columns:
+                    column_values = np.round(np.asarray(values[column], dtype=np.float64)[keep], COLUMN_DECIMALS.get(column, 15))
+                    stored_values = np.memmap(self._file(column), dtype=np.float64, mode="r+")
+                    stored_values[slots] = column_values
+                    stored_values.flush()
+                sidecar = np.memmap(self._file("timestamp"), dtype=np.int32, mode="r+")
+                existing = sidecar[slots]
+                # Readings that replace a different reading, or share a slot with another reading of this batch
+                collisions = int(((existing != GAP) & (existing != offsets)).sum()) + len(slots) - len(np.unique(slots))
+                if collisions:
+                    meta["collisions"] += collisions
+                    meta["complete"] = False
+                sidecar[slots] = offsets
+                sidecar.flush()
+                del sidecar
+
+            self._save_meta(meta)
+        return stored
+
+    def _read_maps(self):
+        '''Read-only memory maps of every file, re-mapped only when the store has grown or been rebuilt.'''
+        try:
+            stat = os.stat(self._file("timestamp"))
+        except OSError:
+            return None
+        key = (stat.st_ino, stat.st_size)
+        if key != self._maps["key"]:
+            length = stat.st_size // np.dtype(np.int32).itemsize
+            maps = {}
+            for column in self.columns + ("timestamp",):
+                maps[column] = np.memmap(self._file(column), dtype=self._dtype(column), mode="r", shape=(length,)) if length else np.empty(0, self._dtype(column))
+            self._maps.update(key=key, maps=maps)
+        return self._maps["maps"]
+
+    def slice(self, start_date=None, end_date=None, columns=None):
+        '''
+        Returns the readings in a time range (inclusive bounds, in local time) as arrays.
+
+        The range is located by index arithmetic on the grid and trimmed at each end with the exact timestamps.
+        Readings are in UTC order, so in the hour the clocks go back the local times run through the hour twice.
+        Measurement arrays are read-only views of the memory-mapped files, so no data is copied or read from disk
+        until it is used. Empty slots inside the range are included, with NaT in 'datetime' and NaN in the measurements.
+
+        Parameters:
+            start_date, end_date (datetime, optional): Inclusive bounds. Defaults to the whole store.
+            columns (sequence, optional): Measurement columns to return. Defaults to every column in the store.
+
+        Returns:
+            dict: 'datetime' (datetime64[s], local time) and one float64 array per column, or None if the store is empty.
+        '''
+        meta = self.meta()
+        maps = self._read_maps()
+        if meta is None or maps is None:
+            return None
+        columns = self.columns if columns is None else tuple(columns)
+        origin = np.datetime64(meta["origin"], "s").astype(np.int64)
+        length = len(maps["timestamp"])
+
+        # Readings are at most half an interval from their slot time. A local bound in the repeated hour covers
+        # both of its UTC times, so the slots run from the earliest UTC time of the start to the latest of the end
+        first, last = 0, length
+        if start_date is not None:
+            first = min(max(0, (_utc_seconds(start_date, earliest=True) - origin - self._step // 2) // self._step), length)
+        if end_date is not None:
+            last = min(max(0, (_utc_seconds(end_date, earliest=False) - origin + self._step // 2) // self._step + 1), length)
+        last = max(first, last)
+
+        offsets = maps["timestamp"][first:last]
+        in_range = offsets != GAP
+        exact = _local_seconds(origin + np.arange(first, last, dtype=np.int64) * self._step + np.where(in_range, offsets, 0))
+        if start_date is not None:
+            in_range &= exact >= np.datetime64(start_date, "s").astype(np.int64)
+        if end_date is not None:
+            in_range &= exact <= np.datetime64(end_date, "s").astype(np.int64)
+        if in_range.any():
+            trim_start = int(in_range.argmax())
+            trim_end = len(in_range) - int(in_range[::-1].argmax())
+        else:
+            trim_start = trim_end = 0
+
+        datetimes = exact[trim_start:trim_end].astype("datetime64[s]")
+        datetimes[~in_range[trim_start:trim_end]] = np.datetime64("NaT")
+        arrays = {"datetime": datetimes}
+        for column in columns:
+            arrays[column] = maps[column][first + trim_start:first + trim_end]
+        return arrays
+
+    def info(self):
+        '''Returns a summary of the store: origin, slots, readings, collisions, completeness and size on disk.'''
+        meta = self.meta()
+        if meta is None:
+            return {"slots": 0, "readings": 0}
+        maps = self._read_maps()
+        return {
+            "origin": meta["origin"].isoformat(),
+            "slots": len(maps["timestamp"]),
+            "readings": int((maps["timestamp"] != GAP).sum()),
+            "collisions": meta["collisions"],
+            "complete": meta["complete"],
+            "bytes": sum(os.path.getsize(self._file(column)) for column in self.columns + ("timestamp",)),
+        }
+
+def _utc_seconds(local_time, earliest):
+    '''Seconds since the epoch in UTC of a naive local time, the earlier or later one if it is in the repeated hour.'''
+    utc_time = pd.Timestamp(local_time).tz_localize(LOCAL_TIMEZONE, ambiguous=earliest, nonexistent='shift_forward').tz_convert('UTC')
+    return int(np.datetime64(utc_time.tz_localize(None), "s").astype(np.int64))
+
+def _local_seconds(utc_seconds):
+    '''Converts an array of UTC seconds since the epoch to naive local seconds since the epoch.'''
+    local = pd.DatetimeIndex(utc_seconds.astype("datetime64[s]")).tz_localize('UTC').tz_convert(LOCAL_TIMEZONE).tz_localize(None)
+    return local.to_numpy().astype("datetime64[s]").astype(np.int64)
+
+def _iter_utc_readings(after=None, chunk_rows=50000):
+    '''Yields (UTC timestamps, {column: values}) for the readings in the data table in UTC order, after a UTC time if given.'''
+    from weather_helper import get_connection, MEASUREMENT_COLUMNS
+
+    query = f"SELECT utc_timestamp, {', '.join(MEASUREMENT_COLUMNS)} FROM data WHERE utc_timestamp IS NOT NULL"
+    params = None
+    if after is not None:
+        query += " AND utc_timestamp > %s"
+        params = (after,)
+    with get_connection() as cnx:
+        with cnx.cursor(buffered=False) as cursor:
+            cursor.execute(query + " ORDER BY utc_timestamp", params)
+            while True:
+                rows = cursor.fetchmany(chunk_rows)
+                if not rows:
+                    break
+                columns = list(zip(*rows))
+                yield np.array(columns[0], dtype="datetime64[s]"), {column: np.array(values, dtype=np.float64) for column, values in zip(MEASUREMENT_COLUMNS, columns[1:])}
+
+def rebuild(path=GRID_DIR, chunk_rows=50000):
+    '''
+    Builds the grid store from every reading in MySQL and swaps it in place of the existing store. The readings'
+    utc_timestamp column is needed, see weather_migrate.py.
+
+    The new store is written next to the old one and then renamed over it, so readers keep using the old files until
+    the swap. Readings stored by the server while the rebuild was running are copied across afterwards.
+
+    Returns:
+        dict: GridStore.info() of the new store.
+    '''
+    from weather_helper import MEASUREMENT_COLUMNS
+
+    building = path.rstrip(os.sep) + ".building"
+    shutil.rmtree(building, ignore_errors=True)
+    store = GridStore(building, MEASUREMENT_COLUMNS)
+    latest = None
+    for timestamps, values in _iter_utc_readings(chunk_rows=chunk_rows):
+        store.append(timestamps, values)
+        latest = timestamps[-1]
+    if store.meta() is not None:
+        # Readings less than an interval apart can't all be held, so the store stays incomplete if any collided
+        store._save_meta(dict(store.meta(), complete=store.meta()["collisions"] == 0))
+
+    old = path.rstrip(os.sep) + ".old"
+    shutil.rmtree(old, ignore_errors=True)
+    if os.path.exists(path):
+        os.rename(path, old)
+    os.rename(building, path)
+    shutil.rmtree(old, ignore_errors=True)
+
+    # Catch up with readings that arrived during the rebuild, which the server wrote to the old store
+    store = GridStore(path, MEASUREMENT_COLUMNS)
+    if latest is not None:
+        for timestamps, values in _iter_utc_readings(after=latest.astype(datetime), chunk_rows=chunk_rows):
+            store.append(timestamps, values)
+    return store.info()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Build and inspect the memory-mapped grid store of readings")
+    parser.add_argument('--rebuild', action='store_true', help="rebuild the store from every reading in MySQL")
+    parser.add_argument('--info', action='store_true', help="print a summary of the store")
+    args = parser.parse_args()
+
+    if not (args.rebuild or args.info):
+        parser.error("nothing to do, use --rebuild and/or --info")
+
+    if args.rebuild:
+        start = time.perf_counter()
+        rebuild()
+        print(f"Grid store rebuilt in {time.perf_counter() - start:.1f}s")
+    if args.info:
+        from weather_helper import MEASUREMENT_COLUMNS
+        for key, value in GridStore(GRID_DIR, MEASUREMENT_COLUMNS).info().items():
+            print(f"{key}: {value}")
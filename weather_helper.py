@@ -1,13 +1,85 @@
-import mysql.connector
 from datetime import datetime, timedelta
 from dateutil import tz
+from functools import lru_cache
 import numpy as np
 import pandas as pd
-from sql_config import config
+import threading
+import itertools
+import time
+import os
+import json
+import socket
+import sql_config
+from weather_grid import GridStore, GRID_DIR, GRID_CLOCK
+from weather_backend import create_backend
+from weather_cache import SharedCache, SHARED_CACHE_PATH
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:
+    pa = None  # The archive of closed months is unavailable without pyarrow
+
+# Storage backend (MySQL or SQLite), chosen with backend in sql_config.py
+backend = create_backend()
+DatabaseError = backend.Error
+
+# Cache of query results and rendered figures shared by every app. Enable with use_shared_cache = True in sql_config.py
+USE_SHARED_CACHE = getattr(sql_config, 'use_shared_cache', False)
+shared_cache = SharedCache(SHARED_CACHE_PATH) if USE_SHARED_CACHE else None
+
+def checkout_connection():
+    '''
+    Takes a healthy connection from the storage backend: from the shared MySQL connection pool, or this thread's
+    SQLite connection.
+
+    The pool pings each connection as it is checked out and reconnects it if the server has dropped it.
+    If the pool is exhausted the call waits up to POOL_TIMEOUT seconds for a connection to be returned.
+
+    Returns:
+        A DB-API connection whose cursors take %s placeholders. Calling close() returns it to the pool rather than closing it.
+
+    Usage:
+        cnx = checkout_connection()
+        try:
+            cursor = cnx.cursor()
+            ...
+        finally:
+            cnx.close()
+
+    Exceptions:
+        - Raises DatabaseError if no healthy connection could be obtained.
+    '''
+    return backend.checkout_connection()
+
+def get_connection():
+    '''
+    Context manager that checks a connection out of the storage backend and returns it afterwards.
+
+    Usage:
+        with get_connection() as cnx:
+            with cnx.cursor() as cursor:
+                cursor.execute("SELECT COUNT(*) FROM data")
+                count = cursor.fetchone()[0]
+    '''
+    return backend.connection()
+
+def get_pool_stats():
+    '''
+    Returns a snapshot of the connection pool statistics.
+
+    Returns:
+        dict: pool_size, checkouts, handshakes (new TCP+auth connections including reconnects),
+              handshake_seconds, checkout_wait_seconds, reconnects and failures.
+              avg_checkout_ms is the mean time spent obtaining a connection per checkout.
+    '''
+    stats = backend.pool_stats()
+    stats["avg_checkout_ms"] = round(1000 * stats["checkout_wait_seconds"] / stats["checkouts"], 3) if stats["checkouts"] else 0.0
+    return stats
 
 def read_data_from_db(query, params=None):
     '''
-    Executes a SQL query against a MySQL database and returns the results.
+    Executes a SQL query against the database (MySQL or SQLite, see weather_backend.py) and returns the results.
 
     Parameters:
         query (str): A string containing the SQL query to be executed.
@@ -31,23 +103,394 @@ def read_data_from_db(query, params=None):
         data = pd.DataFrame(raw_data, columns=("id", "datetime", "temperature", "pressure", "humidity", "rain", "rain_rate", "luminance", "wind_speed", "wind_direction", "day", "week", "month", "year"))
 
     Notes:
-        - Ensure that the MySQL database configuration (`host`, `databasename`, `username`, `password`) is correctly set up.
-        - The function uses the mysql.connector library to connect to the MySQL database.
+        - Ensure that the MySQL database configuration (`host`, `databasename`, `username`, `password`) is correctly set up,
+          or that backend = "sqlite" is set in sql_config.py.
+        - Connections are taken from a shared pool (see `get_connection`) rather than opened per query.
+          If the connection drops mid-query the query is retried once on a fresh connection.
         - The returned data needs to be converted into a pandas DataFrame manually.
 
     Exceptions:
-        - Raises mysql.connector.Error if there is an issue with the MySQL connection or query execution.
+        - Errors from the database connection or query execution are printed and None is returned.
     '''
-    try:
-        with mysql.connector.connect(**config) as cnx:
-            with cnx.cursor() as cursor:
-                cursor.execute(query, params)
-                data = cursor.fetchall()
-                return data
-    except mysql.connector.Error as err:
-        print(f"Something went wrong with MySQL connection: {err}")
+    for attempt in range(2):
+        try:
+            with get_connection() as cnx:
+                with cnx.cursor() as cursor:
+                    cursor.execute(query, params)
+                    data = cursor.fetchall()
+                    return data
+        except backend.RETRY_ERRORS as err:
+            if attempt == 0:
+                continue
+            print(f"Something went wrong with the {backend.name} connection: {err}")
+        except DatabaseError as err:
+            print(f"Something went wrong with the {backend.name} connection: {err}")
+            return None
+
+DATA_COLUMNS = ("id", "datetime", "temperature", "pressure", "humidity", "rain", "rain_rate", "luminance", "wind_speed", "wind_direction", "day", "week", "month", "year")
+MEASUREMENT_COLUMNS = ("temperature", "pressure", "humidity", "rain", "rain_rate", "luminance", "wind_speed", "wind_direction")
+CALENDAR_COLUMNS = ("day", "week", "month", "year")
+
+def _to_frame(rows, columns=DATA_COLUMNS):
+    '''
+    Converts raw rows from the data table into a DataFrame with consistent dtypes.
+    '''
+    data = pd.DataFrame(rows if rows is not None else [], columns=columns)
+    if "datetime" in columns:
+        data["datetime"] = pd.to_datetime(data["datetime"])
+    data = data.astype({column: "float64" for column in MEASUREMENT_COLUMNS if column in columns})
+    data = data.astype({column: "int64" for column in ("id",) + CALENDAR_COLUMNS if column in columns})
+    return data
+
+# In-memory cache settings
+CACHE_ENABLED = True
+CACHE_WINDOW_DAYS = 400  # Covers "year" plus any week or yesterday that straddles New Year
+CACHE_MAX_ROWS = 50000  # ~520 days of 15 minute readings
+CACHE_REFRESH_SECONDS = 5  # Minimum time between tail refreshes
+
+class TimeSeriesCache:
+    '''
+    Keeps the most recent window of the data table in memory and answers range queries by slicing it.
+
+    On first use the cache loads every row newer than `window_days` ago. After that each refresh only
+    fetches rows with an id greater than the last id it holds, so a page view costs at most one small
+    query. Rows older than the window, or beyond `max_rows`, are evicted from the front of the frame.
+    A range that starts before the oldest cached row fetches the older rows once and keeps them, so
+    the cache then covers every range down to that start. Ranges whose older rows would not fit in
+    `max_rows` fall through to the database.
+
+    Parameters:
+        window_days (int): Number of days of history to keep in memory.
+        max_rows (int): Upper bound on the number of cached rows.
+        refresh_interval (float): Minimum number of seconds between tail refreshes.
+
+    Usage:
+        cache = TimeSeriesCache(window_days=30)
+        data = cache.slice(datetime(2024, 5, 1), datetime(2024, 5, 2))  # None if not covered
+        cache.invalidate()  # e.g. after editing rows in the database
+    '''
+    def __init__(self, window_days=CACHE_WINDOW_DAYS, max_rows=CACHE_MAX_ROWS, refresh_interval=CACHE_REFRESH_SECONDS):
+        self.window_days = window_days
+        self.max_rows = max_rows
+        self.refresh_interval = refresh_interval
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self._reset()
+
+    def _reset(self):
+        self._data = None
+        self._last_id = 0
+        self._window_start = None
+        self._extended_start = None  # Lowest start fetched for a range older than the window
+        self._last_refresh = 0.0
+
+    def invalidate(self):
+        '''
+        Drops everything held in memory. The next request reloads the full window.
+        '''
+        with self._lock:
+            self._reset()
+
+    def refresh(self, force=False):
+        '''
+        Loads the window on first use, then appends rows newer than the last cached id and evicts old rows.
+        Returns False if the database could not be read and nothing is cached.
+        '''
+        with self._lock:
+            if not force and self._data is not None and time.monotonic() - self._last_refresh < self.refresh_interval:
+                return True
+
+            window_start = (datetime.now() - timedelta(days=self.window_days)).replace(hour=0, minute=0, second=0, microsecond=0)
+            if self._data is None:
+                rows = read_data_from_db(*_build_range_query(start=window_start, order_by="timestamp"))
+                if rows is None:
+                    return False
+                self._data = _to_frame(rows)
+                self._window_start = window_start
+            else:
+                rows = read_data_from_db(*_build_range_query(after_id=self._last_id))
+                if rows:
+                    new_data = _to_frame(rows)
+                    new_data = new_data[new_data["datetime"] >= self._window_start]
+                    self._data = pd.concat([self._data, new_data], ignore_index=True)
+                    # Backlog uploads can arrive with older timestamps than rows already held
+                    if not self._data["datetime"].is_monotonic_increasing:
+                        self._data = self._data.sort_values("datetime", kind="stable", ignore_index=True)
+
+            if len(self._data):
+                self._last_id = max(self._last_id, int(self._data["id"].max()))
+            self._evict(window_start)
+            self._last_refresh = time.monotonic()
+            return True
+
+    def _evict(self, window_start):
+        # Rows fetched for an older range stay until max_rows pushes them out
+        keep_from = window_start if self._extended_start is None else min(window_start, self._extended_start)
+        if keep_from > self._window_start:
+            self._data = self._data[self._data["datetime"] >= keep_from].reset_index(drop=True)
+            self._window_start = keep_from
+        if len(self._data) > self.max_rows:
+            self._data = self._data.iloc[-self.max_rows:].reset_index(drop=True)
+            # The cache now only covers ranges that start at or after the oldest remaining row
+            self._window_start = self._data["datetime"].iloc[0].to_pydatetime()
+            self._extended_start = None
+
+    def _extend(self, start_date):
+        '''
+        Fetches the rows from start_date up to the oldest cached row and keeps them, lowering the cached
+        window to start_date. Returns False, leaving the cache unchanged, if they could not be read or
+        would not fit in max_rows.
+        '''
+        start_date = pd.Timestamp(start_date).to_pydatetime()
+        # Counted first, so a range too long to keep isn't fetched twice
+        count = read_data_from_db("SELECT COUNT(*) FROM data WHERE timestamp >= %s AND timestamp < %s", (start_date, self._window_start))
+        if count is None or len(self._data) + count[0][0] > self.max_rows:
+            return False
+        rows = read_data_from_db(*_build_range_query(start=start_date, end=self._window_start, order_by="timestamp"))
+        if rows is None:
+            return False
+        older = _to_frame(rows)
+        # The end bound is inclusive, so rows at the old window start are already held
+        older = older[~older["id"].isin(self._data["id"])]
+        self._data = pd.concat([older, self._data], ignore_index=True)
+        self._window_start = self._extended_start = start_date
+        if len(self._data):
+            self._last_id = max(self._last_id, int(self._data["id"].max()))
+        return True
+
+    def slice(self, start_date, end_date):
+        '''
+        Returns a copy of the cached rows with start_date <= datetime <= end_date, or None if the
+        range could not be covered (see _extend) or the cache could not be loaded.
+        '''
+        with self._lock:
+            if not self.refresh():
+                self.misses += 1
+                return None
+            if start_date < self._window_start:
+                self.misses += 1
+                if not self._extend(start_date):
+                    return None
+            else:
+                self.hits += 1
+            timestamps = self._data["datetime"].values
+            lo = timestamps.searchsorted(np.datetime64(start_date), side="left")
+            hi = timestamps.searchsorted(np.datetime64(end_date), side="right")
+            # A copy, so callers can modify it without changing the cache
+            return self._data.iloc[lo:hi].reset_index(drop=True).copy()
+
+    def latest(self):
+        '''
+        Returns the most recent cached row as a single row DataFrame, or None if nothing is cached.
+        '''
+        with self._lock:
+            if not self.refresh() or len(self._data) == 0:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return self._data.iloc[-1:].reset_index(drop=True)
+
+    def info(self):
+        '''
+        Returns a dict describing the cache contents and hit rate.
+        '''
+        with self._lock:
+            rows = 0 if self._data is None else len(self._data)
+            return {
+                "rows": rows,
+                "bytes": 0 if self._data is None else int(self._data.memory_usage(deep=True).sum()),
+                "window_start": self._window_start,
+                "last_id": self._last_id,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+_cache = TimeSeriesCache()
+
+def invalidate_cache():
+    '''
+    Explicitly invalidates the in-memory get_data cache, e.g. after rows have been edited or deleted in the database.
+    '''
+    _cache.invalidate()
+
+def get_cache_info():
+    '''
+    Returns statistics for the in-memory get_data cache (rows, bytes, window_start, last_id, hits, misses).
+    '''
+    return _cache.info()
+
+def get_time_range(arg, now=None):
+    '''
+    Determines the start and end dates for a get_data range string.
+
+    Parameters:
+        arg (str): A range string accepted by get_data, e.g. "today", "week=3" or "year".
+        now (datetime, optional): The reference time. Defaults to datetime.now().
+
+    Returns:
+        tuple: (start_date, end_date) as datetimes, or (None, None) for "latest", "first" and "all".
 
-def get_data(*args):
+    Raises:
+        ValueError: If the argument is not a recognised range string or the month number is out of range.
+    '''
+    if now is None:
+        now = datetime.now()
+
+    if arg in ["latest", "first"]:
+        return None, None
+    elif arg == "today":
+        return datetime(now.year, now.month, now.day), datetime(now.year, now.month, now.day) + timedelta(days=1) - timedelta(seconds=1)
+    elif "day=" in arg:
+        day_num = int(arg.split("=")[1])
+        start_date = datetime(now.year, 1, 1) + timedelta(days=day_num-1)
+        end_date = start_date + timedelta(days=1)
+        return start_date, end_date - timedelta(seconds=1)
+    elif arg == "last24h":
+        end_date = now
+        start_date = end_date - timedelta(days=1)
+        return start_date, end_date
+    elif arg == "yesterday":
+        start_date = datetime(now.year, now.month, now.day) - timedelta(days=1)
+        end_date = datetime(now.year, now.month, now.day)
+        return start_date, end_date
+    elif arg == "week":
+        start_date = (now - timedelta(days=now.weekday())).replace(hour=0, minute=0, second=0, microsecond=0)  # Monday of the current week at midnight
+        end_date = start_date + timedelta(days=7)  # Sunday at 23:59:59.999999
+        return start_date, end_date - timedelta(seconds=1)
+    elif "week=" in arg:
+        week_num = int(arg.split("=")[1])
+        start_date = datetime(now.year, 1, 1) + timedelta(weeks=week_num-1)
+        end_date = start_date + timedelta(weeks=1)
+        return start_date, end_date - timedelta(seconds=1)
+    elif arg == "last7days":
+        start_date = (now - timedelta(days=6)).replace(hour=0, minute=0, second=0, microsecond=0)  # Start of the day seven days ago
+        end_date = now
+        return start_date, end_date
+    elif "month" in arg:
+        if "=" in arg:
+            # Extract the month number from the argument
+            month_num = int(arg.split("=")[1])
+            if month_num < 1 or month_num > 12:
+                raise ValueError("Invalid month number")
+        else:
+            month_num = now.month
+
+        start_date = datetime(now.year, month_num, 1)
+        if month_num == 12:
+            end_date = datetime(now.year + 1, 1, 1)
+        else:
+            end_date = datetime(now.year, month_num + 1, 1)
+        return start_date, end_date - timedelta(seconds=1)
+    elif arg == "year":
+        return datetime(now.year, 1, 1), datetime(now.year + 1, 1, 1) - timedelta(seconds=1)
+    elif "year=" in arg:
+        year_num = int(arg.split("=")[1])
+        start_date = datetime(year_num, 1, 1)
+        end_date = datetime(year_num+1, 1, 1)
+        return start_date, end_date - timedelta(seconds=1)
+    elif arg == "all":
+        return None, None
+    else:
+        raise ValueError("Invalid argument")
+
+# Name of each DataFrame column in the data table, where they differ
+SQL_COLUMNS = {"datetime": "timestamp"}
+
+@lru_cache(maxsize=128)
+def _range_sql(columns, has_start, has_end, has_after_id, order_by, has_limit):
+    '''
+    Returns the SQL text for one shape of range query. The text only depends on which filters are present,
+    not their values, so it is built once and every call with the same shape sends an identical statement.
+    '''
+    conditions = []
+    if has_start:
+        conditions.append("timestamp >= %s")
+    if has_end:
+        conditions.append("timestamp <= %s")
+    if has_after_id:
+        conditions.append("id > %s")
+
+    query = f"SELECT {', '.join(SQL_COLUMNS.get(column, column) for column in columns)} FROM data"
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    if order_by:
+        query += f" ORDER BY {order_by}"
+    if has_limit:
+        query += " LIMIT %s"
+    return query
+
+def _build_range_query(columns=None, start=None, end=None, after_id=None, limit=None, order_by=None):
+    '''
+    Builds a SELECT on the data table with bound parameters rather than values interpolated into the SQL.
+
+    Parameters:
+        columns (sequence, optional): Columns to select, named as in DATA_COLUMNS. Defaults to all of them.
+        start, end (datetime, optional): Inclusive timestamp bounds.
+        after_id (int, optional): Only return rows with a larger id (keyset pagination).
+        limit (int, optional): Maximum number of rows to return.
+        order_by (str, optional): ORDER BY clause, e.g. "id" or "timestamp DESC".
+
+    Returns:
+        tuple: (sql, params) ready for cursor.execute().
+
+    Raises:
+        ValueError: If a column is not in DATA_COLUMNS.
+    '''
+    columns = DATA_COLUMNS if columns is None else tuple(columns)
+    unknown = [column for column in columns if column not in DATA_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown column(s): {', '.join(unknown)}")
+
+    # Drivers only bind plain datetimes, not subclasses such as pd.Timestamp
+    params = [pd.Timestamp(value).to_pydatetime() for value in (start, end) if value is not None]
+    if after_id is not None:
+        params.append(int(after_id))
+    if limit is not None:
+        params.append(int(limit))
+    query = _range_sql(columns, start is not None, end is not None, after_id is not None, order_by, limit is not None)
+    return query, tuple(params)
+
+def stream_rows(columns=None, start=None, end=None, after_id=None, limit=None, order_by=None, chunk_rows=1000):
+    '''
+    Yields rows from the data table in chunks without holding the whole result in memory.
+
+    The query runs on an unbuffered cursor, so MySQL streams the result set and each fetchmany() only pulls the
+    next chunk_rows rows over the connection. The pooled connection is held until the generator is exhausted or closed.
+
+    Parameters:
+        columns, start, end, after_id, limit, order_by: As for _build_range_query.
+        chunk_rows (int, optional): Rows per chunk. Defaults to 1000.
+
+    Yields:
+        list of tuples: Up to chunk_rows rows, with values in the order of `columns`.
+
+    Usage:
+        for rows in stream_rows(["datetime", "temperature"], start=datetime(2024, 1, 1)):
+            ...
+    '''
+    query, params = _build_range_query(columns, start, end, after_id, limit, order_by)
+    with get_connection() as cnx:
+        cursor = cnx.cursor(buffered=False)
+        finished = False
+        try:
+            cursor.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(chunk_rows)
+                if not rows:
+                    finished = True
+                    break
+                yield rows
+        finally:
+            if not finished:
+                # Abandoned part way through (e.g. the client disconnected), discard the rest so the connection can be reused
+                try:
+                    cnx.consume_results()
+                except DatabaseError:
+                    pass
+            cursor.close()
+
+def get_data(*args, use_cache=True, columns=None, compact=False):
     """
     Fetches data from a database based on the provided time range criteria.
 
@@ -69,12 +512,17 @@ def get_data(*args):
                 - "year=n": Returns data for the specified year.
                 - "all": Returns all the data in the database.
             - Or two datetime objects defining the start and end dates for the data fetch.
+        use_cache (bool, optional): Serve the request from the in-memory cache where possible. Defaults to True.
+        columns (list, optional): Only return these columns (named as in DATA_COLUMNS, e.g. ["datetime", "temperature"]).
+            Defaults to all columns. Only the requested columns are read from the database.
+        compact (bool, optional): Return a smaller DataFrame indexed by datetime (see Note). Defaults to False.
 
     Returns:
         pd.DataFrame: A DataFrame containing data fetched from the database.
 
     Raises:
-        ValueError: If the passed argument(s) don't match any of the expected criteria or if the month number is out of range.
+        ValueError: If the passed argument(s) don't match any of the expected criteria, the month number is out of range
+            or a column is not recognised.
 
     Usage Examples:
         1. Get the latest data:
@@ -87,98 +535,681 @@ def get_data(*args):
            data = get_data("day=50")
         5. Get data from Jan 1, 2023 to Jan 31, 2023:
            data = get_data(datetime(2023, 1, 1), datetime(2023, 1, 31))
+        6. Get just the temperature for the last 7 days:
+           data = get_data("last7days", columns=["datetime", "temperature"])
+        7. Get the whole history as a compact DataFrame:
+           data = get_data("all", compact=True)
 
     Note:
-        The function internally uses a helper function 'get_time_range' to compute date ranges based on the argument string.
-    
-        Inner Function:
-            get_time_range(arg: str) -> Tuple[Optional[datetime], Optional[datetime]]:
-                - Determines the start and end dates based on a string argument.
-                - Used internally by the main function to compute date ranges.
+        The function uses the helper function 'get_time_range' to compute date ranges based on the argument string.
+
+        Recent history is served from an in-memory cache (see TimeSeriesCache) which only fetches rows newer
+        than the last one it holds. Pass use_cache=False to always query the database.
+
+        With compact=True the DataFrame has a DatetimeIndex named 'datetime' instead of a column, float32
+        measurements and wind_direction as a categorical. id and the day/week/month/year columns are left out
+        unless they are asked for in `columns`, in which case the calendar columns are derived from the index.
+        Rows read from the database go through get_arrays.
+
+        If use_grid_store is set in sql_config.py and the grid store has been built with weather_grid.py --rebuild,
+        ranges that don't need the id column are sliced from the memory-mapped grid store instead of MySQL.
+
+        If use_shared_cache is set in sql_config.py, results read from the archive or the database are kept in a cache
+        shared by the server, client and dashboard (see weather_cache.py) until a new reading arrives or they expire.
+
+        If use_archive is set in sql_config.py, months that have been archived by weather_archive.py are read from
+        the archive and only the readings after the last archived month are read from MySQL.
     """
-    
-    now = datetime.now()
-
-    def get_time_range(arg):
-        if arg in ["latest", "first"]:
-            return None, None
-        elif arg == "today":
-            return datetime(now.year, now.month, now.day), datetime(now.year, now.month, now.day) + timedelta(days=1) - timedelta(seconds=1)
-        elif "day=" in arg:
-            day_num = int(arg.split("=")[1])
-            start_date = datetime(now.year, 1, 1) + timedelta(days=day_num-1)
-            end_date = start_date + timedelta(days=1)
-            return start_date, end_date - timedelta(seconds=1)
-        elif arg == "last24h":
-            end_date = now
-            start_date = end_date - timedelta(days=1)
-            return start_date, end_date
-        elif arg == "yesterday":
-            start_date = datetime(now.year, now.month, now.day) - timedelta(days=1)
-            end_date = datetime(now.year, now.month, now.day)
-            return start_date, end_date
-        elif arg == "week":
-            start_date = (now - timedelta(days=now.weekday())).replace(hour=0, minute=0, second=0, microsecond=0)  # Monday of the current week at midnight
-            end_date = start_date + timedelta(days=7)  # Sunday at 23:59:59.999999
-            return start_date, end_date - timedelta(seconds=1)
-        elif "week=" in arg:
-            week_num = int(arg.split("=")[1])
-            start_date = datetime(now.year, 1, 1) + timedelta(weeks=week_num-1)
-            end_date = start_date + timedelta(weeks=1)
-            return start_date, end_date - timedelta(seconds=1)
-        elif arg == "last7days":
-            start_date = (now - timedelta(days=6)).replace(hour=0, minute=0, second=0, microsecond=0)  # Start of the day seven days ago
-            end_date = now
-            return start_date, end_date
-        elif "month" in arg:
-            if "=" in arg:
-                # Extract the month number from the argument
-                month_num = int(arg.split("=")[1])
-                if month_num < 1 or month_num > 12:
-                    raise ValueError("Invalid month number")
-            else:
-                month_num = now.month
 
-            start_date = datetime(now.year, month_num, 1)
-            if month_num == 12:
-                end_date = datetime(now.year + 1, 1, 1)
-            else:
-                end_date = datetime(now.year, month_num + 1, 1)
-            return start_date, end_date - timedelta(seconds=1)
-        elif arg == "year":
-            return datetime(now.year, 1, 1), datetime(now.year + 1, 1, 1) - timedelta(seconds=1)
-        elif "year=" in arg:
-            year_num = int(arg.split("=")[1])
-            start_date = datetime(year_num, 1, 1)
-            end_date = datetime(year_num+1, 1, 1)
-            return start_date, end_date - timedelta(seconds=1)
-        elif arg == "all":
-            return None, None
+    requested = None if columns is None else tuple(columns)
+    columns = DATA_COLUMNS if columns is None else tuple(columns)
+    unknown = [column for column in columns if column not in DATA_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown column(s): {', '.join(unknown)}")
+
+    start_date, end_date, order_by, limit = _resolve_range(args)
+
+    if use_cache and CACHE_ENABLED:
+        if args == ("latest",):
+            data = _cache.latest()
+        elif args in [("first",), ("all",)]:
+            data = None
         else:
-            raise ValueError("Invalid argument")
+            data = _cache.slice(start_date, end_date)
+        if data is not None:
+            if compact:
+                return _compact_frame(data, requested)
+            return data[list(columns)] if columns != DATA_COLUMNS else data
+
+    if compact:
+        # Compact frames are built from typed arrays rather than a DataFrame of Python objects
+        columns = ("datetime",) + tuple(column for column in requested or MEASUREMENT_COLUMNS if column in MEASUREMENT_COLUMNS or column == "id")
+
+    # The grid store has no ids, but otherwise holds every reading on a 15 minute grid
+    if grid_store is not None and limit is None and "id" not in columns:
+        data = read_grid(start_date, end_date, columns, compact, requested)
+        if data is not None:
+            return data
+
+    # Anything read from the archive or the database is shared with the other apps (see weather_cache.py)
+    if use_cache and shared_cache is not None:
+        # Keyed on the resolved range, as relative ranges such as "today" move with the clock
+        key = ("get_data", start_date, end_date, order_by, limit, requested, compact)
+        data = shared_cache.get(key)
+        if data is None:
+            generation = shared_cache.generation()
+            data = _read_stored(columns, start_date, end_date, order_by, limit, compact, requested)
+            if len(data):  # An empty result may just mean the database was unavailable
+                shared_cache.put(key, data, generation=generation)
+        return data
+
+    return _read_stored(columns, start_date, end_date, order_by, limit, compact, requested)
+
+def _read_stored(columns, start_date, end_date, order_by=None, limit=None, compact=False, requested=None):
+    '''
+    Reads a range from the archive and/or the database, see get_data.
+    '''
+    # Closed months are read from the archive (see weather_archive.py), only later readings come from MySQL
+    if USE_ARCHIVE and limit is None:
+        boundary = archive_boundary()
+        if boundary is not None and (start_date is None or start_date < boundary):
+            frames = [read_archive(start_date, end_date, columns)]
+            if compact:
+                frames[0] = _compact_frame(frames[0], requested)
+            if end_date is None or end_date >= boundary:
+                frames.append(_read_database(columns, boundary, end_date, compact=compact, requested=requested))
+            return pd.concat(frames) if compact else pd.concat(frames, ignore_index=True)
+
+    return _read_database(columns, start_date, end_date, order_by, limit, compact, requested)
 
+def _read_database(columns, start_date, end_date, order_by=None, limit=None, compact=False, requested=None):
+    '''
+    Reads a range from MySQL as a DataFrame, or as a compact DataFrame (see get_data) built with _fetch_arrays.
+    '''
+    if compact:
+        return _compact_frame(_fetch_arrays(columns, start_date, end_date, order_by, limit), requested)
+
+    # Dates are sent as bound parameters, so the SQL text is the same for every call with the same columns
+    query, params = _build_range_query(columns, start_date, end_date, limit=limit, order_by=order_by)
+    return _to_frame(read_data_from_db(query, params), columns)
+
+def _resolve_range(args):
+    '''
+    Converts get_data style arguments into (start, end, order_by, limit) for _build_range_query.
+
+    Raises:
+        ValueError: If the arguments are not a range string or a pair of datetimes.
+    '''
     if len(args) == 1 and isinstance(args[0], str):
-        arg = args[0]
-        start_date, end_date = get_time_range(arg)
-
-        if arg == "latest":
-            query = "SELECT * FROM data ORDER BY Timestamp DESC LIMIT 1"
-        elif arg == "first":
-            query = "SELECT * FROM data WHERE id = 1"
-        elif arg == "all":
-            query = "SELECT * FROM data"
-        else:
-            query = f"SELECT * FROM data WHERE Timestamp BETWEEN '{start_date}' AND '{end_date}'"
+        start_date, end_date = get_time_range(args[0])
+        if args[0] == "latest":
+            return None, None, "timestamp DESC", 1
+        elif args[0] == "first":
+            return None, None, "id", 1
+        return start_date, end_date, None, None
     elif len(args) == 2 and all(isinstance(a, datetime) for a in args):
-        start_date, end_date = args
-        query = f"SELECT * FROM data WHERE Timestamp BETWEEN '{start_date}' AND '{end_date}'"
+        return pd.Timestamp(args[0]).to_pydatetime(), pd.Timestamp(args[1]).to_pydatetime(), None, None
     else:
         raise ValueError("Invalid arguments")
 
-    data = pd.DataFrame(read_data_from_db(query), columns=("id", "datetime", "temperature", "pressure", "humidity", "rain", "rain_rate", "luminance", "wind_speed", "wind_direction", "day", "week", "month", "year"))
+# dtypes used by get_arrays, sized for the precision of the data table
+ARRAY_DTYPES = dict(
+    {"id": np.int64, "datetime": "datetime64[s]"},
+    **{column: np.float32 for column in MEASUREMENT_COLUMNS},
+    **{column: np.int16 for column in CALENDAR_COLUMNS},
+)
+READING_INTERVAL = timedelta(minutes=15)
 
+DATETIME_WIDTH = 19  # Length of a DATETIME in MySQL's text protocol, e.g. b"2024-01-01 12:00:00"
+
+def _decode_raw_column(values, dtype):
+    '''
+    Decodes one column of a raw cursor chunk (bytes/bytearray text values, None for NULL) into a NumPy array.
+
+    Numbers are parsed one at a time straight into a preallocated array with np.fromiter, so no list of Python
+    floats is built, and datetimes are converted as a single buffer. NULL measurements become NaN (0 in integer columns).
+    Backends without a raw text protocol (SQLite) return Python values, which are converted directly.
+    '''
+    if not isinstance(next((value for value in values if value is not None), b""), (bytes, bytearray)):
+        return np.array(values, dtype=dtype)
+    if np.dtype(dtype).kind == "M":
+        buffer = b"".join(values)
+        if len(buffer) == DATETIME_WIDTH * len(values):
+            return np.frombuffer(buffer, dtype=f"S{DATETIME_WIDTH}").astype(dtype)
+        return np.array([bytes(value) for value in values]).astype(dtype)
+
+    parse = float if np.dtype(dtype).kind == "f" else int
+    try:
+        return np.fromiter(map(parse, values), dtype=dtype, count=len(values))
+    except TypeError:
+        null = float("nan") if parse is float else 0
+        return np.fromiter((null if value is None else parse(value) for value in values), dtype=dtype, count=len(values))
+
+def _fill_arrays(chunks, columns, expected_rows=0):
+    '''
+    Copies chunks of raw rows into preallocated typed arrays, one per column.
+
+    The arrays are sized for expected_rows and doubled if more rows arrive, then trimmed in place
+    to the number of rows read.
+
+    Parameters:
+        chunks (iterable): Lists of raw row tuples, as returned by fetchmany() on a raw cursor.
+        columns (sequence): Column names, in the order of the values in each row.
+        expected_rows (int, optional): Initial size of the arrays.
+
+    Returns:
+        dict: Column name to NumPy array with the dtype from ARRAY_DTYPES.
+    '''
+    capacity = max(int(expected_rows), 1)
+    arrays = {column: np.empty(capacity, dtype=ARRAY_DTYPES[column]) for column in columns}
+    count = 0
+    for rows in chunks:
+        if count + len(rows) > capacity:
+            capacity = max(2 * capacity, count + len(rows))
+            for array in arrays.values():
+                array.resize(capacity, refcheck=False)
+        # Slicing a flattened chunk is much cheaper than transposing it with zip(*rows)
+        values = list(itertools.chain.from_iterable(rows))
+        for index, column in enumerate(columns):
+            arrays[column][count:count + len(rows)] = _decode_raw_column(values[index::len(columns)], ARRAY_DTYPES[column])
+        count += len(rows)
+    for array in arrays.values():
+        array.resize(count, refcheck=False)
+    return arrays
+
+def get_arrays(*args, columns=None, chunk_rows=10000):
+    '''
+    Fetches data like get_data but returns a NumPy array per column instead of a DataFrame.
+
+    Rows are read in chunks from an unbuffered raw cursor, which returns the values as undecoded text, and parsed
+    straight into preallocated arrays: datetime64[s] for the timestamp, float32 for the measurements and int16 for
+    day/week/month/year. This avoids building a Python object for every value, which is where most of the time
+    and memory of get_data goes for long ranges. The in-memory cache is not used.
+
+    Parameters:
+        *args: Any of the range arguments accepted by get_data.
+        columns (list, optional): Columns to fetch, named as in DATA_COLUMNS. Defaults to all columns.
+        chunk_rows (int, optional): Rows fetched from MySQL at a time. Defaults to 10000.
+
+    Returns:
+        dict: Column name to NumPy array. The arrays are empty if the query failed.
+
+    Raises:
+        ValueError: If the arguments are invalid or a column is not recognised.
+
+    Usage:
+        arrays = get_arrays("year", columns=["datetime", "temperature"])
+        hottest = arrays["datetime"][arrays["temperature"].argmax()]
+    '''
+    columns = DATA_COLUMNS if columns is None else tuple(columns)
+    start_date, end_date, order_by, limit = _resolve_range(args)
+    return _fetch_arrays(columns, start_date, end_date, order_by, limit, chunk_rows)
+
+def _fetch_arrays(columns, start_date, end_date, order_by=None, limit=None, chunk_rows=10000):
+    '''
+    Reads a range from MySQL with a raw cursor into typed NumPy arrays (see get_arrays).
+    '''
+    query, params = _build_range_query(columns, start_date, end_date, limit=limit, order_by=order_by)
+
+    # Size the arrays from the expected number of readings in the range
+    expected_rows = limit or chunk_rows
+    if start_date is not None and end_date is not None:
+        expected_rows = max(0, (min(end_date, datetime.now()) - start_date) // READING_INTERVAL + 1)
+
+    def chunks(cursor):
+        while True:
+            rows = cursor.fetchmany(chunk_rows)
+            if not rows:
+                return
+            yield rows
+
+    try:
+        with get_connection() as cnx:
+            with cnx.cursor(raw=True) as cursor:
+                cursor.execute(query, params)
+                return _fill_arrays(chunks(cursor), columns, expected_rows)
+    except DatabaseError as err:
+        print(f"Something went wrong with the {backend.name} connection: {err}")
+        return _fill_arrays([], columns)
+
+def _calendar_column(index, column):
+    '''Derives a calendar column from a DatetimeIndex, matching the values stored at ingest (%j, %W, %m and %Y).'''
+    if column == "day":
+        values = index.dayofyear
+    elif column == "week":
+        values = (index.dayofyear - 1 + 7 - index.weekday) // 7
+    elif column == "month":
+        values = index.month
+    else:
+        values = index.year
+    return np.asarray(values, dtype=np.int16)
+
+def _compact_frame(data, columns=None):
+    '''
+    Converts a DataFrame (or dict of arrays) with a 'datetime' column into the compact form returned by
+    get_data(compact=True). columns defaults to the measurements; id and calendar columns are only included if listed.
+    '''
+    index = pd.DatetimeIndex(data["datetime"], name="datetime")
+    compact = {}
+    for column in columns or MEASUREMENT_COLUMNS:
+        if column == "id":
+            compact[column] = np.asarray(data[column], dtype=np.int64)
+        elif column in CALENDAR_COLUMNS:
+            compact[column] = _calendar_column(index, column)
+        elif column == "wind_direction":
+            compact[column] = pd.Categorical(np.asarray(data[column], dtype=np.float32))
+        elif column in MEASUREMENT_COLUMNS:
+            compact[column] = np.asarray(data[column], dtype=np.float32)
+    return pd.DataFrame(compact, index=index)
+
+# Archive of closed months written by weather_archive.py. Enable with use_archive = True in sql_config.py
+ARCHIVE_DIR = getattr(sql_config, 'archive_dir', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'archive'))
+ARCHIVE_MANIFEST = "manifest.json"
+USE_ARCHIVE = getattr(sql_config, 'use_archive', False) and pa is not None
+
+_archive_manifest = {"mtime": None, "partitions": {}}
+
+def load_archive_manifest():
+    '''
+    Returns the archive partitions, keyed by "YYYY-MM", from the manifest written by weather_archive.py.
+
+    Each partition records its file, row count, checksum, the month it covers (start inclusive, end exclusive) and
+    the min/max of the timestamp and every measurement. The manifest is re-read only when the file changes.
+    '''
+    path = os.path.join(ARCHIVE_DIR, ARCHIVE_MANIFEST)
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return {}
+    if mtime != _archive_manifest["mtime"]:
+        with open(path) as f:
+            partitions = json.load(f)
+        for partition in partitions.values():
+            for key in ("start", "end", "min_datetime", "max_datetime"):
+                partition[key] = datetime.fromisoformat(partition[key])
+        _archive_manifest.update(mtime=mtime, partitions=partitions)
+    return _archive_manifest["partitions"]
+
+def archive_boundary():
+    '''
+    Returns the end of the archived history: every reading before it can be read from the archive. This is the end
+    of the last month in the unbroken run of archived months starting from the first, or None if nothing is archived.
+    '''
+    boundary = None
+    for key in sorted(load_archive_manifest()):
+        partition = _archive_manifest["partitions"][key]
+        if boundary is not None and partition["start"] != boundary:
+            break
+        boundary = partition["end"]
+    return boundary
+
+def read_archive(start_date=None, end_date=None, columns=None):
+    '''
+    Reads a range from the archive as a DataFrame with the same columns and dtypes as get_data.
+
+    Partitions outside the range are skipped using the min/max timestamps in the manifest, and partitions that lie
+    entirely inside it are returned without filtering. Files are memory-mapped, so pages are loaded on demand and
+    shared between processes through the OS page cache.
+
+    Parameters:
+        start_date, end_date (datetime, optional): Inclusive bounds. Defaults to the whole archive.
+        columns (sequence, optional): Columns to read, named as in DATA_COLUMNS. Defaults to all columns.
+    '''
+    columns = DATA_COLUMNS if columns is None else tuple(columns)
+    boundary = archive_boundary()
+    partitions = load_archive_manifest()
+    tables = []
+    for key in sorted(partitions):
+        partition = partitions[key]
+        if boundary is None or partition["start"] >= boundary:
+            break
+        if partition["rows"] == 0 or (start_date is not None and partition["max_datetime"] < start_date) \
+                or (end_date is not None and partition["min_datetime"] > end_date):
+            continue
+
+        with pa.memory_map(os.path.join(ARCHIVE_DIR, partition["path"])) as source:
+            table = pa.ipc.open_file(source).read_all().select(list(columns) if "datetime" in columns else ["datetime"] + list(columns))
+        if start_date is not None and partition["min_datetime"] < start_date:
+            table = table.filter(pc.greater_equal(table["datetime"], pa.scalar(start_date, table.schema.field("datetime").type)))
+        if end_date is not None and partition["max_datetime"] > end_date:
+            table = table.filter(pc.less_equal(table["datetime"], pa.scalar(end_date, table.schema.field("datetime").type)))
+        tables.append(table.select(list(columns)))
+
+    if not tables:
+        return _to_frame([], columns)
+    data = pa.concat_tables(tables).to_pandas()
+    data = data.astype({column: "float64" for column in MEASUREMENT_COLUMNS if column in columns})
+    return data.astype({column: "int64" for column in ("id",) + CALENDAR_COLUMNS if column in columns})
+
+# Memory-mapped grid store maintained by weather_server.py. Enable with use_grid_store = True in sql_config.py
+USE_GRID_STORE = getattr(sql_config, 'use_grid_store', False)
+grid_store = GridStore(GRID_DIR, MEASUREMENT_COLUMNS) if USE_GRID_STORE else None
+
+def read_grid(start_date=None, end_date=None, columns=None, compact=False, requested=None):
+    '''
+    Reads a range from the grid store as a DataFrame with the same columns and dtypes as get_data, or as a compact
+    DataFrame if compact is True. Empty slots are dropped. Returns None if the store does not hold the whole history
+    (it has not been rebuilt since readings were missed or collided, or since slots moved to UTC), so the caller can
+    fall back to MySQL.
+    '''
+    meta = grid_store.meta()
+    if meta is None or not meta["complete"] or meta.get("clock") != GRID_CLOCK:
+        return None
+    columns = tuple(column for column in DATA_COLUMNS if column != "id") if columns is None else tuple(columns)
+    arrays = grid_store.slice(start_date, end_date, [column for column in columns if column in MEASUREMENT_COLUMNS])
+    if arrays is None:
+        return None
+
+    readings = ~np.isnat(arrays["datetime"])
+    if not readings.all():
+        arrays = {column: values[readings] for column, values in arrays.items()}
+    if compact:
+        return _compact_frame(arrays, requested)
+
+    index = pd.DatetimeIndex(arrays["datetime"])
+    data = {}
+    for column in columns:
+        if column == "datetime":
+            data[column] = arrays[column]
+        elif column in CALENDAR_COLUMNS:
+            data[column] = _calendar_column(index, column).astype(np.int64)
+        else:
+            data[column] = np.array(arrays[column])
+    return pd.DataFrame(data, columns=list(columns))
+
+def iter_data(*args, columns=None, chunk_rows=10000):
+    '''
+    Generator version of get_data that yields the range as a series of DataFrames of up to chunk_rows rows.
+
+    Rows are read with fetchmany() from an unbuffered cursor (see stream_rows) in timestamp order, so only one chunk
+    is held in memory at a time however long the range is. Combine it with the streaming reducers in weather_stats
+    to compute statistics over the full history in constant memory. The in-memory cache is not used.
+
+    Parameters:
+        *args: Any of the range arguments accepted by get_data.
+        columns (list, optional): Columns to return, named as in DATA_COLUMNS. Defaults to all columns.
+        chunk_rows (int, optional): Rows per DataFrame. Defaults to 10000 (about 100 days of readings).
+
+    Yields:
+        pd.DataFrame: The next chunk of rows, with the same columns and dtypes as get_data.
+
+    Raises:
+        ValueError: If the arguments are invalid or a column is not recognised.
+
+    Usage:
+        from weather_stats import summarize
+        stats = summarize(iter_data("all"), ["temperature", "rain"])
+    '''
+    columns = DATA_COLUMNS if columns is None else tuple(columns)
+    start_date, end_date, order_by, limit = _resolve_range(args)
+    for rows in stream_rows(columns, start_date, end_date, limit=limit, order_by=order_by or "timestamp", chunk_rows=chunk_rows):
+        yield _to_frame(rows, columns)
+
+def get_data_version():
+    '''
+    Returns the id and timestamp of the most recently inserted reading.
+
+    The id only changes when new data lands, so it can be used as a cheap cache key or validator for anything
+    derived from the data table. The lookup uses the primary key index and does not scan the table.
+
+    Returns:
+        tuple: (id, timestamp) of the newest row, or None if the table is empty or the database is unavailable.
+    '''
+    rows = read_data_from_db("SELECT id, timestamp FROM data ORDER BY id DESC LIMIT 1")
+    if not rows:
+        return None
+    return rows[0]
+
+# Local UDP address the client's pre-renderer listens on for new-data notifications
+RENDER_SIGNAL_ADDRESS = ("127.0.0.1", getattr(sql_config, 'render_signal_port', 5003))
+
+def notify_new_data(reading_id=None, address=RENDER_SIGNAL_ADDRESS):
+    '''
+    Tells listeners on this machine that new readings have been committed.
+
+    Sends a single fire-and-forget UDP datagram, so it never blocks ingest and does nothing if no listener is running.
+
+    Parameters:
+        reading_id (int, optional): The id of the newest committed reading.
+        address (tuple, optional): (host, port) to notify. Defaults to RENDER_SIGNAL_ADDRESS.
+    '''
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.sendto(json.dumps({"id": reading_id}).encode(), address)
+    except OSError as err:
+        print(f"Could not send new data notification: {err}")
+
+# SQL expressions that truncate a timestamp to the start of each bucket, in the backend's dialect
+AGGREGATE_BUCKETS = backend.AGGREGATE_BUCKETS
+AGGREGATE_FUNCTIONS = {"mean": "AVG", "min": "MIN", "max": "MAX", "sum": "SUM", "count": "COUNT", "std": "STDDEV_SAMP"}
+
+# Rollup tables maintained at ingest time (see weather_rollup.py), coarsest first, with the frequencies each can answer
+USE_ROLLUPS = getattr(sql_config, 'use_rollups', False)
+ROLLUP_COLUMNS = ("temperature", "pressure", "humidity", "rain", "rain_rate", "luminance", "wind_speed")
+ROLLUP_STATS = ("min", "max", "sum", "count", "mean")
+ROLLUP_LEVELS = (
+    ("data_monthly", "month", ("month", "year")),
+    ("data_daily", "day", ("day", "week", "month", "year")),
+    ("data_hourly", "hour", ("hour", "day", "week", "month", "year")),
+)
+ROLLUP_FUNCTIONS = {
+    "min": "MIN({column}_min)",
+    "max": "MAX({column}_max)",
+    "sum": "SUM({column}_sum)",
+    "count": "SUM({column}_count)",
+    "mean": "SUM({column}_sum) / SUM({column}_count)",
+}
+
+def floor_timestamp(timestamp, bucket):
+    '''
+    Truncates a datetime to the start of its "hour", "day" or "month" bucket.
+    '''
+    if bucket == "hour":
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+    elif bucket == "day":
+        return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+    elif bucket == "month":
+        return timestamp.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    else:
+        raise ValueError(f"Invalid bucket: {bucket}")
+
+def update_rollups(cursor, readings):
+    '''
+    Folds new readings into the hourly, daily and monthly rollup tables.
+
+    Each reading is aggregated into its bucket in Python first, then upserted so that existing rollup rows
+    combine min/max and accumulate sum/count, with mean recomputed from the new sum and count. Run this on
+    the same cursor as the raw INSERT, before the commit, so the rollups and the data table stay consistent.
+
+    Parameters:
+        cursor: A database cursor inside the ingest transaction.
+        readings (list of dict): Each dict has a "timestamp" datetime and a value for every column in ROLLUP_COLUMNS.
+    '''
+    columns = [f"{column}_{stat}" for column in ROLLUP_COLUMNS for stat in ROLLUP_STATS]
+
+    for table, bucket, _ in ROLLUP_LEVELS:
+        buckets = {}
+        for reading in readings:
+            period = floor_timestamp(reading["timestamp"], bucket)
+            buckets.setdefault(period, []).append(reading)
+
+        rows = []
+        for period, bucket_readings in buckets.items():
+            row = [period]
+            for column in ROLLUP_COLUMNS:
+                values = [reading[column] for reading in bucket_readings]
+                row += [min(values), max(values), sum(values), len(values), sum(values) / len(values)]
+            rows.append(tuple(row))
+
+        cursor.executemany(backend.upsert_rollups(table, columns, ROLLUP_COLUMNS), rows)
+
+def _rollup_source(freq, columns, start_date, end_date):
+    '''
+    Returns the coarsest rollup table that can answer the query exactly, or None if it must be read from raw data.
+    The range has to start on a bucket boundary and end either just before one or in the future.
+    '''
+    if not USE_ROLLUPS or not all(column in ROLLUP_COLUMNS and stat in ROLLUP_STATS for column, stat in columns):
+        return None
+    # Ranges ending "now" (e.g. last7days) are treated as open ended, allowing for the time taken to get here
+    now = datetime.now() - timedelta(minutes=1)
+    for table, bucket, freqs in ROLLUP_LEVELS:
+        if freq not in freqs:
+            continue
+        if start_date is None:
+            return table
+        start_aligned = floor_timestamp(start_date, bucket) == start_date
+        end_next = end_date + timedelta(seconds=1)
+        end_aligned = end_date >= now or floor_timestamp(end_next, bucket) == end_next
+        if start_aligned and end_aligned:
+            return table
+    return None
+
+def get_aggregates(time_range, freq, aggregations):
+    '''
+    Computes bucketed statistics in MySQL using GROUP BY so only the aggregated rows are transferred.
+
+    When rollups are enabled (use_rollups in sql_config.py) and the range lines up with rollup buckets, the
+    statistics are combined from the coarsest rollup table that can answer the query instead of scanning raw rows.
+    Results are kept in the shared cache if it is enabled (see weather_cache.py).
+
+    Parameters:
+        time_range (str or tuple): Any range string accepted by get_data (except "latest" and "first"),
+            or a (start_date, end_date) tuple of datetimes.
+        freq (str): Bucket size, one of "hour", "day", "week", "month" or "year".
+        aggregations (dict): Maps column names to a list of statistics. Supported statistics are
+            "mean", "min", "max", "sum", "count" and "std".
+
+    Returns:
+        pd.DataFrame: One row per bucket, indexed by the bucket start time ('period') with
+        (column, statistic) MultiIndex columns. This is the same shape as
+        df.groupby(period).agg(aggregations) on the raw data.
+
+    Raises:
+        ValueError: If the range, frequency, column or statistic is not recognised.
+
+    Usage Examples:
+        1. Monthly temperature summary for the current year:
+           monthly = get_aggregates("year", "month", {"temperature": ["mean", "max", "min"], "rain": ["sum"]})
+           monthly[("temperature", "max")]
+        2. Daily rainfall totals between two dates:
+           daily = get_aggregates((datetime(2024, 1, 1), datetime(2024, 1, 31)), "day", {"rain": ["sum"]})
+    '''
+    if freq not in AGGREGATE_BUCKETS:
+        raise ValueError(f"Invalid frequency: {freq}")
+
+    select_raw = []
+    columns = []
+    for column, stats in aggregations.items():
+        if column not in MEASUREMENT_COLUMNS:
+            raise ValueError(f"Invalid column: {column}")
+        for stat in stats:
+            if stat not in AGGREGATE_FUNCTIONS:
+                raise ValueError(f"Unsupported statistic: {stat}")
+            select_raw.append(f"{AGGREGATE_FUNCTIONS[stat]}({column})")
+            columns.append((column, stat))
+
+    if isinstance(time_range, str):
+        if time_range in ["latest", "first"]:
+            raise ValueError("Invalid argument")
+        start_date, end_date = get_time_range(time_range)
+    else:
+        start_date, end_date = (pd.Timestamp(value).to_pydatetime() for value in time_range)
+
+    if shared_cache is not None:
+        key = ("get_aggregates", start_date, end_date, freq, tuple((column, tuple(stats)) for column, stats in aggregations.items()))
+        data = shared_cache.get(key)
+        if data is not None:
+            return data
+        generation = shared_cache.generation()
+
+    table = _rollup_source(freq, columns, start_date, end_date)
+    rows = None
+    if table is not None:
+        # Combine the pre-aggregated rollup rows into the requested buckets
+        select = [ROLLUP_FUNCTIONS[stat].format(column=column) for column, stat in columns]
+        query = f"SELECT {AGGREGATE_BUCKETS[freq].format(ts='period')} AS bucket, {', '.join(select)} FROM {table}"
+        params = None
+        if start_date is not None:
+            query += " WHERE period BETWEEN %s AND %s"
+            params = (start_date, end_date)
+        query += " GROUP BY bucket ORDER BY bucket"
+        rows = read_data_from_db(query, params)
+
+    if rows is None:
+        query = f"SELECT {AGGREGATE_BUCKETS[freq].format(ts='timestamp')} AS period, {', '.join(select_raw)} FROM data"
+        params = None
+        if start_date is not None:
+            query += " WHERE Timestamp BETWEEN %s AND %s"
+            params = (start_date, end_date)
+        query += " GROUP BY period ORDER BY period"
+        rows = read_data_from_db(query, params)
+
+    rows = rows or []
+    data = pd.DataFrame([row[1:] for row in rows], columns=pd.MultiIndex.from_tuples(columns), dtype="float64")
+    data.index = pd.DatetimeIndex([row[0] for row in rows], name="period")
+    for column in columns:
+        if column[1] == "count":
+            data[column] = data[column].astype("int64")
+    if shared_cache is not None and rows:
+        shared_cache.put(key, data, generation=generation)
     return data
 
+# Resolution pyramid used to plot a window of readings, finest first. "raw" is the 15 minute readings themselves
+# (from the grid store when it is enabled), the others are answered from the rollup tables when rollups are enabled
+RESOLUTION_LEVELS = (
+    ("raw", READING_INTERVAL),
+    ("hour", timedelta(hours=1)),
+    ("day", timedelta(days=1)),
+    ("week", timedelta(weeks=1)),
+)
+
+def _floor_bucket(timestamp, freq):
+    if freq == "week":
+        day = floor_timestamp(timestamp, "day")
+        return day - timedelta(days=day.weekday())
+    return floor_timestamp(timestamp, freq)
+
+def get_window(start_date, end_date, column, max_points):
+    '''
+    Fetches one measurement over a window at the finest resolution in RESOLUTION_LEVELS that gives no more than
+    max_points buckets, so the cost of plotting a window is bounded however long it is.
+
+    Aggregated windows are widened to whole buckets, which lets get_aggregates read them from the rollup tables.
+
+    Parameters:
+        start_date (datetime): Start of the window.
+        end_date (datetime): End of the window.
+        column (str): The measurement, one of ROLLUP_COLUMNS.
+        max_points (int): The maximum number of buckets wanted, e.g. the plot width in pixels.
+
+    Returns:
+        tuple: (level, interval, data) where level is the name of the level used, interval its bucket length and
+        data a DataFrame indexed by 'period' with "min", "mean" and "max" columns. At the "raw" level there is one
+        row per reading and the three columns are equal.
+
+    Raises:
+        ValueError: If the column is not recognised.
+
+    Usage:
+        level, interval, data = get_window(datetime(2020, 1, 1), datetime(2024, 12, 31), "temperature", 1400)
+        plt.fill_between(data.index, data["min"], data["max"])
+    '''
+    if column not in ROLLUP_COLUMNS:
+        raise ValueError(f"Invalid column: {column}")
+    span = end_date - start_date
+    level, interval = next(((level, interval) for level, interval in RESOLUTION_LEVELS if span / interval <= max_points), RESOLUTION_LEVELS[-1])
+
+    if level == "raw":
+        data = get_data(start_date, end_date, columns=["datetime", column])
+        values = data[column].astype("float64").to_numpy()
+        data = pd.DataFrame({"min": values, "mean": values, "max": values}, index=pd.DatetimeIndex(data["datetime"], name="period"))
+        return level, interval, data
+
+    start = _floor_bucket(start_date, level)
+    end = _floor_bucket(end_date, level) + interval - timedelta(seconds=1)
+    data = get_aggregates((start, end), level, {column: ["min", "mean", "max"]})
+    return level, interval, data[column]
+
 def convert_wind_direction(deg):
     '''
     Converts wind direction from degrees to cardinal compass points.
@@ -0,0 +1,183 @@
+import argparse
+import sys
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from weather_helper import get_connection, backend, _build_range_query, _resolve_range, DATA_COLUMNS
+
+# Projections the apps ask get_data for, e.g. the client's 7 day plots and the dashboard's date lookups
+COMMON_PROJECTIONS = (
+    ("datetime",),
+    ("datetime", "temperature"),
+    ("datetime", "humidity"),
+    ("datetime", "pressure"),
+    ("datetime", "rain"),
+)
+
+# Range strings whose query plans are reported, see get_time_range
+EXPLAIN_RANGES = ("latest", "first", "today", "last24h", "yesterday", "week", "last7days", "month", "year", "all")
+
+def _create_index(cursor, name, columns, unique=False):
+    '''Creates an index on the data table unless an index with that name already exists. Returns True if it was created.'''
+    if name in backend.index_names(cursor, "data"):
+        return False
+    cursor.execute(f"CREATE {'UNIQUE ' if unique else ''}INDEX {name} ON data ({', '.join(columns)})")
+    return True
+
+def add_timestamp_index(cursor):
+    '''
+    Adds an index on timestamp, which serves every range query and "latest". It is not unique: local time repeats
+    in the hour the clocks go back, and readings are kept unique by their UTC time (see add_unique_utc_timestamp).
+    '''
+    if {"unique_timestamp", "timestamp_index"} & backend.index_names(cursor, "data"):
+        # Added by an earlier version of this migration, or the table was created with it
+        return
+    _create_index(cursor, "timestamp_index", ["timestamp"])
+
+def add_covering_indexes(cursor):
+    '''
+    Adds an index on (timestamp, <measurement>) for each single measurement projection in COMMON_PROJECTIONS,
+    so those range queries are answered from the index without reading the table rows.
+    '''
+    for projection in COMMON_PROJECTIONS:
+        if len(projection) == 2:
+            _create_index(cursor, f"timestamp_{projection[1]}", ["timestamp", projection[1]])
+
+def add_unique_utc_timestamp(cursor, delete_duplicates=False):
+    '''
+    Moves the unique key from the local timestamp to a utc_timestamp column. Local time repeats in the hour the
+    clocks go back, so two readings from that hour would otherwise collide and the second would be dropped.
+
+    The UTC instant of each existing reading is derived from its local time. Where a local time in the repeated
+    hour is held twice, the first reading (in id order) is taken as BST and the second as GMT. Range queries keep
+    a non-unique index on timestamp.
+
+    Raises:
+        RuntimeError: If readings still share a UTC time, i.e. a reading was stored twice, and delete_duplicates
+            is False.
+    '''
+    if "utc_timestamp" not in backend.column_names(cursor, "data"):
+        cursor.execute("ALTER TABLE data ADD COLUMN utc_timestamp DATETIME")
+    cursor.execute("SELECT id, timestamp FROM data WHERE utc_timestamp IS NULL ORDER BY id")
+    rows = cursor.fetchall()
+    if rows:
+        ids, local_times = zip(*rows)
+        local_times = pd.DatetimeIndex(local_times)
+        # The first reading of a repeated local time is the earlier, BST, one. The flag only matters in that hour
+        first = ~local_times.duplicated(keep='first')
+        utc_times = (local_times.tz_localize('Europe/London', ambiguous=first, nonexistent='shift_forward')
+                     .tz_convert('UTC').tz_localize(None))
+        repeated = utc_times.duplicated(keep='first')
+        if repeated.any() and not delete_duplicates:
+            raise RuntimeError(f"{repeated.sum()} readings repeat the time of an earlier reading, "
+                               "run with --delete-duplicates to keep only the first reading of each")
+        if repeated.any():
+            cursor.executemany("DELETE FROM data WHERE id = %s", [(id,) for id in np.asarray(ids)[repeated].tolist()])
+            print(f"Deleted {repeated.sum()} duplicate readings")
+        cursor.executemany("UPDATE data SET utc_timestamp = %s WHERE id = %s",
+                           [(utc_time, id) for utc_time, id, skip in zip(utc_times.to_pydatetime(), ids, repeated) if not skip])
+        print(f"Set the UTC time of {len(rows) - repeated.sum()} readings")
+    _create_index(cursor, "unique_utc_timestamp", ["utc_timestamp"], unique=True)
+    _create_index(cursor, "timestamp_index", ["timestamp"])
+    if "unique_timestamp" in backend.index_names(cursor, "data"):
+        backend.drop_index(cursor, "data", "unique_timestamp")
+
+# Applied in order and recorded in schema_migrations, so each runs once. Append new migrations, never renumber them
+MIGRATIONS = (
+    (1, "index on timestamp", add_timestamp_index),
+    (2, "covering indexes for common projections", add_covering_indexes),
+    (3, "unique index on the UTC time", add_unique_utc_timestamp),
+)
+
+def applied_versions(cursor):
+    cursor.execute("CREATE TABLE IF NOT EXISTS schema_migrations (version INT NOT NULL PRIMARY KEY, name VARCHAR(100) NOT NULL, applied DATETIME NOT NULL)")
+    cursor.execute("SELECT version FROM schema_migrations")
+    return {version for (version,) in cursor.fetchall()}
+
+def migrate(delete_duplicates=False):
+    '''
+    Applies every migration that has not been applied yet, committing after each one.
+
+    Parameters:
+        delete_duplicates (bool, optional): Passed to add_unique_utc_timestamp, which deletes readings stored twice.
+            Defaults to False.
+
+    Returns:
+        list: The (version, name) of each migration applied.
+    '''
+    applied = []
+    with get_connection() as cnx:
+        with cnx.cursor() as cursor:
+            done = applied_versions(cursor)
+            cnx.commit()
+            for version, name, migration in MIGRATIONS:
+                if version in done:
+                    continue
+                if migration is add_unique_utc_timestamp:
+                    migration(cursor, delete_duplicates=delete_duplicates)
+                else:
+                    migration(cursor)
+                cursor.execute("INSERT INTO schema_migrations (version, name, applied) VALUES (%s, %s, %s)", (version, name, datetime.now().replace(microsecond=0)))
+                cnx.commit()
+                applied.append((version, name))
+                print(f"Applied migration {version}: {name}")
+    return applied
+
+def explain_plans():
+    '''
+    Runs EXPLAIN on the query get_data sends for each range in EXPLAIN_RANGES, with all columns and with each of
+    COMMON_PROJECTIONS.
+
+    Returns:
+        dict: (range, columns) to (plan, full_scan).
+    '''
+    plans = {}
+    with get_connection() as cnx:
+        with cnx.cursor() as cursor:
+            for time_range in EXPLAIN_RANGES:
+                start_date, end_date, order_by, limit = _resolve_range((time_range,))
+                for columns in (DATA_COLUMNS,) + COMMON_PROJECTIONS:
+                    query, params = _build_range_query(columns, start_date, end_date, limit=limit, order_by=order_by)
+                    plans[(time_range, columns)] = backend.explain(cursor, query, params)
+    return plans
+
+def print_plans(before, after=None):
+    for key, (plan, full_scan) in before.items():
+        time_range, columns = key
+        label = "all columns" if columns == DATA_COLUMNS else ", ".join(columns)
+        print(f"{time_range:<10} {label:<22} {'FULL SCAN ' if full_scan else ''}{plan}")
+        if after is not None:
+            plan, full_scan = after[key]
+            print(f"{'':<10} {'-> after':<22} {'FULL SCAN ' if full_scan else ''}{plan}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Apply schema and index migrations to the data table and report query plans")
+    parser.add_argument('--migrate', action='store_true', help="apply the migrations that have not been applied yet")
+    parser.add_argument('--delete-duplicates', action='store_true', help="with --migrate, delete readings stored twice (with the same UTC time) before adding the UTC key")
+    parser.add_argument('--explain', action='store_true', help="print the EXPLAIN plan of each get_data range query (before and after with --migrate)")
+    parser.add_argument('--status', action='store_true', help="list the migrations and whether each has been applied")
+    args = parser.parse_args()
+
+    if not (args.migrate or args.explain or args.status):
+        parser.error("nothing to do, use --migrate, --explain and/or --status")
+
+    before = explain_plans() if args.explain else None
+    if args.migrate:
+        try:
+            applied = migrate(delete_duplicates=args.delete_duplicates)
+        except RuntimeError as err:
+            print(err)
+            sys.exit(1)
+        print(f"{len(applied)} migrations applied" if applied else "The schema is up to date")
+    if args.explain:
+        after = explain_plans() if args.migrate else None
+        print_plans(before, after)
+        scans = sum(full_scan for _, full_scan in (after or before).values())
+        print(f"{scans} of {len(before)} queries read every row of the table")
+    if args.status:
+        with get_connection() as cnx:
+            with cnx.cursor() as cursor:
+                done = applied_versions(cursor)
+                cnx.commit()
+        for version, name, _ in MIGRATIONS:
+            print(f"{version}: {name} ({'applied' if version in done else 'pending'})")
@@ -0,0 +1,68 @@
+import argparse
+import time
+from weather_helper import get_connection, AGGREGATE_BUCKETS, ROLLUP_LEVELS, ROLLUP_COLUMNS, ROLLUP_STATS
+
+def create_rollup_tables(cursor):
+    '''
+    Creates the hourly, daily and monthly rollup tables if they do not already exist.
+
+    Each table has one row per bucket keyed on the bucket start time ('period') and holds the
+    min, max, sum, count and mean of every measurement in ROLLUP_COLUMNS for that bucket.
+    '''
+    columns = []
+    for column in ROLLUP_COLUMNS:
+        columns += [
+            f"{column}_min DOUBLE",
+            f"{column}_max DOUBLE",
+            f"{column}_sum DOUBLE NOT NULL DEFAULT 0",
+            f"{column}_count INT NOT NULL DEFAULT 0",
+            f"{column}_mean DOUBLE",
+        ]
+    for table, _, _ in ROLLUP_LEVELS:
+        cursor.execute(f"CREATE TABLE IF NOT EXISTS `{table}` (period DATETIME NOT NULL PRIMARY KEY, {', '.join(columns)})")
+
+def backfill_rollups(cursor):
+    '''
+    Rebuilds every rollup table from the full history in the data table.
+
+    Existing rollup rows are deleted and recomputed with a single INSERT ... SELECT ... GROUP BY per table.
+    The caller is responsible for committing, so the rebuild is atomic with respect to ingest.
+
+    Returns:
+        dict: Number of rollup rows written to each table.
+    '''
+    columns = [f"{column}_{stat}" for column in ROLLUP_COLUMNS for stat in ROLLUP_STATS]
+    select = []
+    for column in ROLLUP_COLUMNS:
+        select += [f"MIN({column})", f"MAX({column})", f"SUM({column})", f"COUNT({column})", f"AVG({column})"]
+
+    written = {}
+    for table, bucket, _ in ROLLUP_LEVELS:
+        cursor.execute(f"DELETE FROM `{table}`")
+        cursor.execute(f"INSERT INTO `{table}` (period, {', '.join(columns)}) "
+                       f"SELECT {AGGREGATE_BUCKETS[bucket].format(ts='timestamp')} AS period, {', '.join(select)} "
+                       f"FROM data GROUP BY period")
+        written[table] = cursor.rowcount
+    return written
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Create and backfill the hourly, daily and monthly rollup tables")
+    parser.add_argument('--create', action='store_true', help="create the rollup tables if they do not exist")
+    parser.add_argument('--backfill', action='store_true', help="rebuild the rollup tables from the existing data")
+    args = parser.parse_args()
+
+    if not (args.create or args.backfill):
+        parser.error("nothing to do, use --create and/or --backfill")
+
+    with get_connection() as cnx:
+        with cnx.cursor() as cursor:
+            if args.create:
+                create_rollup_tables(cursor)
+                print("Rollup tables created")
+            if args.backfill:
+                start = time.perf_counter()
+                written = backfill_rollups(cursor)
+                cnx.commit()
+                for table, count in written.items():
+                    print(f"{table}: {count} rows")
+                print(f"Backfill completed in {time.perf_counter() - start:.1f}s")
@@ -1,175 +1,480 @@
-from flask import Flask, request, jsonify
-import mysql.connector
-from weather_helper import get_data
+from flask import Flask, Response, request, jsonify, stream_with_context
+from weather_helper import get_connection, get_time_range, stream_rows, DATA_COLUMNS, MEASUREMENT_COLUMNS, get_pool_stats, update_rollups, notify_new_data, USE_ROLLUPS, ROLLUP_COLUMNS, grid_store, backend, shared_cache
 from datetime import datetime
 from dateutil import tz
 from sql_config import config, IP_addresses
+from weather_spool import Spool, SpoolDrainer, RejectedBatch, SPOOL_DIR
+import sql_config
 import json
 import requests
+import pandas as pd
+import numpy as np
+import gzip
+import os
+import io
+import csv
+import zlib
+import calendar
+import itertools
+import threading
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None  # Arrow output is unavailable without pyarrow
 
 import logging
 logging.getLogger('matplotlib.font_manager').setLevel(logging.ERROR)
 
 app = Flask(__name__)
+DEBUG = True  # Runs the debug reloader when started with python weather_server.py
+
+CLOUD_FUNCTION_URL = getattr(sql_config, 'cloud_function_url', "https://europe-west2-weathercloud-460719.cloudfunctions.net/store-weather-data")
+# The cloud function accepts single, uncompressed readings. Batches and gzip are opt-in once it supports them
+CLOUD_BATCH_SIZE = getattr(sql_config, 'cloud_batch_size', 1)  # Readings per request when draining a backlog
+CLOUD_COMPRESS = getattr(sql_config, 'cloud_compress', False)  # gzip the request body
+
+# Keep-alive session so consecutive sends reuse the TLS connection
+cloud_session = requests.Session()
 
-CLOUD_FUNCTION_URL = "https://europe-west2-weathercloud-460719.cloudfunctions.net/store-weather-data"
+DATA_CHUNK_ROWS = 2000  # Rows fetched from MySQL and encoded at a time by /get_data
 
-def send_to_cloud(data, original_timestamp):
+def cloud_payload(data, original_timestamp):
     """
-    Send weather data to Google Cloud Function
+    Prepare the data for cloud storage
     Takes the processed data structure and original UTC timestamp
     """
-    try:
-        # Prepare the data for cloud storage
-        cloud_data = {
-            "temperature": data["readings"]["temperature"],
-            "pressure": data["readings"]["pressure"], 
-            "humidity": data["readings"]["humidity"],
-            "rain": data["readings"]["rain"],
-            "rain_rate": data["readings"]["rain_per_second"],
-            "luminance": data["readings"]["luminance"],
-            "wind_speed": data["readings"]["wind_speed"],
-            "wind_direction": data["readings"]["wind_direction"],
-            "timestamp": original_timestamp
-        }
-        
-        # Send POST request to Cloud Function
-        response = requests.post(
-            CLOUD_FUNCTION_URL,
-            json=cloud_data,
-            headers={'Content-Type': 'application/json'},
-            timeout=10  # 10 second timeout
-        )
-        
-        # Check if successful
-        if response.status_code == 200:
-            logging.info("Successfully sent data to cloud")
-            return True
+    return {
+        "temperature": data["readings"]["temperature"],
+        "pressure": data["readings"]["pressure"], 
+        "humidity": data["readings"]["humidity"],
+        "rain": data["readings"]["rain"],
+        "rain_rate": data["readings"]["rain_per_second"],
+        "luminance": data["readings"]["luminance"],
+        "wind_speed": data["readings"]["wind_speed"],
+        "wind_direction": data["readings"]["wind_direction"],
+        "timestamp": original_timestamp
+    }
+
+def send_to_cloud(payloads):
+    """
+    Send a batch of queued readings to the Google Cloud Function
+    A single reading is sent as a JSON object and several as a JSON array. Raises an exception if the
+    send failed so the outbox keeps the batch and retries it later.
+    """
+    body = json.dumps(payloads[0] if len(payloads) == 1 else payloads).encode()
+    headers = {'Content-Type': 'application/json'}
+    # Only a single uncompressed reading is known to be understood, other formats depend on the cloud function
+    original_format = len(payloads) == 1 and not CLOUD_COMPRESS
+    if CLOUD_COMPRESS:
+        body = gzip.compress(body)
+        headers['Content-Encoding'] = 'gzip'
+
+    response = cloud_session.post(CLOUD_FUNCTION_URL, data=body, headers=headers, timeout=10)
+
+    # Check if successful
+    if response.status_code == 200:
+        logging.info(f"Successfully sent {len(payloads)} readings to cloud")
+    elif 400 <= response.status_code < 500 and response.status_code not in (408, 429) and original_format:
+        # Retrying will not help, set the batch aside rather than blocking the queue
+        raise RejectedBatch(f"Cloud function returned status {response.status_code}: {response.text}")
+    elif 400 <= response.status_code < 500 and not original_format:
+        # Probably a cloud function that doesn't accept batches or gzip. Keep the readings and retry rather than drop them
+        logging.error(f"Cloud function rejected a batch of {len(payloads)} readings (compressed: {CLOUD_COMPRESS}), "
+                      "check it accepts cloud_batch_size and cloud_compress in sql_config.py")
+        raise RuntimeError(f"Cloud function returned status {response.status_code}: {response.text}")
+    else:
+        raise RuntimeError(f"Cloud function returned status {response.status_code}: {response.text}")
+
+# Durable queue of readings waiting to be sent to the cloud, drained by a background thread
+cloud_outbox = Spool(os.path.join(SPOOL_DIR, 'cloud_outbox.db'))
+cloud_sender = SpoolDrainer(cloud_outbox, send_to_cloud, 'cloud-sender', batch_size=CLOUD_BATCH_SIZE)
+
+# Column order of the rows passed to _store_readings
+INSERT_COLUMNS = ("timestamp", "temperature", "pressure", "humidity", "rain", "rain_rate", "luminance", "wind_speed", "wind_direction", "day", "week", "month", "year")
+
+# Fields expected in the "readings" object sent by the Enviro board, in INSERT_COLUMNS order
+READING_FIELDS = ("temperature", "pressure", "humidity", "rain", "rain_per_second", "luminance", "wind_speed", "wind_direction")
+
+def _store_readings(cnx, rows, utc_timestamps, before_commit=None):
+    """
+    Inserts processed readings (tuples in INSERT_COLUMNS order, with naive local timestamps) in a single
+    transaction using executemany. Readings whose UTC time (naive datetimes in utc_timestamps, one per row)
+    is already stored are skipped, which makes replaying a backlog idempotent, and the rollups (if enabled)
+    are only updated for the new rows. Duplicates are found by UTC time because the local time repeats in
+    the hour the clocks go back.
+    before_commit, if given, is called with the inserted flags just before the commit, so if it raises the
+    readings are not stored either.
+    Returns a list with True for each row inserted and False for each duplicate.
+    """
+    cursor = cnx.cursor()
+
+    cursor.execute("SELECT utc_timestamp FROM data WHERE utc_timestamp BETWEEN %s AND %s", (min(utc_timestamps), max(utc_timestamps)))
+    seen = {existing for (existing,) in cursor.fetchall()}
+
+    inserted = []
+    new_rows = []
+    for row, utc_timestamp in zip(rows, utc_timestamps):
+        if utc_timestamp in seen:
+            inserted.append(False)
         else:
-            logging.warning(f"Cloud function returned status {response.status_code}: {response.text}")
-            return False
-            
-    except requests.exceptions.Timeout:
-        logging.error("Timeout sending data to cloud - continuing with local storage")
-        return False
-    except requests.exceptions.ConnectionError:
-        logging.error("Connection error sending data to cloud - continuing with local storage")
-        return False
-    except Exception as e:
-        logging.error(f"Unexpected error sending data to cloud: {str(e)}")
-        return False
+            seen.add(utc_timestamp)
+            inserted.append(True)
+            new_rows.append(row + (utc_timestamp,))
+
+    if new_rows:
+        # The unique key on utc_timestamp catches a duplicate that raced in since the SELECT, without the
+        # silent value clamping INSERT IGNORE would apply to out-of-range readings
+        add_data = backend.insert_ignoring_duplicates("data", INSERT_COLUMNS + ("utc_timestamp",), "utc_timestamp")
+        cursor.executemany(add_data, new_rows)
+
+        # Fold the readings into the hourly/daily/monthly rollups in the same transaction
+        if USE_ROLLUPS:
+            update_rollups(cursor, [dict(zip(INSERT_COLUMNS, row)) for row in new_rows])
+
+    if before_commit is not None:
+        before_commit(inserted)
+
+    # Commit the transaction
+    cnx.commit()
+
+    cursor.close()
+    return inserted
+
+def _parse_batch(items):
+    """
+    Validates a list of readings in the format sent by the Enviro board and converts them all at once.
+
+    Timestamps are parsed and converted from UTC to Europe/London as a single vectorised operation, spurious
+    wind speeds are zeroed and the calendar columns are derived from the local time.
+    Returns (rows, errors): rows maps item index to a tuple in INSERT_COLUMNS order, errors maps item index to a message.
+    """
+    records = [item if isinstance(item, dict) else {} for item in items]
+    timestamps = pd.Series([record.get("timestamp") for record in records], dtype="object")
+    readings = pd.DataFrame([record.get("readings") if isinstance(record.get("readings"), dict) else {} for record in records],
+                            columns=READING_FIELDS, index=timestamps.index)
+    # Non-numeric and non-finite values (e.g. "inf") are treated as missing, the database cannot store them
+    readings = readings.apply(pd.to_numeric, errors="coerce")
+    readings = readings.where(np.isfinite(readings))
+
+    utc_time = pd.to_datetime(timestamps, format="%Y-%m-%dT%H:%M:%SZ", utc=True, errors="coerce")
+    valid = utc_time.notna() & readings.notna().all(axis=1)
+
+    # Avoid writing spurious wind_speeds to the database. Assume the maximum possible is 120 mph
+    readings.loc[readings["wind_speed"] * 2.23694 > 120, "wind_speed"] = 0
+
+    local_time = utc_time.dt.tz_convert('Europe/London').dt.tz_localize(None)
+    columns = [list(local_time.dt.to_pydatetime())]
+    columns += [readings[field].tolist() for field in READING_FIELDS]
+    columns += [local_time.dt.strftime(fmt).tolist() for fmt in ("%j", "%W", "%m", "%Y")]
+
+    rows = {}
+    errors = {}
+    for index, row in enumerate(zip(*columns)):
+        if valid.iloc[index]:
+            rows[index] = row
+        elif pd.isna(utc_time.iloc[index]):
+            errors[index] = "Invalid or missing timestamp"
+        else:
+            missing = [field for field in READING_FIELDS if pd.isna(readings[field].iloc[index])]
+            errors[index] = f"Invalid or missing readings: {', '.join(missing)}"
+    return rows, errors
+
+def _spool_entry(row, original_timestamp):
+    """Serialises a parsed reading for the ingest spool, keeping the original UTC timestamp for the cloud"""
+    return {"row": [row[0].isoformat(sep=' ')] + list(row[1:]), "utc": original_timestamp}
+
+def flush_to_mysql(entries):
+    """
+    Moves a batch of spooled readings into the database in one transaction. Raises if the database is
+    unavailable so the spool keeps the batch and retries it, or RejectedBatch naming the readings the database
+    refused so they are set aside rather than blocking the spool. Newly inserted readings are queued for the
+    cloud in the same transaction and the client is told to start pre-rendering.
+    """
+    rows = [(datetime.fromisoformat(entry["row"][0]),) + tuple(entry["row"][1:]) for entry in entries]
+    utc_timestamps = [datetime.strptime(entry["utc"], "%Y-%m-%dT%H:%M:%SZ") for entry in entries]
+
+    def queue_for_cloud(inserted):
+        # Queued before the commit, so a failure here leaves the readings to be stored and queued on the retry
+        new_entries = [entry for entry, was_inserted in zip(entries, inserted) if was_inserted]
+        if new_entries:
+            cloud_outbox.append_many([cloud_payload({"readings": dict(zip(READING_FIELDS, entry["row"][1:len(READING_FIELDS) + 1]))}, entry["utc"])
+                                      for entry in new_entries])
+
+    # Errors while connecting are retried, only errors from the statements themselves reject readings
+    rejection = None
+    with get_connection() as cnx:
+        try:
+            inserted = _store_readings(cnx, rows, utc_timestamps, before_commit=queue_for_cloud)
+        except backend.REJECTED_ERRORS as err:
+            rejection = err
+
+    if rejection is not None:
+        if len(entries) == 1:
+            raise RejectedBatch(f"The database rejected the reading: {rejection}")
+        # Find the offending readings by storing the rest of the batch one at a time
+        rejected = []
+        for index, entry in enumerate(entries):
+            try:
+                flush_to_mysql([entry])
+            except RejectedBatch:
+                rejected.append(index)
+        raise RejectedBatch(f"The database rejected {len(rejected)} readings: {rejection}", indexes=rejected)
+
+    new_rows = [row for row, was_inserted in zip(rows, inserted) if was_inserted]
+    if new_rows and grid_store is not None:
+        try:
+            grid_store.append([utc_timestamp for utc_timestamp, was_inserted in zip(utc_timestamps, inserted) if was_inserted],
+                              {column: [row[INSERT_COLUMNS.index(column)] for row in new_rows] for column in MEASUREMENT_COLUMNS})
+        except (OSError, ValueError) as err:
+            # The readings are safely in the database, the grid store can be rebuilt from there
+            logging.error(f"Could not add readings to the grid store, run weather_grid.py --rebuild: {err}")
+
+    if new_rows:
+        # Cached query results and figures no longer include the latest readings
+        if shared_cache is not None:
+            shared_cache.invalidate()
+
+        # Let the client start pre-rendering the plots for the new readings
+        notify_new_data()
+
+        cloud_sender.wake()
+
+    logging.info(f"Flushed {len(entries)} spooled readings to the database ({len(new_rows)} new)")
+
+# Write-ahead spool for ingest: readings are on disk before they are acknowledged and a background
+# thread moves them into MySQL in bulk, retrying with backoff while MySQL is unavailable
+ingest_spool = Spool(os.path.join(SPOOL_DIR, 'ingest_spool.db'))
+ingest_flusher = SpoolDrainer(ingest_spool, flush_to_mysql, 'mysql-flusher', batch_size=500, idle_seconds=1, max_backoff_seconds=60)
+
+_background_lock = threading.Lock()
+_background_started = False
+
+def start_background_threads():
+    """
+    Starts the ingest flusher and the cloud sender, once per process. Called before every request, so they run
+    however the app is served, and at startup in the process that serves requests.
+    """
+    global _background_started
+    if _background_started:
+        return
+    with _background_lock:
+        if not _background_started:
+            ingest_flusher.start()
+            cloud_sender.start()
+            _background_started = True
+
+@app.before_request
+def ensure_background_threads():
+    start_background_threads()
 
 @app.route('/weather-data', methods=['POST'])
 def weather_data():
     # Extract JSON from the POST request
     data = request.get_json()
-    
-    # Store the original timestamp for cloud storage
-    original_timestamp = data["timestamp"]
-    
-    # Avoid writing spurious wind_speeds to the database. Assume the maximum possible is 120 mph
-    if data["readings"]["wind_speed"] * 2.23694 > 120:
-        data["readings"]["wind_speed"] = 0
-
-    # Convert the timestamp string to datetime format
-    utc_time = datetime.strptime(data["timestamp"], "%Y-%m-%dT%H:%M:%SZ")
-    utc_time = utc_time.replace(tzinfo=tz.tzutc())
-
-    local_time = utc_time.astimezone(tz.gettz('Europe/London'))
-
-    data["timestamp"] = local_time
-    data["day"] = local_time.strftime("%j")
-    data["week"] = local_time.strftime("%W")
-    data["month"] = local_time.strftime("%m")
-    data["year"] = local_time.strftime("%Y")
-
-    # *** NEW: Send to cloud storage ***
-    # We do this early so if it fails, we still continue with local storage
-    cloud_success = send_to_cloud(data, original_timestamp)
-    
-    # *** EXISTING: Continue with local MySQL storage ***
+
+    # A JSON array is a backlog of readings
+    if isinstance(data, list):
+        return weather_data_batch()
+
     try:
-        # Connect to the database
-        cnx = mysql.connector.connect(**config)
-
-        # Create a cursor object
-        cursor = cnx.cursor()
-
-        # Create the INSERT INTO sql query
-        add_data = ("INSERT INTO data "
-                    "(timestamp, temperature, pressure, humidity, rain, rain_rate, luminance, wind_speed, wind_direction, day, week, month, year) "
-                    "VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)")
-
-        # Use the readings from the data
-        data_tuple = (data["timestamp"], 
-                    data["readings"]["temperature"], 
-                    data["readings"]["pressure"], 
-                    data["readings"]["humidity"], 
-                    data["readings"]["rain"], 
-                    data["readings"]["rain_per_second"], 
-                    data["readings"]["luminance"], 
-                    data["readings"]["wind_speed"], 
-                    data["readings"]["wind_direction"],
-                    data["day"],
-                    data["week"],
-                    data["month"],
-                    data["year"]
-                    )
-
-        # Insert the data
-        cursor.execute(add_data, data_tuple)
-
-        # Commit the transaction
-        cnx.commit()
-
-        # Close the cursor and connection
-        cursor.close()
-        cnx.close()
-
-        #print('***', time, ": SUCCESS - DATA WRITTEN TO DATABASE*** ")
-        
-        # Create response message indicating both local and cloud status
-        response_msg = "Data received and stored locally"
-        if cloud_success:
-            response_msg += " and sent to cloud"
-        else:
-            response_msg += " (cloud storage failed)"
+        # Validate the reading and convert the timestamp to local time
+        rows, errors = _parse_batch([data])
+        if errors:
+            return jsonify({"message": "Invalid reading", "error": errors[0]}), 400
+
+        # Append to the spool and acknowledge, the flusher stores it in MySQL and queues it for the cloud
+        ingest_spool.append(_spool_entry(rows[0], data["timestamp"]))
+        ingest_flusher.wake()
 
         # Respond with a 200 status code (OK)
-        return jsonify({"message": response_msg}), 200
-        
-    except mysql.connector.Error as err:
-        logging.error(f"MySQL error: {err}")
-        # Even if local storage fails, we might have cloud backup
-        if cloud_success:
-            return jsonify({"message": "Local storage failed but data sent to cloud", "error": str(err)}), 200
-        else:
-            return jsonify({"message": "Both local and cloud storage failed", "error": str(err)}), 500
-    
+        return jsonify({"message": "Data received and spooled for storage"}), 200
+
     except Exception as e:
         logging.error(f"Unexpected error in weather_data: {e}")
         return jsonify({"message": "Server error", "error": str(e)}), 500
 
+@app.route('/weather-data/batch', methods=['POST'])
+def weather_data_batch():
+    """
+    Accepts a JSON array of readings, e.g. the backlog the Enviro board replays after a Wi-Fi outage.
+    Valid readings are spooled together and written to MySQL in one transaction by the flusher, which
+    skips any that are already stored. The response reports the status of each item.
+    """
+    items = request.get_json()
+    if not isinstance(items, list):
+        return jsonify({"message": "Expected a JSON array of readings"}), 400
+
+    rows, errors = _parse_batch(items)
+    results = [{"index": index, "timestamp": item.get("timestamp") if isinstance(item, dict) else None} for index, item in enumerate(items)]
+    for index, error in errors.items():
+        results[index].update(status="invalid", error=error)
+    for index in rows:
+        results[index]["status"] = "accepted"
+
+    if rows:
+        ingest_spool.append_many([_spool_entry(row, items[index]["timestamp"]) for index, row in rows.items()])
+        ingest_flusher.wake()
+
+    return jsonify({"message": f"Batch processed: {len(rows)} accepted, {len(errors)} invalid",
+                    "accepted": len(rows),
+                    "invalid": len(errors),
+                    "results": results}), 200
+
+def _json_value(value):
+    # Timestamps are sent as epoch milliseconds, as DataFrame.to_json() did
+    if isinstance(value, datetime):
+        return calendar.timegm(value.timetuple()) * 1000
+    return value
+
+def _text_value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+def _encode_json(columns, chunks):
+    yield "["
+    separator = ""
+    for rows in chunks:
+        for row in rows:
+            yield separator + json.dumps({column: _json_value(value) for column, value in zip(columns, row)})
+            separator = ","
+    yield "]"
+
+def _encode_ndjson(columns, chunks):
+    for rows in chunks:
+        yield "".join(json.dumps({column: _text_value(value) for column, value in zip(columns, row)}) + "\n" for row in rows)
+
+def _encode_csv(columns, chunks):
+    # A single gzip stream, flushed after each chunk so the client receives data as it is read
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for rows in chunks:
+        writer.writerows([[_text_value(value) for value in row] for row in rows])
+        yield compressor.compress(buffer.getvalue().encode()) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        buffer.seek(0)
+        buffer.truncate()
+    yield compressor.compress(buffer.getvalue().encode()) + compressor.flush()
+
+def _arrow_type(column):
+    if column == "datetime":
+        return pa.timestamp("s")
+    if column in MEASUREMENT_COLUMNS:
+        return pa.float64()
+    return pa.int64()
+
+def _encode_arrow(columns, chunks):
+    # Arrow IPC stream with one record batch per chunk
+    schema = pa.schema([(column, _arrow_type(column)) for column in columns])
+    sink = io.BytesIO()
+    with pa.ipc.new_stream(sink, schema) as writer:
+        for rows in chunks:
+            values = list(zip(*rows))
+            writer.write_batch(pa.record_batch([pa.array(values[i], type=schema.field(i).type) for i in range(len(columns))], schema=schema))
+            yield sink.getvalue()
+            sink.seek(0)
+            sink.truncate()
+    yield sink.getvalue()
+
+DATA_FORMATS = {
+    "json": (_encode_json, "application/json", None),
+    "ndjson": (_encode_ndjson, "application/x-ndjson", None),
+    "csv": (_encode_csv, "text/csv", "gzip"),
+    "arrow": (_encode_arrow, "application/vnd.apache.arrow.stream", None),
+}
+
 @app.route('/get_data', methods=['GET'])
 def get_data_api():
+    """
+    Streams readings from the data table.
+
+    Query parameters:
+        time_range: A get_data range string, e.g. "today" or "year=2024". Defaults to "latest", or to "all" when paginating.
+            Ignored if start or end is given.
+        start, end: ISO 8601 timestamps bounding the range (inclusive). Either may be omitted.
+        columns: Comma-separated columns to return, e.g. "datetime,temperature". Defaults to all columns.
+        after_id, limit: Keyset pagination. Rows are returned in id order and "id" is always included,
+            so the next page is requested with after_id set to the last id received. Not allowed with
+            time_range "latest" or "first".
+        format: "json" (default, a JSON array as before), "ndjson", "csv" (gzip compressed) or "arrow" (Arrow IPC stream).
+
+    Rows are read from MySQL in chunks on an unbuffered cursor and encoded as they arrive, so memory use
+    does not depend on the size of the range.
+    """
     try:
         # Extract parameters from request
-        time_range = request.args.get('time_range', default='latest', type=str)
-        
-        # Call your existing get_data function
-        data = get_data(time_range)
-        
-        # Convert DataFrame to JSON
-        result = data.to_json(orient='records')
-        parsed = json.loads(result)
-        
-        return jsonify(parsed)
+        output = request.args.get('format', default='json', type=str)
+        if output not in DATA_FORMATS:
+            raise ValueError(f"Unknown format, use one of: {', '.join(DATA_FORMATS)}")
+        if output == "arrow" and pa is None:
+            raise ValueError("Arrow output needs pyarrow to be installed on the server")
+
+        columns = [column.strip() for column in request.args.get('columns', default=','.join(DATA_COLUMNS)).split(',') if column.strip()]
+        unknown = [column for column in columns if column not in DATA_COLUMNS]
+        if unknown or not columns:
+            raise ValueError(f"Unknown column(s): {', '.join(unknown)}")
+
+        after_id = request.args.get('after_id', type=int)
+        limit = request.args.get('limit', type=int)
+        paginated = after_id is not None or limit is not None
+        if paginated and "id" not in columns:
+            columns.insert(0, "id")
+
+        order_by = "id" if paginated else None
+        start, end = request.args.get('start'), request.args.get('end')
+        if start or end:
+            start = datetime.fromisoformat(start) if start else None
+            end = datetime.fromisoformat(end) if end else None
+        else:
+            # Pages run through the whole table unless a range is given
+            time_range = request.args.get('time_range', default='all' if paginated else 'latest', type=str)
+            if paginated and time_range in ("latest", "first"):
+                raise ValueError(f'after_id and limit cannot be used with time_range "{time_range}"')
+            start, end = get_time_range(time_range)
+            if time_range == "latest":
+                order_by, limit = "timestamp DESC", 1
+            elif time_range == "first":
+                order_by, limit = "id", 1
+
+        # Read the first chunk now so database errors are reported with a status code rather than a truncated body
+        chunks = stream_rows(columns, start, end, after_id, limit, order_by, chunk_rows=DATA_CHUNK_ROWS)
+        first = next(chunks, None)
+        chunks = itertools.chain([first] if first else [], chunks)
+
+        encode, mimetype, encoding = DATA_FORMATS[output]
+        response = Response(stream_with_context(encode(columns, chunks)), mimetype=mimetype)
+        if encoding:
+            response.headers["Content-Encoding"] = encoding
+        return response
 
     except ValueError as e:
         return jsonify({"error": str(e)}), 400
     except Exception as e:
+        logging.error(f"Unexpected error in get_data_api: {e}")
         return jsonify({"error": "Internal Server Error"}), 500
 
+@app.route('/pool-stats', methods=['GET'])
+def pool_stats():
+    """Reports connection pool usage so handshake cost can be tracked"""
+    return jsonify(get_pool_stats())
+
+@app.route('/cache-stats', methods=['GET'])
+def cache_stats():
+    """Reports the size of the shared cache and this process's hit rate"""
+    if shared_cache is None:
+        return jsonify({"error": "The shared cache is disabled, set use_shared_cache = True in sql_config.py"}), 404
+    return jsonify(shared_cache.stats())
+
+@app.route('/admin/spool', methods=['GET'])
+def spool_stats():
+    """Reports the ingest spool depth and progress replaying it into MySQL"""
+    return jsonify(ingest_flusher.stats())
+
+@app.route('/cloud-outbox', methods=['GET'])
+def cloud_outbox_stats():
+    """Reports the cloud queue depth, delivery counts and send latency"""
+    return jsonify(cloud_sender.stats())
+
 # Optional: Add a route to test cloud connectivity
 @app.route('/test-cloud', methods=['GET'])
 def test_cloud():
@@ -184,4 +489,8 @@ def test_cloud():
         return jsonify({"status": "Cloud function not reachable", "error": str(e)})
 
 if __name__ == '__main__':
-    app.run(debug=True, host="0.0.0.0", port=5000)
\ No newline at end of file
+    # The debug reloader serves requests from a child process (WERKZEUG_RUN_MAIN set). Its parent only watches
+    # for code changes, so it leaves the threads to the child. Without the reloader this process serves requests
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true' or not DEBUG:
+        start_background_threads()
+    app.run(debug=DEBUG, host="0.0.0.0", port=5000)
\ No newline at end of file
@@ -0,0 +1,205 @@
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+
+import sql_config
+
+# Directory holding the on-disk spools. Can be overridden with spool_dir in sql_config.py
+SPOOL_DIR = getattr(sql_config, 'spool_dir', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'spool'))
+
+class RejectedBatch(Exception):
+    """
+    Raised by a drain handler when the destination permanently refused a batch (e.g. HTTP 400).
+    The batch is set aside in the spool instead of being retried forever. If `indexes` is given only
+    those payloads (positions within the batch) are set aside and the rest are treated as delivered.
+    """
+    def __init__(self, message, indexes=None):
+        super().__init__(message)
+        self.indexes = indexes
+
+class Spool:
+    '''
+    Durable FIFO queue of JSON payloads stored in a SQLite database in WAL mode.
+
+    Payloads are committed to disk before append() returns, so they survive a crash or restart of the
+    process. Consumers peek() at the oldest payloads and ack() them once they have been delivered.
+    Payloads a consumer rejects are kept in the database, marked as dead, for manual inspection.
+
+    Parameters:
+        path (str): Path of the SQLite file. The directory is created if it does not exist.
+
+    Usage:
+        spool = Spool("spool/example.db")
+        spool.append({"temperature": 12.3})
+        for entry_id, payload in spool.peek(10):
+            ...
+        spool.ack([entry_id])
+    '''
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=FULL")  # An acknowledged append must survive a power cut
+        self._db.execute("CREATE TABLE IF NOT EXISTS spool ("
+                         "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                         "payload TEXT NOT NULL, "
+                         "created REAL NOT NULL, "
+                         "dead INTEGER NOT NULL DEFAULT 0, "
+                         "error TEXT)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS spool_dead ON spool (dead, id)")
+        self._db.commit()
+
+    def append(self, payload):
+        '''Adds a single payload to the end of the queue.'''
+        self.append_many([payload])
+
+    def append_many(self, payloads):
+        '''Adds several payloads to the end of the queue in one transaction.'''
+        now = time.time()
+        rows = [(json.dumps(payload), now) for payload in payloads]
+        with self._lock, self._db:
+            self._db.executemany("INSERT INTO spool (payload, created) VALUES (?, ?)", rows)
+
+    def peek(self, limit):
+        '''Returns up to `limit` of the oldest live payloads as (id, payload) tuples, without removing them.'''
+        with self._lock:
+            rows = self._db.execute("SELECT id, payload FROM spool WHERE dead = 0 ORDER BY id LIMIT ?", (limit,)).fetchall()
+        return [(entry_id, json.loads(payload)) for entry_id, payload in rows]
+
+    def ack(self, ids):
+        '''Removes delivered payloads from the queue.'''
+        with self._lock, self._db:
+            self._db.executemany("DELETE FROM spool WHERE id = ?", [(entry_id,) for entry_id in ids])
+
+    def bury(self, ids, error):
+        '''Marks payloads that can never be delivered as dead so they no longer block the queue.'''
+        with self._lock, self._db:
+            self._db.executemany("UPDATE spool SET dead = 1, error = ? WHERE id = ?", [(str(error), entry_id) for entry_id in ids])
+
+    def depth(self):
+        '''Returns the number of payloads waiting to be delivered.'''
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM spool WHERE dead = 0").fetchone()[0]
+
+    def stats(self):
+        '''Returns the queue depth, the number of dead payloads and the age in seconds of the oldest waiting payload.'''
+        with self._lock:
+            depth, oldest = self._db.execute("SELECT COUNT(*), MIN(created) FROM spool WHERE dead = 0").fetchone()
+            dead = self._db.execute("SELECT COUNT(*) FROM spool WHERE dead = 1").fetchone()[0]
+        return {
+            "depth": depth,
+            "dead": dead,
+            "oldest_age_seconds": round(time.time() - oldest, 1) if oldest is not None else 0.0,
+        }
+
+class SpoolDrainer(threading.Thread):
+    '''
+    Background thread that delivers the contents of a Spool in batches.
+
+    The handler is called with a list of payloads and must raise an exception if delivery failed. Failed batches
+    stay at the head of the queue and are retried with exponential backoff (with jitter) up to
+    max_backoff_seconds. If the handler raises RejectedBatch the batch (or the payloads it names) is buried instead of retried.
+
+    Parameters:
+        spool (Spool): The queue to drain.
+        handler (callable): Delivers a list of payloads.
+        name (str): Thread name, also used in log messages.
+        batch_size (int): Maximum number of payloads per handler call.
+        idle_seconds (float): How long to sleep when the queue is empty, unless woken with wake().
+        backoff_seconds (float): Delay after the first failure, doubled after each consecutive failure.
+        max_backoff_seconds (float): Upper limit on the retry delay.
+    '''
+    def __init__(self, spool, handler, name, batch_size=50, idle_seconds=5, backoff_seconds=1, max_backoff_seconds=300):
+        super().__init__(name=name, daemon=True)
+        self.spool = spool
+        self.handler = handler
+        self.batch_size = batch_size
+        self.idle_seconds = idle_seconds
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._metrics = {
+            "delivered": 0,
+            "batches": 0,
+            "failures": 0,
+            "consecutive_failures": 0,
+            "rejected": 0,
+            "last_error": None,
+            "last_batch_ms": None,
+            "total_batch_ms": 0.0,
+            "retry_in_seconds": 0.0,
+        }
+        # Payloads delivered since the queue was last empty, used to report progress through a backlog
+        self._run_delivered = 0
+
+    def wake(self):
+        '''Starts draining immediately rather than at the end of the idle period.'''
+        self._wake.set()
+
+    def stop(self):
+        self._stopping.set()
+        self._wake.set()
+
+    def _sleep(self, seconds):
+        self._wake.wait(seconds)
+        self._wake.clear()
+
+    def run(self):
+        while not self._stopping.is_set():
+            batch = self.spool.peek(self.batch_size)
+            if not batch:
+                self._run_delivered = 0
+                self._sleep(self.idle_seconds)
+                continue
+
+            ids = [entry_id for entry_id, _ in batch]
+            start = time.perf_counter()
+            try:
+                self.handler([payload for _, payload in batch])
+            except RejectedBatch as e:
+                rejected = ids if e.indexes is None else [ids[index] for index in e.indexes]
+                logging.error(f"{self.name}: {len(rejected)} of {len(ids)} payloads rejected, setting them aside: {e}")
+                self.spool.bury(rejected, e)
+                delivered = [entry_id for entry_id in ids if entry_id not in rejected]
+                self.spool.ack(delivered)
+                self._metrics.update(rejected=self._metrics["rejected"] + len(rejected), last_error=str(e),
+                                     delivered=self._metrics["delivered"] + len(delivered), consecutive_failures=0)
+                self._run_delivered += len(delivered)
+                continue
+            except Exception as e:
+                failures = self._metrics["consecutive_failures"] + 1
+                delay = min(self.max_backoff_seconds, self.backoff_seconds * 2 ** (failures - 1))
+                delay *= random.uniform(0.8, 1.2)
+                self._metrics.update(failures=self._metrics["failures"] + 1, consecutive_failures=failures,
+                                     last_error=str(e), retry_in_seconds=round(delay, 1))
+                logging.warning(f"{self.name}: delivery failed ({failures} in a row), retrying in {delay:.0f}s: {e}")
+                # Only a stop request interrupts the backoff, new payloads should not cause an early retry
+                self._stopping.wait(delay)
+                continue
+
+            elapsed_ms = 1000 * (time.perf_counter() - start)
+            self.spool.ack(ids)
+            self._run_delivered += len(ids)
+            self._metrics.update(delivered=self._metrics["delivered"] + len(ids), batches=self._metrics["batches"] + 1,
+                                 consecutive_failures=0, retry_in_seconds=0.0, last_batch_ms=round(elapsed_ms, 1),
+                                 total_batch_ms=self._metrics["total_batch_ms"] + elapsed_ms)
+
+    def stats(self):
+        '''
+        Returns the spool statistics together with delivery counts and latency. backlog_delivered and
+        backlog_total show progress through the current backlog (everything queued since the spool was last empty).
+        '''
+        metrics = dict(self._metrics)
+        total_batch_ms = metrics.pop("total_batch_ms")
+        metrics["avg_batch_ms"] = round(total_batch_ms / metrics["batches"], 1) if metrics["batches"] else None
+        stats = dict(self.spool.stats(), **metrics)
+        stats["backlog_delivered"] = self._run_delivered
+        stats["backlog_total"] = self._run_delivered + stats["depth"]
+        return stats
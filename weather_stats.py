@@ -0,0 +1,289 @@
+import math
+import numpy as np
+import pandas as pd
+
+class RunningStats:
+    '''
+    Streaming count, sum, min, max and mean of a measurement. NaN values are ignored.
+
+    Usage:
+        stats = RunningStats()
+        for chunk in iter_data("all", columns=["temperature"]):
+            stats.update(chunk["temperature"])
+        print(stats.mean, stats.max)
+    '''
+    def __init__(self):
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        if values.size == 0:
+            return
+        self.count += values.size
+        self.sum += float(values.sum())
+        chunk_min, chunk_max = float(values.min()), float(values.max())
+        self.min = chunk_min if self.min is None else min(self.min, chunk_min)
+        self.max = chunk_max if self.max is None else max(self.max, chunk_max)
+
+    @property
+    def mean(self):
+        return self.sum / self.count if self.count else None
+
+    def result(self):
+        '''Returns the statistics as a dict (count, sum, min, max and mean).'''
+        return {"count": self.count, "sum": self.sum, "min": self.min, "max": self.max, "mean": self.mean}
+
+class QuantileSketch:
+    '''
+    Streaming quantile estimate with bounded memory.
+
+    Values are kept exactly until more than max_exact have been seen, so quantiles of short ranges match pandas.
+    After that they are counted in logarithmically spaced buckets (a DDSketch), which bounds the relative error
+    of any quantile to relative_accuracy. A few thousand buckets cover the whole range of every measurement.
+
+    Parameters:
+        relative_accuracy (float, optional): Maximum relative error of a quantile once bucketed. Defaults to 0.5%.
+        max_exact (int, optional): Number of values kept exactly before switching to buckets. Defaults to 100000.
+
+    Usage:
+        sketch = QuantileSketch()
+        for chunk in iter_data("all", columns=["temperature"]):
+            sketch.update(chunk["temperature"])
+        median = sketch.quantile(0.5)
+    '''
+    MIN_MAGNITUDE = 1e-9  # Values closer to zero than this are counted as zero
+
+    def __init__(self, relative_accuracy=0.005, max_exact=100000):
+        self.relative_accuracy = relative_accuracy
+        self.max_exact = max_exact
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self._exact = []
+        self._positive = {}
+        self._negative = {}
+        self._zero = 0
+        self.count = 0
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        if values.size == 0:
+            return
+        self.count += values.size
+        if self._exact is not None:
+            self._exact.append(values)
+            if self.count <= self.max_exact:
+                return
+            values = np.concatenate(self._exact)
+            self._exact = None
+        self._add_to_buckets(values)
+
+    def _add_to_buckets(self, values):
+        magnitudes = np.abs(values)
+        self._zero += int((magnitudes < self.MIN_MAGNITUDE).sum())
+        for store, selected in ((self._positive, values >= self.MIN_MAGNITUDE), (self._negative, values <= -self.MIN_MAGNITUDE)):
+            if selected.any():
+                keys, counts = np.unique(np.ceil(np.log(magnitudes[selected]) / self._log_gamma).astype(np.int64), return_counts=True)
+                for key, count in zip(keys.tolist(), counts.tolist()):
+                    store[key] = store.get(key, 0) + count
+
+    def _bucket_value(self, key):
+        # Midpoint (in relative terms) of the bucket (gamma^(key-1), gamma^key]
+        return 2 * self.gamma ** key / (self.gamma + 1)
+
+    def quantile(self, q):
+        '''Returns the estimated q-quantile (0 <= q <= 1), or None if no values have been seen.'''
+        if self.count == 0:
+            return None
+        if self._exact is not None:
+            return float(np.quantile(np.concatenate(self._exact), q))
+
+        rank = q * (self.count - 1)
+        seen = 0
+        for key in sorted(self._negative, reverse=True):
+            seen += self._negative[key]
+            if seen > rank:
+                return -self._bucket_value(key)
+        seen += self._zero
+        if seen > rank:
+            return 0.0
+        for key in sorted(self._positive):
+            seen += self._positive[key]
+            if seen > rank:
+                return self._bucket_value(key)
+        return self._bucket_value(max(self._positive))
+
+class PeriodTotals:
+    '''
+    Streaming per-period sums, e.g. daily rainfall. Memory grows with the number of periods, not readings.
+
+    Parameters:
+        freq (str, optional): pandas frequency of the periods. Defaults to "D" (calendar days).
+
+    Usage:
+        daily_rain = PeriodTotals("D")
+        for chunk in iter_data("all", columns=["datetime", "rain"]):
+            daily_rain.update(chunk["datetime"], chunk["rain"])
+        wettest_day = daily_rain.result().idxmax()
+    '''
+    def __init__(self, freq="D"):
+        self.freq = freq
+        self._totals = pd.Series(dtype="float64")
+
+    def update(self, timestamps, values):
+        chunk = pd.Series(np.asarray(values, dtype=np.float64), index=pd.DatetimeIndex(timestamps))
+        self._totals = self._totals.add(chunk.resample(self.freq).sum(), fill_value=0)
+
+    def result(self):
+        '''Returns the total for each period as a Series indexed by the start of the period.'''
+        return self._totals.sort_index()
+
+def summarize(chunks, columns, quantiles=(0.5,)):
+    '''
+    Computes count, sum, min, max, mean and quantiles of each column over a stream of DataFrames in one pass.
+
+    Parameters:
+        chunks (iterable): DataFrames, e.g. from weather_helper.iter_data or a single get_data result in a list.
+        columns (list): Measurement columns to summarise.
+        quantiles (tuple, optional): Quantiles to estimate with a QuantileSketch. Defaults to (0.5,), the median.
+
+    Returns:
+        pd.DataFrame: One row per column with count, sum, min, max, mean and a pNN column per quantile.
+
+    Usage:
+        summarize(iter_data("all"), ["temperature", "wind_speed"], quantiles=(0.5, 0.9))
+    '''
+    running = {column: RunningStats() for column in columns}
+    sketches = {column: QuantileSketch() for column in columns} if quantiles else {}
+    for chunk in chunks:
+        for column in columns:
+            values = chunk[column].to_numpy(dtype=np.float64)
+            running[column].update(values)
+            if column in sketches:
+                sketches[column].update(values)
+
+    summary = {}
+    for column in columns:
+        summary[column] = running[column].result()
+        for q in quantiles:
+            summary[column][f"p{round(q * 100):g}"] = sketches[column].quantile(q)
+    return pd.DataFrame.from_dict(summary, orient="index")
+
+MAX_KDE_CELLS = 1 << 16  # Bounds the binning grid of histogram_kde, and so its FFT, however narrow the bandwidth
+
+def histogram_kde(values, bins=30, points=1000):
+    '''
+    Computes a histogram and a Gaussian kernel density estimate of values from a single binning pass.
+
+    The values are assigned to equal cells that subdivide the histogram's bins, so the histogram is the cell
+    counts summed a bin at a time. For the density each value is shared between the edges of its cell, and those
+    weights are convolved with the kernel using an FFT, which costs the same however many values there are.
+    The bandwidth is Scott's rule, as in scipy.stats.gaussian_kde: the standard deviation times n ** (-1/5).
+    The cells are at most a quarter of the bandwidth wide, so the curve is within a fraction of a percent of
+    gaussian_kde's.
+
+    Parameters:
+        values (array-like): The values. NaN values are ignored.
+        bins (int, optional): Number of histogram bins. Defaults to 30.
+        points (int, optional): Number of evenly spaced points from the minimum to the maximum to evaluate the
+            density at. Defaults to 1000.
+
+    Returns:
+        tuple: (edges, histogram, x, density) where edges are the bins + 1 bin edges, histogram is normalised as
+        a probability density and density is the KDE at each x. density is None if there are fewer than two
+        distinct values, as no bandwidth can be estimated.
+
+    Usage:
+        edges, histogram, x, density = histogram_kde(df["temperature"])
+        plt.stairs(histogram, edges)
+        plt.plot(x, density)
+    '''
+    values = np.asarray(values, dtype=np.float64)
+    values = values[~np.isnan(values)]
+    n = values.size
+    std = float(values.std(ddof=1)) if n > 1 else 0.0
+    bandwidth = std * n ** (-1 / 5) if n else 0.0
+
+    cells_per_bin = -(-points // bins)
+    if bandwidth > 0:
+        bin_width = (values.max() - values.min()) / bins
+        cells_per_bin = max(cells_per_bin, int(np.ceil(4 * bin_width / bandwidth)))
+    cells_per_bin = min(cells_per_bin, max(1, MAX_KDE_CELLS // bins))
+    cells = bins * cells_per_bin
+    cell_edges = np.histogram_bin_edges(values, bins=cells)
+    cell_width = cell_edges[1] - cell_edges[0]
+
+    # The cell each value falls in gives both its histogram bin and, with its position within the cell, how it
+    # is shared between the cell's two edges (linear binning), which keeps the density accurate to the edges
+    position = (values - cell_edges[0]) / cell_width
+    cell = np.minimum(position.astype(np.int64), cells - 1)
+    fraction = position - cell
+    edges = cell_edges[::cells_per_bin]
+    histogram = np.bincount(cell // cells_per_bin, minlength=bins) / (max(n, 1) * cell_width * cells_per_bin)
+    x = np.linspace(cell_edges[0], cell_edges[-1], points)
+    if bandwidth == 0:
+        return edges, histogram, x, None
+    weights = np.bincount(cell, 1 - fraction, minlength=cells + 1) + np.bincount(cell + 1, fraction, minlength=cells + 1)
+
+    # The kernel reaches 5 bandwidths each way. Padding both to the length of the full convolution stops the
+    # FFT's circular convolution wrapping one end of the data onto the other
+    reach = min(cells, int(np.ceil(5 * bandwidth / cell_width)))
+    offsets = np.arange(-reach, reach + 1) * cell_width
+    kernel = np.exp(-0.5 * (offsets / bandwidth) ** 2) / (bandwidth * math.sqrt(2 * math.pi))
+    size = len(weights) + len(kernel) - 1
+    convolved = np.fft.irfft(np.fft.rfft(weights, size) * np.fft.rfft(kernel, size), size)[reach:reach + len(weights)]
+    density = np.interp(x, cell_edges, np.maximum(convolved, 0) / n)
+    return edges, histogram, x, density
+
+def grouped_box_stats(groups, values, whisker=1.5):
+    '''
+    Computes the statistics of a box plot for each group in one vectorised pass, without a Python loop over groups.
+
+    The values are sorted within groups once. The quartiles are interpolated linearly, as in numpy.quantile and
+    pandas. Each whisker ends at the most extreme value within whisker times the interquartile range of its
+    quartile, as in plotly's box plots.
+
+    Parameters:
+        groups (array-like): The group of each value, e.g. the period a reading falls in.
+        values (array-like): The values. NaN values are ignored.
+        whisker (float, optional): Reach of the whiskers as a multiple of the interquartile range. Defaults to 1.5.
+
+    Returns:
+        pd.DataFrame: One row per group, indexed by group in sorted order, with count, q1, median, q3,
+        lowerfence and upperfence columns. Groups without any values are left out.
+
+    Usage:
+        boxes = grouped_box_stats(df["period"], df["temperature"])
+        go.Box(x=boxes.index, q1=boxes["q1"], median=boxes["median"], q3=boxes["q3"],
+               lowerfence=boxes["lowerfence"], upperfence=boxes["upperfence"])
+    '''
+    values = np.asarray(values, dtype=np.float64)
+    valid = ~np.isnan(values)
+    keys, codes = np.unique(np.asarray(groups)[valid], return_inverse=True)
+    values = values[valid]
+    if values.size == 0:
+        return pd.DataFrame(columns=["count", "q1", "median", "q3", "lowerfence", "upperfence"], dtype="float64")
+
+    order = np.lexsort((values, codes))
+    values, codes = values[order], codes[order]
+    counts = np.bincount(codes, minlength=len(keys))
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+
+    def quantile(q):
+        position = q * (counts - 1)
+        below = np.floor(position).astype(np.int64)
+        above = np.minimum(below + 1, counts - 1)
+        fraction = position - below
+        return values[starts + below] * (1 - fraction) + values[starts + above] * fraction
+
+    q1, median, q3 = quantile(0.25), quantile(0.5), quantile(0.75)
+    reach = whisker * (q3 - q1)
+    # Each value is compared with its own group's bounds, then the extremes inside the bounds are reduced per group
+    lowerfence = np.minimum.reduceat(np.where(values >= (q1 - reach)[codes], values, np.inf), starts)
+    upperfence = np.maximum.reduceat(np.where(values <= (q3 + reach)[codes], values, -np.inf), starts)
+    return pd.DataFrame({"count": counts, "q1": q1, "median": median, "q3": q3, "lowerfence": lowerfence, "upperfence": upperfence},
+                        index=pd.Index(keys))